@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Cache des interprétations de commandes IA
+La réponse JSON du modèle est indexée par la commande normalisée et le
+schéma de colonnes du fichier: une commande déjà vue sur des colonnes
+identiques est rejouée sans appel réseau. Deux niveaux: LRU en mémoire
+puis un fichier JSON par entrée sur disque (conservé entre redémarrages),
+chacun avec une durée de vie.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_command(command):
+    """Minuscules, sans accents ni ponctuation finale, espaces réduits"""
+    text = unicodedata.normalize('NFKD', command.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip(' .!?')
+
+
+def cache_key(command, columns):
+    """Clé de cache: commande normalisée + noms de colonnes (ordre indifférent)"""
+    payload = json.dumps([normalize_command(command), sorted(str(column) for column in columns)],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class InterpretationCache:
+    """Réponses parsées du modèle: LRU mémoire devant un stockage disque, avec TTL"""
+
+    def __init__(self, folder, max_entries=256, ttl_seconds=None):
+        self.folder = folder
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0, 'stores': 0}
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, f'{key}.json')
+
+    def _expired(self, created):
+        return bool(self.ttl_seconds) and time.time() - created > self.ttl_seconds
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, command, columns):
+        """Réponse mise en cache pour cette commande et ce schéma, ou None"""
+        key = cache_key(command, columns)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry['created']):
+                del self._entries[key]
+                self.counters['expired'] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return entry['response']
+
+            path = self._path(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as handle:
+                    entry = json.load(handle)
+            except (OSError, ValueError):
+                entry = None
+            if entry is not None and self._expired(entry['created']):
+                self.counters['expired'] += 1
+                self._remove(path)
+                entry = None
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+
+            self._remember(key, entry)
+            self.counters['disk_hits'] += 1
+            return entry['response']
+
+    def put(self, command, columns, response):
+        """Enregistre une réponse parsée dans les deux niveaux"""
+        key = cache_key(command, columns)
+        entry = {'created': time.time(), 'command': normalize_command(command), 'response': response}
+        with self._lock:
+            self._remember(key, entry)
+            self.counters['stores'] += 1
+        path = self._path(key)
+        try:
+            with open(f'{path}.part', 'w', encoding='utf-8') as handle:
+                json.dump(entry, handle, ensure_ascii=False)
+            os.replace(f'{path}.part', path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Interprétation non enregistrée sur disque: {str(e)}")
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def cleanup(self):
+        """Supprime du disque les entrées expirées"""
+        if not self.ttl_seconds:
+            return
+        now = time.time()
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if name.endswith('.json') and now - os.path.getmtime(path) > self.ttl_seconds:
+                self._remove(path)
+
+    def stats(self):
+        with self._lock:
+            hits = self.counters['memory_hits'] + self.counters['disk_hits']
+            lookups = hits + self.counters['misses']
+            return dict(self.counters,
+                        entries_in_memory=len(self._entries),
+                        hit_rate=round(hits / lookups, 3) if lookups else None)
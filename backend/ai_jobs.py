@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Appels au modèle sous contrôle et commandes IA asynchrones
+- LLMGateway: délai maximal par appel, nombre d'appels simultanés borné et
+  disjoncteur qui coupe le modèle (repli sur le système de règles) quand
+  les erreurs s'accumulent, avec les latences observées
+- JobQueue: les commandes soumises en mode asynchrone s'exécutent dans un
+  pool de threads; le client reçoit un identifiant de tâche et interroge
+  (ou écoute) son état au lieu de bloquer un worker pendant l'appel.
+La tâche s'exécute dans le worker qui l'a reçue. Avec plusieurs workers
+(sessions partagées), son état est aussi écrit dans un fichier <id>.json,
+comme pour les tâches de fichiers: le suivi peut arriver sur n'importe quel
+worker.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from response_encoding import encode_default
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailableError(Exception):
+    """Le modèle n'est pas appelé: disjoncteur ouvert ou trop d'appels en cours"""
+
+
+class CircuitBreaker:
+    """Disjoncteur: fermé -> ouvert après N échecs consécutifs -> semi-ouvert après un délai"""
+
+    def __init__(self, failure_threshold=5, reset_seconds=30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Un appel peut-il partir? En semi-ouvert, un seul appel d'essai passe"""
+        with self._lock:
+            if self.state == 'open' and time.time() - self.opened_at >= self.reset_seconds:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.trips += 1
+                    logger.warning(f"Disjoncteur IA ouvert après {self.failures} échecs")
+                self.state = 'open'
+                self.opened_at = time.time()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'trips': self.trips,
+                'retry_in_seconds': (max(0.0, round(self.reset_seconds - (time.time() - self.opened_at), 1))
+                                     if self.state == 'open' else None)
+            }
+
+
+class LLMGateway:
+    """Point de passage unique des appels au modèle"""
+
+    def __init__(self, timeout_seconds, max_concurrency, breaker, latency_window=200):
+        self.timeout_seconds = timeout_seconds
+        self.breaker = breaker
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self.counters = {'calls': 0, 'errors': 0, 'rejected': 0, 'in_flight': 0}
+
+    def call(self, request):
+        """Exécute request(timeout) sous délai, concurrence bornée et disjoncteur
+
+        Lève LLMUnavailableError sans appeler le modèle si le disjoncteur est
+        ouvert ou si aucune place ne se libère dans le délai.
+        """
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise LLMUnavailableError("Modèle désactivé temporairement (disjoncteur ouvert)")
+        if not self._slots.acquire(timeout=self.timeout_seconds):
+            self._count('rejected')
+            raise LLMUnavailableError("Trop d'appels au modèle en cours")
+
+        started = time.perf_counter()
+        self._count('in_flight')
+        try:
+            result = request(self.timeout_seconds)
+        except Exception:
+            self._count('errors')
+            self.breaker.record_failure()
+            raise
+        else:
+            self.breaker.record_success()
+            return result
+        finally:
+            with self._lock:
+                self.counters['calls'] += 1
+                self.counters['in_flight'] -= 1
+                self._latencies.append(time.perf_counter() - started)
+            self._slots.release()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self.counters)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 1)
+
+        return dict(counters,
+                    timeout_seconds=self.timeout_seconds,
+                    max_concurrency=self.max_concurrency,
+                    latency_ms={'p50': percentile(0.5), 'p95': percentile(0.95), 'samples': len(latencies)},
+                    breaker=self.breaker.stats())
+
+
+FINISHED_STATUSES = ('done', 'error')
+
+
+class JobQueue:
+    """Commandes IA exécutées en arrière-plan, consultables par identifiant
+
+    folder: dossier où l'état des tâches est publié pour les autres workers
+    (None: tâches connues de ce seul processus).
+    """
+
+    def __init__(self, max_workers=4, ttl_seconds=600, folder=None):
+        self.ttl_seconds = ttl_seconds
+        self.folder = folder
+        if folder is not None:
+            os.makedirs(folder, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ai-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, job_id):
+        return os.path.join(self.folder, f'{job_id}.json')
+
+    def _publish(self, job):
+        """Écrit l'état de la tâche (sans l'événement interne) pour les autres workers"""
+        if self.folder is None:
+            return
+        state = {key: value for key, value in job.items() if key != 'done'}
+        temp_path = f'{self._path(job["id"])}.{uuid.uuid4().hex[:8]}.part'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as handle:
+                json.dump(state, handle, default=encode_default, ensure_ascii=False)
+            os.replace(temp_path, self._path(job['id']))
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Publication de la tâche IA {job['id'][:8]} impossible: {str(e)}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _load(self, job_id):
+        """État publié par un autre worker, ou None"""
+        if self.folder is None or not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id), encoding='utf-8') as handle:
+                return json.load(handle)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def submit(self, owner, function, *args):
+        """Programme function(*args); renvoie l'identifiant de la tâche"""
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'owner': owner,
+            'status': 'pending',
+            'result': None,
+            'error': None,
+            'created': time.time(),
+            'started': None,
+            'finished': None,
+            'done': threading.Event()
+        }
+        with self._lock:
+            self._expire()
+            self._jobs[job_id] = job
+        self._publish(job)
+        self._executor.submit(self._run, job, function, args)
+        return job_id
+
+    def _run(self, job, function, args):
+        job['status'] = 'running'
+        job['started'] = time.time()
+        self._publish(job)
+        try:
+            job['result'] = function(*args)
+            job['status'] = 'done'
+        except Exception as e:
+            logger.error(f"Tâche IA {job['id'][:8]} en échec: {str(e)}")
+            job['error'] = str(e)
+            job['status'] = 'error'
+        finally:
+            job['finished'] = time.time()
+            self._publish(job)
+            job['done'].set()
+
+    def get(self, job_id, owner=None):
+        """Tâche connue (et appartenant à owner si précisé), ou None
+
+        Une tâche d'un autre worker est lue dans son fichier d'état.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            job = self._load(job_id)
+        if job is None or (owner is not None and job['owner'] != owner):
+            return None
+        return job
+
+    def wait(self, job, timeout):
+        """Attend la fin de la tâche au plus timeout secondes; True si terminée
+
+        Une tâche d'un autre worker est suivie par relecture de son fichier
+        d'état, mis à jour dans job.
+        """
+        if 'done' in job:
+            return job['done'].wait(timeout)
+        deadline = time.monotonic() + timeout
+        while job['status'] not in FINISHED_STATUSES:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.2)
+            job.update(self._load(job['id']) or {})
+        return True
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job['finished'] is not None and now - job['finished'] > self.ttl_seconds:
+                del self._jobs[job_id]
+        if self.folder is None:
+            return
+        # Fichiers d'état des tâches terminées, quel que soit le worker qui les a écrits
+        for path in glob.glob(os.path.join(self.folder, '*.json')):
+            try:
+                if now - os.path.getmtime(path) <= self.ttl_seconds:
+                    continue
+                state = self._load(os.path.basename(path)[:-len('.json')])
+                if state is None or state['status'] in FINISHED_STATUSES:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def describe(self, job):
+        """État publiable d'une tâche (sans l'événement interne)"""
+        description = {
+            'jobId': job['id'],
+            'status': job['status'],
+            'queuedSeconds': round((job['started'] or time.time()) - job['created'], 3)
+        }
+        if job['finished'] is not None and job['started'] is not None:
+            description['runSeconds'] = round(job['finished'] - job['started'], 3)
+        if job['status'] == 'error':
+            description['error'] = job['error']
+        return description
+
+    def stats(self):
+        """Tâches exécutées par ce worker, par statut"""
+        with self._lock:
+            statuses = [job['status'] for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in ('pending', 'running', 'done', 'error')}
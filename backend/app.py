@@ -5,18 +5,47 @@ Auteur: Assistant IA
 Description: API backend pour traiter les fichiers Excel et interpréter les commandes naturelles
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
 import io
 import os
 import json
+import re
 import openai  # Activé avec votre clé API
 from datetime import datetime
 import tempfile
 import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import ExitStack, contextmanager
 from config import Config
+import grid_query
+import column_types
+import command_plan
+from chunked_dataset import ChunkedDataset, convert_csv
+from dataset_join import JoinError, ReferenceDataset, lookup_columns, reference_name, resolve_reference
+from column_stats import ColumnStats
+from column_index import HashIndex, IndexCache, SortedIndex
+from session_store import SessionStore, WorkbookSession
+from shared_sessions import SharedSessions
+from upload_cache import UploadCache
+import readers
+from ai_cache import InterpretationCache, normalize_command
+from intent_router import IntentRouter
+from ai_jobs import CircuitBreaker, JobQueue, LLMGateway
+from exporters import ExportCache, EXPORT_FORMATS
+from file_jobs import FileJobQueue, export_dataset, parse_upload
+from formula_engine import FORMULA_FILE_TYPES, FormulaBook, FormulaError, read_formulas
+from response_encoding import FastJSONProvider, NDJSON_MIMETYPE, compress_response, ndjson_lines
+import arrow_transport
+
+# Copy-on-Write (toujours actif depuis pandas 3): une copie superficielle est un instantané figé
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
@@ -26,6 +55,7 @@ app = Flask(__name__)
 
 # Configuration de l'application
 app.config.from_object(Config)
+app.json = FastJSONProvider(app, engine=Config.JSON_ENGINE)  # jsonify rapide (orjson si disponible)
 CORS(app, origins=Config.CORS_ORIGINS)  # Configuration CORS sécurisée
 
 # Configuration OpenAI
@@ -39,62 +69,945 @@ EXPORT_FOLDER = Config.EXPORT_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(EXPORT_FOLDER, exist_ok=True)
 
-# Variable globale pour stocker le DataFrame actuel
-current_dataframe = None
-current_filename = None
+# Uploads dédupliqués par empreinte, avec leur version parsée en colonnes
+upload_cache = UploadCache(UPLOAD_FOLDER)
+
+# Interprétations IA mises en cache par commande normalisée et colonnes (mémoire + disque)
+interpretation_cache = InterpretationCache(
+    Config.AI_CACHE_FOLDER,
+    max_entries=Config.AI_CACHE_SIZE,
+    ttl_seconds=Config.AI_CACHE_TTL_SECONDS
+)
+interpretation_cache.cleanup()
+intent_router = IntentRouter(threshold=Config.INTENT_CONFIDENCE_THRESHOLD)
+llm_gateway = LLMGateway(
+    timeout_seconds=Config.AI_TIMEOUT_SECONDS,
+    max_concurrency=Config.AI_MAX_CONCURRENCY,
+    breaker=CircuitBreaker(Config.AI_BREAKER_FAILURES, Config.AI_BREAKER_RESET_SECONDS)
+)
+ai_jobs = JobQueue(max_workers=Config.AI_JOB_WORKERS, ttl_seconds=Config.AI_JOB_TTL_SECONDS,
+                   folder=Config.AI_JOB_FOLDER if Config.SHARED_SESSIONS else None)
+# Exports mis en cache par version du dataset, anciens fichiers purgés
+export_cache = ExportCache(EXPORT_FOLDER, max_age_seconds=Config.EXPORT_MAX_AGE_SECONDS)
+# Parsing et exports volumineux exécutés hors requête, dans un pool de processus
+file_jobs = FileJobQueue(Config.FILE_JOB_FOLDER, max_workers=Config.FILE_JOB_WORKERS,
+                         ttl_seconds=Config.FILE_JOB_TTL_SECONDS)
+
+def _row_ranges(row_ids):
+    """Compresse des identifiants de lignes en intervalles [[début, fin], ...]"""
+    ids = np.unique(np.asarray(row_ids, dtype=np.int64))
+    if len(ids) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(ids) != 1)
+    starts = np.concatenate(([ids[0]], ids[breaks + 1]))
+    ends = np.concatenate((ids[breaks], [ids[-1]]))
+    return [[int(start), int(end)] for start, end in zip(starts, ends)]
 
 class ExcelProcessor:
     """Classe pour traiter les opérations sur les fichiers Excel"""
     
+    # Nombre d'ordres de tri gardés en cache (par version du dataset)
+    SORT_CACHE_SIZE = 8
+    # Nombre de versions gardées dans le journal des modifications
+    CHANGE_LOG_SIZE = 64
+    # Au-delà de cette fraction des cellules, un patch coûte plus qu'un instantané complet
+    DELTA_MAX_FRACTION = 0.5
+    # Nombre d'opérations annulables conservées
+    UNDO_LIMIT = 50
+    
     def __init__(self):
+        self._undo = deque(maxlen=self.UNDO_LIMIT)
+        self._redo = []
+        # Change quand des opérations de l'historique sont modifiées en place (voir _permute, shared_sessions)
+        self.history_token = uuid.uuid4().hex
+        self.base_version = 0
+        self.df = None
+        self.dataset_id = uuid.uuid4().hex
+        self.version = 0
+        self.change_log = deque(maxlen=self.CHANGE_LOG_SIZE)
+        self._sort_cache = OrderedDict()
+        self._sort_cache_lock = threading.Lock()  # Lectures simultanées (workers à threads)
+        self._memory_usage = (None, 0)
+        self.load_report = None
+        self.source = None
+        self._source_version = None
+        self.sheets = []
+        self.active_sheet = None
+        self._parked_sheets = {}
+        self._references = OrderedDict()
+    
+    def mark_modified(self, change=None):
+        """Signale une modification du DataFrame (invalide les caches dépendants)
+
+        change décrit la modification pour les réponses delta:
+        {'type': 'columns_set' | 'columns_removed', 'columns': [...]} ou
+        {'type': 'cells', 'rows': [[début, fin], ...]}. None signifie que le
+        DataFrame a été remplacé (un instantané complet sera nécessaire).
+        """
+        self.version += 1
+        if change is not None:
+            self.base_version += 1
+        self._sort_cache.clear()
+        self.change_log.append((self.version, change))
+    
+    @property
+    def df(self):
+        """DataFrame visible: la base, restreinte par les filtres actifs
+
+        La vue filtrée est calculée à la demande et gardée pour la version en
+        cours; la base n'est jamais remplacée par un filtre.
+        """
+        if self._base is None or not self._filters:
+            return self._base
+        version, view = self._view
+        if version != self.version:
+            mask = np.logical_and.reduce([entry['mask'] for entry in self._filters])
+            view = self._base.view(mask) if self.out_of_core else self._base.iloc[np.flatnonzero(mask)]
+            self._view = (self.version, view)
+        return view
+    
+    @df.setter
+    def df(self, frame):
+        """Remplace le DataFrame de base (filtres et historique réinitialisés)"""
+        self._base = frame
+        self.base_version += 1
+        self._filters = []
+        self._view = (None, None)
+        self._stats = ColumnStats()
+        self._view_stats = (None, None)
+        self._indexes = IndexCache()
+        self._formulas = None
+        self._undo.clear()
+        self._redo = []
+    
+    @property
+    def out_of_core(self):
+        """Vrai si la base est un gros CSV lu par blocs depuis le disque (lecture seule)"""
+        return isinstance(self._base, ChunkedDataset)
+    
+    def _require_in_memory(self, action):
+        if self.out_of_core:
+            raise ValueError(f"{action} n'est pas disponible en mode hors mémoire "
+                             f"(fichier de {self._base.row_count} lignes en lecture seule)")
+    
+    def add_filter(self, predicate, description):
+        """Empile un filtre non destructif: predicate(base) -> masque booléen des lignes"""
+        mask = np.asarray(predicate(self._base), dtype=bool)
+        entry = {'description': description, 'mask': mask}
+        self._filters.append(entry)
+        self._record({'type': 'add_filter', 'filter': entry})
+        self.mark_modified()
+        return len(self.df)
+    
+    def clear_filters(self):
+        """Retire tous les filtres: la base redevient visible immédiatement"""
+        if not self._filters:
+            return False
+        self._record({'type': 'clear_filters', 'filters': self._filters})
+        self._filters = []
+        self.mark_modified()
+        return True
+    
+    def list_filters(self):
+        return [{'description': entry['description'], 'rows': int(entry['mask'].sum())}
+                for entry in self._filters]
+    
+    def condition_mask(self, column, condition):
+        """Masque (sur la base) d'une condition AG-Grid, par l'index de la colonne si possible"""
+        if self.out_of_core:
+            return self._base.condition_mask(column, condition)
+        mask = self._indexes.condition_mask(self._base, column, condition)
+        if mask is None:
+            mask = grid_query.condition_mask(self._base[column], condition)
+        return mask
+    
+    def top_positions(self, column, n, largest=True):
+        """Positions (dans la vue) des n plus grandes ou plus petites valeurs d'une colonne numérique"""
+        self._require_in_memory("La recherche des plus grandes valeurs")
+        index = self._indexes.get(self._base, column, force=True)
+        if not isinstance(index, SortedIndex):
+            raise ValueError(f"La colonne {column} n'est pas numérique")
+        positions = index.positions[::-1] if largest else index.positions
+        return self._view_positions(positions)[:n]
+    
+    def lookup_positions(self, column, value):
+        """Positions (dans la vue) des lignes dont la colonne texte vaut value (sans casse)"""
+        self._require_in_memory("La recherche par valeur")
+        index = self._indexes.get(self._base, column, force=True)
+        if not isinstance(index, HashIndex):
+            raise ValueError(f"La colonne {column} n'est pas textuelle")
+        return self._view_positions(np.sort(index.lookup(value)))
+    
+    def index_stats(self):
+        """Index de colonnes construits et requêtes servies par un index"""
+        return self._indexes.stats()
+    
+    def _view_positions(self, positions):
+        """Positions de la base -> positions dans la vue filtrée (lignes masquées retirées)"""
+        if not self._filters:
+            return positions
+        visible = np.logical_and.reduce([entry['mask'] for entry in self._filters])
+        ranks = np.cumsum(visible) - 1
+        return ranks[positions[visible[positions]]]
+    
+    def _grid_filter_mask(self, filter_model):
+        """filterModel AG-Grid sur la vue; sans filtre actif, les index de colonnes sont utilisés"""
+        if self.out_of_core and filter_model:
+            return self._chunked_filter_mask(filter_model)
+        if not filter_model or self._filters:
+            return grid_query.filter_mask(self.df, filter_model)
+        mask = np.ones(len(self._base), dtype=bool)
+        for column, condition in filter_model.items():
+            if column not in self._base.columns:
+                raise KeyError(f"Colonne de filtre inconnue: {column}")
+            mask &= self.condition_mask(column, condition)
+        return mask
+    
+    def _chunked_filter_mask(self, filter_model):
+        """filterModel en mode hors mémoire: un parcours par colonne filtrée, gardé pour la version
+
+        Le défilement de la grille redemande la même fenêtre filtrée bloc après
+        bloc: le masque est mis en cache avec les ordres de tri.
+        """
+        cache_key = (self.version, 'filter', json.dumps(filter_model, sort_keys=True))
+        mask = self._cached(cache_key)
+        if mask is not None:
+            return mask
+        mask = np.ones(self._base.row_count, dtype=bool)
+        for column, condition in filter_model.items():
+            if column not in self._base.columns:
+                raise KeyError(f"Colonne de filtre inconnue: {column}")
+            mask &= self.condition_mask(column, condition)
+        if self._filters:
+            mask = mask[self.df.positions]
+        return self._cache(cache_key, mask)
+    
+    def column_summary(self, column):
+        """Statistiques d'une colonne des données visibles (count, nulls, sum, min, max, mean, distinct)
+
+        Sans filtre, ce sont les statistiques de la base, tenues à jour à chaque
+        modification; avec des filtres, elles sont calculées sur la vue et
+        gardées pour la version en cours.
+        """
+        if self.out_of_core:
+            return self.df.summarize(column)
+        if not self._filters:
+            return self._stats.get(self._base, column)
+        version, stats = self._view_stats
+        if version != self.version:
+            stats = ColumnStats()
+            self._view_stats = (self.version, stats)
+        return stats.get(self.df, column)
+    
+    def profile(self, columns=None):
+        """Statistiques de plusieurs colonnes (toutes par défaut)"""
+        if self.out_of_core:
+            # Toutes les colonnes demandées en un seul parcours du fichier
+            return {str(column): summary for column, summary in self.df.summaries(columns or list(self.df.columns)).items()}
+        return {str(column): self.column_summary(column) for column in (columns or self.df.columns)}
+    
+    def sort_rows(self, sort_model):
+        """Réordonne la base selon un sortModel AG-Grid (annulable, filtres conservés)"""
+        self._require_in_memory("Le tri")
+        order = grid_query.sort_order(self._base, sort_model)
+        self._reorder(order)
+        self._record({'type': 'reorder', 'order': order})
+        self.mark_modified()
+    
+    def _reorder(self, order):
+        """Applique une permutation de positions à la base et aux masques des filtres"""
+        self._base = self._base.iloc[order]
+        self.base_version += 1
+        self._indexes.invalidate()
+        # Chaque filtre (actif ou conservé dans l'historique) est permuté une seule fois
+        entries = {}
+        for entry in self._filters:
+            entries[id(entry)] = entry
+        for operation in list(self._undo) + self._redo:
+            if operation['type'] == 'add_filter':
+                entries[id(operation['filter'])] = operation['filter']
+            elif operation['type'] == 'clear_filters':
+                entries.update((id(entry), entry) for entry in operation['filters'])
+        for entry in entries.values():
+            entry['mask'] = entry['mask'][order]
+        self.history_token = uuid.uuid4().hex
+    
+    def set_column(self, name, compute):
+        """Ajoute ou remplace une colonne calculée par compute(base) sur toutes les lignes"""
+        self._require_in_memory("L'ajout de colonne")
+        operation, columns = self._replace_column(name, compute(self._base))
+        self._record(operation)
+        self.mark_modified({'type': 'columns_set', 'columns': columns})
+    
+    def set_columns(self, values):
+        """Ajoute ou remplace plusieurs colonnes ({nom: valeurs}) en une seule opération annulable"""
+        self._require_in_memory("L'ajout de colonne")
+        operations, columns = [], []
+        for name, series in values.items():
+            operation, touched = self._replace_column(name, series)
+            operations.append(operation)
+            columns += touched
+        self._record({'type': 'set_columns', 'operations': operations})
+        self.mark_modified({'type': 'columns_set', 'columns': list(dict.fromkeys(columns))})
+    
+    def _replace_column(self, name, values):
+        """Écrit une colonne; renvoie (opération d'annulation, colonnes modifiées)"""
+        previous = self._base[name] if name in self._base.columns else None
+        self._base[name] = values
+        self._stats.invalidate([name])
+        self._indexes.invalidate([name])
+        operation = {'type': 'set_column', 'column': name, 'before': previous, 'after': self._base[name]}
+        columns = [name]
+        if self._formulas is not None:
+            # Les formules de la colonne sont remplacées par les valeurs calculées; leurs dépendants recalculés
+            removed = self._formulas.take(name)
+            cells = self._recalculate({name: self._base.index.to_numpy()})
+            if removed or cells:
+                operation.update(formulas={'removed': removed, 'added': []}, cells=cells)
+                columns += [entry['column'] for entry in cells if entry['column'] != name]
+        return operation, list(dict.fromkeys(columns))
+    
+    def undo(self):
+        """Annule la dernière opération; renvoie son type, ou None si rien à annuler"""
+        if not self._undo:
+            return None
+        operation = self._undo.pop()
+        change = self._apply_operation(operation, reverse=True)
+        self._redo.append(operation)
+        self.mark_modified(change)
+        return operation['type']
+    
+    def redo(self):
+        """Rétablit la dernière opération annulée; renvoie son type, ou None"""
+        if not self._redo:
+            return None
+        operation = self._redo.pop()
+        change = self._apply_operation(operation)
+        self._undo.append(operation)
+        self.mark_modified(change)
+        return operation['type']
+    
+    def history(self):
+        return {'undo': len(self._undo), 'redo': len(self._redo)}
+    
+    def history_operations(self):
+        """Opérations annulables puis rétablissables, dans l'ordre des piles"""
+        return list(self._undo) + self._redo
+    
+    def _record(self, operation):
+        """Journalise une opération annulable (une nouvelle opération vide le redo)"""
+        self._undo.append(operation)
+        self._redo = []
+    
+    def _apply_operation(self, operation, reverse=False):
+        """Rejoue (ou annule) une opération du journal; renvoie le change pour mark_modified"""
+        kind = operation['type']
+        if kind == 'add_filter':
+            if reverse:
+                self._filters.pop()
+            else:
+                self._filters.append(operation['filter'])
+            return None
+        if kind == 'clear_filters':
+            self._filters = list(operation['filters']) if reverse else []
+            return None
+        if kind == 'reorder':
+            self._reorder(np.argsort(operation['order']) if reverse else operation['order'])
+            return None
+        if kind == 'set_columns':
+            parts = operation['operations'][::-1] if reverse else operation['operations']
+            changes = [self._apply_operation(part, reverse) for part in parts]
+            kinds = {change['type'] for change in changes}
+            if len(kinds) != 1:
+                return None  # Colonnes retirées et remplacées: instantané complet
+            columns = [column for change in changes for column in change['columns']]
+            return {'type': kinds.pop(), 'columns': list(dict.fromkeys(columns))}
+        if 'formulas' in operation:
+            formulas = operation['formulas']
+            if reverse:
+                self._formulas.swap(formulas['added'], formulas['removed'])
+            else:
+                self._formulas.swap(formulas['removed'], formulas['added'])
+        if kind == 'set_column':
+            column = operation['column']
+            cells = operation.get('cells', [])
+            if reverse:
+                self._apply_cells(cells, reverse)
+            target = operation['before'] if reverse else operation['after']
+            if target is None:
+                del self._base[column]
+                self._stats.invalidate([column])
+                self._indexes.invalidate([column])
+                return {'type': 'columns_removed', 'columns': [column]}
+            self._base[column] = target
+            self._stats.invalidate([column])
+            self._indexes.invalidate([column])
+            if not reverse:
+                self._apply_cells(cells, reverse)
+            columns = [column] + [entry['column'] for entry in cells]
+            return {'type': 'columns_set', 'columns': list(dict.fromkeys(columns))}
+        return {'type': 'cells', 'rows': _row_ranges(self._apply_cells(operation['columns'], reverse))}
+    
+    def _apply_cells(self, entries, reverse=False):
+        """Rejoue (ou annule, dans l'ordre inverse) des écritures de cellules; renvoie les lignes touchées
+
+        Chaque entrée garde les valeurs avant/après et le type de la colonne.
+        """
+        rows = []
+        for entry in (reversed(entries) if reverse else entries):
+            column = entry['column']
+            self._indexes.invalidate([column])
+            if entry['before_dtype'] == entry['after_dtype']:
+                old, new = (entry['after'], entry['before']) if reverse else (entry['before'], entry['after'])
+                self._stats.update_cells(column, old, new)
+            else:
+                self._stats.invalidate([column])
+            self._writable_column(column)
+            if reverse:
+                self._base.loc[entry['rows'], column] = entry['before']
+                if self._base[column].dtype != entry['before_dtype']:
+                    self._base[column] = self._base[column].astype(entry['before_dtype'])
+            else:
+                if self._base[column].dtype != entry['after_dtype']:
+                    self._base[column] = self._base[column].astype(entry['after_dtype'])
+                self._base.loc[entry['rows'], column] = entry['after']
+            rows.extend(entry['rows'])
+        return rows
+    
+    def memory_usage(self):
+        """Mémoire occupée par les DataFrames en octets (calculée une fois par version)"""
+        if self.df is None:
+            return 0
+        version, usage = self._memory_usage
+        if version == self.version:
+            return usage
+        references = sum(reference.memory_usage() for reference in self._references.values())
+        if self.out_of_core:
+            # Seuls les masques des filtres et les lignes de la vue sont en mémoire
+            usage = sum(entry['mask'].nbytes for entry in self._filters) + self.df.memory_usage() + references
+            self._memory_usage = (self.version, usage)
+        else:
+            frames = [self._base] + [entry[0] for entry in self._parked_sheets.values()]
+            if self._filters:
+                frames.append(self.df)
+            usage = int(sum(df.memory_usage(deep=True).sum() for df in frames)) + references
+            self._memory_usage = (self.version, usage)
+        return usage
+    
+    def snapshot(self):
+        """État à écrire sur disque quand la session est déchargée"""
+        return {
+            'df': self._base,
+            'filters': self._filters,
+            'undo': list(self._undo),
+            'redo': self._redo,
+            'parked_sheets': self._parked_sheets,
+            'formulas': self._formulas,
+            'references': self._references
+        }
+    
+    def release(self):
+        """Libère les DataFrames et les caches (session déchargée sur disque)"""
         self.df = None
+        self._parked_sheets = {}
+        self._references = OrderedDict()
+        self._sort_cache.clear()
+    
+    def restore(self, state):
+        """Réinstalle un état déchargé (voir snapshot), sans changer de version"""
+        self.df = state['df']
+        self._filters = state['filters']
+        self._undo.extend(state['undo'])
+        self._redo = state['redo']
+        self._parked_sheets = state['parked_sheets']
+        self._formulas = state.get('formulas')
+        self._references = state.get('references', OrderedDict())
     
-    def load_file(self, file_path, file_type='xlsx'):
-        """Charge un fichier Excel ou CSV dans un DataFrame pandas"""
+    # Attributs publiés avec l'instantané pour les autres workers (voir shared_sessions)
+    SHARED_FIELDS = ('version', 'base_version', 'change_log', 'dataset_id', 'load_report',
+                     'source', '_source_version', 'sheets', 'active_sheet', 'history_token')
+    
+    def shared_state(self):
+        """État complet à publier pour les autres workers: instantané, version et source"""
+        state = self.snapshot()
+        state.update({field: getattr(self, field) for field in self.SHARED_FIELDS})
+        return state
+    
+    def restore_shared(self, state):
+        """Remplace l'état local par celui publié par un autre worker"""
+        self._undo.clear()
+        self.restore(state)
+        for field in self.SHARED_FIELDS:
+            setattr(self, field, state[field])
+        self._sort_cache.clear()
+        self._memory_usage = (None, 0)
+    
+    def _writable_column(self, column):
+        """Copie privée d'une colonne en lecture seule (base projetée en mémoire) avant une écriture en place"""
+        values = self._base[column].to_numpy()
+        if isinstance(values, np.ndarray) and not values.flags.writeable and values.dtype == self._base[column].dtype:
+            self._base[column] = self._base[column].copy()
+    
+    def load_file(self, file_path, file_type='xlsx', file_id=None, sheet=None):
+        """Charge un fichier Excel ou CSV dans un DataFrame pandas
+
+        Seule la feuille demandée (la première par défaut) est parsée; les autres
+        le seront à la demande via select_sheet. Si file_id (empreinte du contenu)
+        est fourni, la version parsée est lue depuis le cache colonnes quand elle
+        existe, sans reparser le fichier.
+        """
         try:
-            if file_type.lower() == 'csv':
-                self.df = pd.read_csv(file_path)
+            file_type = file_type.lower()
+            if self.source is None or self.source[0] != file_path:
+                self.sheets = readers.list_sheets(file_path, file_type)
+                self._parked_sheets = {}
+            if sheet is None and self.sheets:
+                sheet = self.sheets[0]
+            if self.sheets and sheet not in self.sheets:
+                raise ValueError(f"Feuille inconnue: {sheet}")
+            variant = f'sheet:{sheet}' if sheet is not None else ''
+            
+            if file_type == 'csv' and os.path.getsize(file_path) >= Config.OUT_OF_CORE_THRESHOLD:
+                # Trop gros pour un DataFrame: lu par blocs depuis un Parquet converti une fois
+                self.df, self.load_report = self._open_out_of_core(file_path, file_id)
             else:
-                self.df = pd.read_excel(file_path)
+                cached = upload_cache.load_parsed(file_id, variant) if file_id else None
+                if cached is not None:
+                    self.df, self.load_report = cached
+                    logger.info(f"Fichier chargé depuis le cache ({file_id[:12]}), parsing évité")
+                else:
+                    df = readers.read_sheet(file_path, file_type, sheet, engine=Config.EXCEL_READER_ENGINE)
+                    
+                    # Types compacts avec de vrais nulls (convertis en '' seulement à l'affichage)
+                    self.df, self.load_report = column_types.compact_dtypes(df)
+                    if file_id:
+                        upload_cache.save_parsed(file_id, self.df, self.load_report, variant)
+                if file_type in FORMULA_FILE_TYPES:
+                    self._load_formulas(file_path, file_type, file_id, sheet, variant)
             
-            # Convertir les NaN en chaînes vides pour l'affichage
-            self.df = self.df.fillna('')
+            self.mark_modified()
+            if not self.out_of_core:
+                self._stats.build(self._base)
+            self.source = (file_path, file_type, file_id)
+            self.active_sheet = sheet
+            self._source_version = self.version
             
             logger.info(f"Fichier chargé avec succès: {self.df.shape[0]} lignes, {self.df.shape[1]} colonnes")
+            if not self.out_of_core:
+                logger.info(f"Mémoire: {self.load_report['before_bytes'] / 1e6:.1f} Mo -> "
+                            f"{self.load_report['after_bytes'] / 1e6:.1f} Mo "
+                            f"({self.load_report['saved_bytes'] / 1e6:.1f} Mo économisés)")
             return True
         except Exception as e:
             logger.error(f"Erreur lors du chargement du fichier: {str(e)}")
             return False
     
-    def get_data_for_frontend(self):
-        """Convertit le DataFrame en format JSON pour le frontend"""
+    def _load_formulas(self, file_path, file_type, file_id, sheet, variant):
+        """Lit les formules de la feuille (une fois par upload) et calcule celles sans valeur en cache
+
+        Un classeur écrit par une bibliothèque (et non par Excel) n'a pas de
+        valeurs en cache: pandas lit ces cellules vides.
+        """
+        book = upload_cache.load_formulas(file_id, variant) if file_id else None
+        if book is None:
+            book = read_formulas(file_path, file_type, sheet, self._base.columns)
+            if file_id:
+                upload_cache.save_formulas(file_id, book, variant)
+        if not book:
+            return
+        self._formulas = book
+        computed = sum(len(entry['rows']) for entry in self._recalculate({}, forced=book.missing(self._base)))
+        if computed:
+            logger.info(f"{computed} formules sans valeur en cache calculées au chargement")
+    
+    def _open_out_of_core(self, file_path, file_id=None):
+        """Ouvre un gros CSV en mode hors mémoire; renvoie (ChunkedDataset, rapport de chargement)
+
+        La conversion en Parquet par blocs n'a lieu qu'au premier chargement
+        d'un contenu donné (dédupliqué par empreinte comme les autres uploads).
+        """
+        parquet_path = upload_cache.out_of_core_path(file_id) if file_id else f'{file_path}.parquet'
+        if not os.path.exists(parquet_path):
+            convert_csv(file_path, parquet_path, Config.OUT_OF_CORE_CHUNK_ROWS)
+        dataset = ChunkedDataset(parquet_path)
+        report = {
+            'out_of_core': True,
+            'csv_bytes': os.path.getsize(file_path),
+            'parquet_bytes': os.path.getsize(parquet_path),
+            'rows': dataset.row_count,
+            'chunk_rows': Config.OUT_OF_CORE_CHUNK_ROWS
+        }
+        return dataset, report
+    
+    def load_reference(self, file_path, file_type, file_id=None, filename=None, name=None, sheet=None):
+        """Charge un fichier de référence (pour les jointures) à côté de la feuille active
+
+        Un gros CSV reste sur disque et sera joint bloc par bloc; les autres
+        fichiers passent par le même cache colonnes que les uploads. Une
+        référence du même nom est remplacée. Renvoie la référence.
+        """
+        file_type = file_type.lower()
+        name = reference_name(name or filename or os.path.basename(file_path))
+        if name not in self._references and len(self._references) >= Config.MAX_REFERENCES:
+            raise ValueError(f"{Config.MAX_REFERENCES} fichiers de référence au plus par session")
+        if file_type == 'csv' and os.path.getsize(file_path) >= Config.REFERENCE_OUT_OF_CORE_THRESHOLD:
+            frame, report = self._open_out_of_core(file_path, file_id)
+        else:
+            variant = f'sheet:{sheet}' if sheet is not None else ''
+            cached = upload_cache.load_parsed(file_id, variant) if file_id else None
+            if cached is not None:
+                frame, report = cached
+            else:
+                frame, report = column_types.compact_dtypes(
+                    readers.read_sheet(file_path, file_type, sheet, engine=Config.EXCEL_READER_ENGINE))
+                if file_id:
+                    upload_cache.save_parsed(file_id, frame, report, variant)
+        reference = ReferenceDataset(name, frame, filename, report)
+        self._references[name] = reference
+        self._memory_usage = (None, 0)
+        logger.info(f"Référence {name} chargée: {len(frame)} lignes, {len(frame.columns)} colonnes"
+                    f"{' (hors mémoire)' if reference.out_of_core else ''}")
+        return reference
+    
+    def list_references(self):
+        return [reference.describe() for reference in self._references.values()]
+    
+    @property
+    def reference_names(self):
+        return tuple(self._references)
+    
+    def reference_columns(self):
+        """Colonnes de chaque référence ({nom: [colonnes]}), pour le routage et le prompt des commandes"""
+        return {name: reference.columns for name, reference in self._references.items()}
+    
+    def remove_reference(self, name):
+        reference = resolve_reference(name, self._references)
+        del self._references[reference.name]
+        self._memory_usage = (None, 0)
+    
+    def join_reference(self, name=None, on=None, right_on=None, columns=None):
+        """Ajoute à la feuille des colonnes d'une référence, ligne à ligne par clé (annulable)
+
+        Pour chaque ligne, la première ligne de la référence ayant la même clé
+        (sans casse, nombres entiers sans décimales) fournit les valeurs; sans
+        correspondance, les cellules restent vides. Une colonne déjà présente
+        dans la feuille est ajoutée sous le nom "colonne (référence)".
+        Renvoie un résumé (colonnes ajoutées, lignes trouvées, doublons).
+        """
+        self._require_in_memory("La jointure")
+        reference = resolve_reference(name, self._references)
+        if not on:
+            # Clé par défaut: première colonne présente dans les deux fichiers
+            shared = {normalize_command(str(column)) for column in reference.columns}
+            on = next((column for column in self._base.columns if normalize_command(str(column)) in shared), None)
+            if on is None:
+                raise JoinError(f"Aucune colonne commune avec {reference.name}: précisez la colonne clé")
+        left_key = command_plan.resolve_name(on, list(self._base.columns))
+        right_key = reference.column(right_on or left_key)
+        if columns:
+            columns = [reference.column(column) for column in columns]
+        else:
+            columns = [column for column in reference.columns if column != right_key]
+        columns = [column for column in dict.fromkeys(columns) if column != right_key]
+        if not columns:
+            raise JoinError(f"Aucune colonne à ajouter depuis {reference.name}")
+        
+        started = time.perf_counter()
+        values, matched, duplicates = lookup_columns(self._base[left_key], reference, right_key, columns)
+        names = {column: column if column not in self._base.columns else f'{column} ({reference.name})'
+                 for column in columns}
+        self.set_columns({names[column]: values[column] for column in columns})
+        logger.info(f"Jointure {left_key} -> {reference.name}.{right_key}: {matched}/{len(self._base)} lignes "
+                    f"trouvées en {(time.perf_counter() - started) * 1000:.1f} ms")
+        return {
+            'reference': reference.name,
+            'on': str(left_key),
+            'rightOn': str(right_key),
+            'columns': [str(name) for name in names.values()],
+            'rows': len(self._base),
+            'matched': matched,
+            'duplicates': duplicates,
+            'outOfCore': reference.out_of_core
+        }
+    
+    def select_sheet(self, sheet):
+        """Active une autre feuille du classeur, parsée à la première demande
+
+        Les modifications de la feuille quittée sont conservées en mémoire.
+        """
+        if self.source is None:
+            return False
+        if sheet == self.active_sheet:
+            return True
+        if sheet not in self.sheets:
+            logger.error(f"Feuille inconnue: {sheet}")
+            return False
+        
+        if self.df is not None and self.version != self._source_version:
+            self._parked_sheets[self.active_sheet] = (self._base, self.load_report, self._filters, self._formulas)
+        
+        if sheet in self._parked_sheets:
+            base, self.load_report, filters, formulas = self._parked_sheets.pop(sheet)
+            self.df = base
+            self._filters = filters
+            self._formulas = formulas
+            self.active_sheet = sheet
+            self.mark_modified()
+            return True
+        
+        file_path, file_type, file_id = self.source
+        return self.load_file(file_path, file_type, file_id, sheet=sheet)
+    
+    def preview(self, sheet=None, usecols=None, nrows=100, layout='rows'):
+        """Aperçu rapide d'une feuille (colonnes/lignes limitées), sans la charger"""
+        if self.source is None:
+            return None
+        file_path, file_type, _ = self.source
+        df = readers.read_sheet(file_path, file_type, sheet, usecols=usecols, nrows=nrows,
+                                engine=Config.EXCEL_READER_ENGINE)
+        payload = self._build_payload(df, layout)
+        payload['sheet'] = sheet if sheet is not None else self.active_sheet
+        return payload
+    
+    def is_pristine(self):
+        """Vrai si le DataFrame est identique à sa version en cache (aucune modification)"""
+        return (self.source is not None and self.source[2] is not None
+                and self.version == self._source_version and not self._parked_sheets
+                and not self._references)
+    
+    def reload_source(self):
+        """Recharge le DataFrame depuis le cache colonnes, sans changer de version"""
+        file_path, file_type, file_id = self.source
+        version = self.version
+        if not self.load_file(file_path, file_type, file_id, sheet=self.active_sheet):
+            raise IOError(f"Impossible de recharger {file_path}")
+        self.version = version
+        self._source_version = version
+    
+    def get_data_for_frontend(self, layout='rows'):
+        """Convertit le DataFrame en format JSON pour le frontend
+
+        layout='rows' renvoie les lignes AG-Grid habituelles (une par ligne),
+        layout='columns' renvoie un tableau de valeurs par colonne, plus compact
+        et plus rapide à construire pour les gros fichiers, layout='arrow' une
+        table Arrow (flux binaire Arrow IPC côté route).
+        """
+        if self.df is None:
+            return None
+        if self.out_of_core:
+            # Mode hors mémoire: premières lignes seulement, la suite par fenêtres (startRow/endRow)
+            payload = self.get_rows_window(0, Config.PREVIEW_MAX_ROWS, layout=layout)
+            payload['outOfCore'] = True
+            return payload
+        payload = self._build_payload(self.df, layout)
+        payload['version'] = self.version
+        return payload
+    
+    def stream_records(self, layout='rows', first_rows=None, chunk_rows=None):
+        """Enregistrements NDJSON des données: colonnes, blocs de lignes, puis résumé
+
+        L'instantané est figé à l'appel: copie superficielle, isolée des
+        modifications suivantes par le Copy-on-Write (activé au démarrage);
+        chaque bloc n'est construit qu'au moment
+        de l'envoyer, le payload complet n'est donc jamais matérialisé.
+        """
         if self.df is None:
             return None
+        self._require_in_memory("Le flux NDJSON")
+        frame = self.df.copy(deep=False)
+        version = self.version
+        first_rows = first_rows or Config.STREAM_FIRST_CHUNK_ROWS
+        chunk_rows = chunk_rows or Config.STREAM_CHUNK_ROWS
+        
+        def records():
+            yield {
+                'type': 'columns',
+                'columns': self._column_defs(frame),
+                'rowCount': len(frame),
+                'colCount': len(frame.columns),
+                'layout': layout,
+                'version': version
+            }
+            start, size = 0, first_rows
+            while start < len(frame):
+                payload = self._build_payload(frame.iloc[start:start + size], layout)
+                chunk = {'columns': payload['columns']} if layout == 'columns' else {'data': payload['data']}
+                yield dict(chunk, type='rows', startRow=start, rowCount=payload['rowCount'])
+                start, size = start + size, chunk_rows
+            yield {'type': 'end', 'rowCount': len(frame), 'version': version}
+        
+        return records()
+    
+    def get_changes(self, since_version, layout='rows'):
+        """Patch permettant de passer de since_version à la version actuelle
+
+        Renvoie None si un instantané complet est nécessaire: historique
+        insuffisant, DataFrame remplacé, ou patch plus gros que l'instantané.
+        """
+        if self.df is None or since_version is None or layout == 'arrow':
+            return None  # Le format arrow n'a pas de patch: instantané complet
+        since_version = int(since_version)
+        if since_version > self.version:
+            return None
+        entries = [change for version, change in self.change_log if version > since_version]
+        if len(entries) != self.version - since_version or any(change is None for change in entries):
+            return None
+        
+        set_columns, removed_columns, ranges = [], [], []
+        for change in entries:
+            if change['type'] == 'columns_set':
+                for column in change['columns']:
+                    if column in removed_columns:
+                        removed_columns.remove(column)
+                    if column not in set_columns:
+                        set_columns.append(column)
+            elif change['type'] == 'columns_removed':
+                for column in change['columns']:
+                    if column in set_columns:
+                        set_columns.remove(column)
+                    if column not in removed_columns:
+                        removed_columns.append(column)
+            elif change['type'] == 'cells':
+                ranges.extend(change['rows'])
+        
+        row_ids = np.unique(np.concatenate([np.arange(start, end + 1) for start, end in ranges])) if ranges else []
+        row_ids = self.df.index[self.df.index.isin(row_ids)]
+        cost = len(set_columns) * len(self.df) + len(row_ids) * self.df.shape[1]
+        if cost > self.DELTA_MAX_FRACTION * max(self.df.size, 1):
+            return None
+        
+        rows_payload = self._build_payload(self.df.loc[row_ids], layout)
+        column_defs = rows_payload['columnDefs'] if layout == 'columns' else rows_payload['columns']
+        return {
+            'type': 'patch',
+            'fromVersion': since_version,
+            'version': self.version,
+            'columns': column_defs,
+            'setColumns': {column: self._column_values(self.df[column]) for column in set_columns},
+            'removedColumns': removed_columns,
+            'rows': rows_payload['columns'] if layout == 'columns' else rows_payload['data'],
+            'rowCount': len(self.df),
+            'colCount': len(self.df.columns)
+        }
+    
+    def get_rows_window(self, start_row=0, end_row=None, sort_model=None, filter_model=None, layout='rows'):
+        """Renvoie une fenêtre de lignes triées/filtrées (modèle serveur AG-Grid)
+
+        Le tri et le filtrage sont vectorisés; l'ordre trié est mis en cache par
+        (version, clé de tri) pour que le défilement ne retrie pas à chaque bloc.
+        """
+        if self.df is None:
+            return None
+        
+        positions = self._sorted_positions(sort_model)
+        mask = self._grid_filter_mask(filter_model)
+        if mask is not None:
+            positions = positions[mask[positions]] if positions is not None else np.flatnonzero(mask)
+        total = len(positions) if positions is not None else len(self.df)
+        
+        start_row = max(int(start_row or 0), 0)
+        end_row = total if end_row is None else min(int(end_row), total)
+        if self.out_of_core:
+            # Seuls les groupes de lignes de la fenêtre sont lus sur le disque
+            window = self.df.take(positions[start_row:end_row] if positions is not None
+                                  else np.arange(start_row, max(start_row, end_row)))
+        elif positions is None:
+            window = self.df.iloc[start_row:end_row]
+        else:
+            window = self.df.iloc[positions[start_row:end_row]]
+        
+        payload = self._build_payload(window, layout)
+        payload.update({
+            'startRow': start_row,
+            'lastRow': total,
+            'rowCount': total,
+            'totalRowCount': len(self.df),
+            'version': self.version
+        })
+        return payload
+    
+    def _sorted_positions(self, sort_model):
+        """Positions triées selon sort_model (None si aucun tri), avec cache"""
+        key = grid_query.sort_key(sort_model)
+        if not key:
+            return None
+        self._require_in_memory("Le tri de la grille")
+        
+        cache_key = (self.version, key)
+        order = self._cached(cache_key)
+        if order is None:
+            order = self._cache(cache_key, grid_query.sort_order(self.df, sort_model))
+        return order
+    
+    def _cached(self, cache_key):
+        """Ordre de tri ou masque en cache (None si absent), marqué comme récent"""
+        with self._sort_cache_lock:
+            value = self._sort_cache.get(cache_key)
+            if value is not None:
+                self._sort_cache.move_to_end(cache_key)
+            return value
+    
+    def _cache(self, cache_key, value):
+        with self._sort_cache_lock:
+            self._sort_cache[cache_key] = value
+            while len(self._sort_cache) > self.SORT_CACHE_SIZE:
+                self._sort_cache.popitem(last=False)
+        return value
+    
+    def _build_payload(self, frame, layout='rows'):
+        """Construit le payload AG-Grid d'un DataFrame (ou d'une fenêtre)"""
+        columns = self._column_defs(frame)
+        
+        if layout == 'arrow':
+            # Colonnes converties d'un bloc en tableaux Arrow, sans valeurs Python
+            return {
+                'layout': 'arrow',
+                'table': arrow_transport.frame_to_table(frame),
+                'columnDefs': columns,
+                'rowCount': len(frame),
+                'colCount': len(frame.columns)
+            }
+        
+        # Extraction vectorisée: une conversion par colonne au lieu d'une par cellule
+        fields = ['id'] + list(frame.columns)
+        values = [frame.index.tolist()]
+        values.extend(self._column_values(frame.iloc[:, i]) for i in range(frame.shape[1]))
+        
+        if layout == 'columns':
+            return {
+                'layout': 'columns',
+                'columns': dict(zip(fields, values)),
+                'columnDefs': columns,
+                'rowCount': len(frame),
+                'colCount': len(frame.columns)
+            }
         
         # Convertir en format compatible avec AG-Grid
-        data = []
-        for index, row in self.df.iterrows():
-            row_data = {'id': index}
-            for col in self.df.columns:
-                row_data[col] = row[col]
-            data.append(row_data)
-        
-        # Définir les colonnes pour AG-Grid
+        data = [dict(zip(fields, row)) for row in zip(*values)]
+        
+        return {
+            'data': data,
+            'columns': columns,
+            'rowCount': len(frame),
+            'colCount': len(frame.columns)
+        }
+    
+    def _column_defs(self, frame):
+        """Définitions des colonnes pour AG-Grid"""
         columns = [{'field': 'id', 'headerName': 'ID', 'width': 70, 'editable': False}]
-        for col in self.df.columns:
+        for col in frame.columns:
             columns.append({
                 'field': col,
                 'headerName': col,
-                'editable': True,
+                'editable': not self.out_of_core,
                 'width': 150
             })
-        
-        return {
-            'data': data,
-            'columns': columns,
-            'rowCount': len(self.df),
-            'colCount': len(self.df.columns)
-        }
+        return columns
+    
+    @staticmethod
+    def _column_values(series):
+        """Convertit une colonne entière en liste de valeurs Python natives"""
+        return column_types.display_values(series)
     
     def update_cell(self, row_id, column, value):
         """Met à jour une cellule spécifique"""
@@ -102,30 +1015,162 @@ class ExcelProcessor:
             if self.df is None:
                 return False
             
-            # Convertir la valeur si c'est un nombre
-            try:
-                if value.replace('.', '').replace('-', '').isdigit():
-                    value = float(value) if '.' in value else int(value)
-            except:
-                pass
-            
-            self.df.at[row_id, column] = value
+            self.update_cells([{'rowId': row_id, 'column': column, 'value': value}])
             logger.info(f"Cellule mise à jour: ligne {row_id}, colonne {column}, valeur {value}")
             return True
         except Exception as e:
             logger.error(f"Erreur lors de la mise à jour de la cellule: {str(e)}")
             return False
     
-    def export_to_excel(self, filename):
-        """Exporte le DataFrame vers un fichier Excel"""
+    def update_cells(self, edits):
+        """Applique un lot de modifications [{rowId, column, value}] en une seule version
+
+        Les modifications sont groupées par colonne; chaque groupe est converti
+        vers le type de la colonne en une opération vectorisée puis écrit d'un
+        coup. Une valeur commençant par "=" est une formule: sa valeur est
+        calculée, puis les formules qui dépendent des cellules modifiées sont
+        recalculées dans la même version. Lève ValueError si une ligne ou une
+        colonne est inconnue, ou si une formule est invalide.
+        """
+        if self.df is None:
+            raise ValueError("Aucune donnée chargée")
+        self._require_in_memory("La modification de cellules")
+        if not edits:
+            return 0
+        
+        batch = pd.DataFrame(edits, columns=['rowId', 'column', 'value'])
+        unknown_columns = set(batch['column']) - set(self.df.columns)
+        if unknown_columns:
+            raise ValueError(f"Colonnes inconnues: {sorted(map(str, unknown_columns))}")
+        unknown_rows = batch.loc[~batch['rowId'].isin(self.df.index), 'rowId']
+        if len(unknown_rows):
+            raise ValueError(f"Lignes inconnues: {unknown_rows.unique().tolist()[:10]}")
+        
+        # En cas de doublon, la dernière modification d'une cellule l'emporte
+        batch = batch.drop_duplicates(['rowId', 'column'], keep='last')
+        
+        # Formules saisies: compilées avant toute écriture, la cellule reçoit ensuite la valeur calculée
+        is_formula = batch['value'].map(lambda value: isinstance(value, str) and len(value) > 1
+                                        and value.startswith('=')).to_numpy(dtype=bool)
+        added = {}
+        for row_id, column, text in batch.loc[is_formula, ['rowId', 'column', 'value']].itertuples(index=False):
+            try:
+                template = FormulaBook.compile(text, self._base, self._base.index.get_loc(row_id))
+            except FormulaError as e:
+                raise ValueError(f"Formule invalide ({column}, ligne {row_id}): {str(e)}")
+            added.setdefault((column, template), []).append(row_id)
+        added = [('group', column, template, np.asarray(labels)) for (column, template), labels in added.items()]
+        batch.loc[is_formula, 'value'] = None
+        
+        # Conversion de tous les groupes avant écriture: le lot est tout ou rien
+        prepared = []
+        for column, group in batch.groupby('column', sort=False):
+            series = self._base[column]
+            widened, values = column_types.coerce_for_column(series, group['value'])
+            prepared.append((column, series, widened, group['rowId'].to_numpy(), values))
+        
+        # Une valeur saisie remplace la formule de la cellule
+        removed = []
+        if added and self._formulas is None:
+            self._formulas = FormulaBook()
+        if self._formulas is not None:
+            for column, series, widened, rows, values in prepared:
+                removed.extend(self._formulas.take(column, rows))
+            try:
+                self._formulas.put(added, self._base)
+            except FormulaError as e:
+                self._formulas.swap(added, removed)
+                raise ValueError(str(e))
+        
+        # Écriture dans la base (les filtres restent des vues), avec valeurs avant/après pour l'annulation
+        undo_entries = [self._write_cells(column, series, widened, rows, values)
+                        for column, series, widened, rows, values in prepared]
+        undo_entries += self._recalculate({column: rows for column, _, _, rows, _ in prepared},
+                                          forced={(column, template): labels
+                                                  for _, column, template, labels in added})
+        operation = {'type': 'cells', 'columns': undo_entries}
+        if removed or added:
+            operation['formulas'] = {'removed': removed, 'added': added}
+        self._record(operation)
+        
+        self.mark_modified({'type': 'cells',
+                            'rows': _row_ranges(np.concatenate([entry['rows'] for entry in undo_entries]))})
+        return len(batch)
+    
+    def _write_cells(self, column, series, widened, rows, values):
+        """Écrit des valeurs déjà converties (voir coerce_for_column); renvoie l'entrée d'annulation"""
+        before = self._base.loc[rows, column].to_numpy(copy=True)
+        if widened is not series:
+            self._base[column] = widened
+        else:
+            self._writable_column(column)
+        self._base.loc[rows, column] = values
+        entry = {
+            'column': column,
+            'rows': rows,
+            'before': before,
+            'after': self._base.loc[rows, column].to_numpy(copy=True),
+            'before_dtype': series.dtype,
+            'after_dtype': self._base[column].dtype
+        }
+        # Statistiques mises à jour à partir des seules cellules modifiées
+        self._indexes.invalidate([column])
+        if widened is series:
+            self._stats.update_cells(column, before, entry['after'])
+        else:
+            self._stats.invalidate([column])
+        return entry
+    
+    @property
+    def has_formulas(self):
+        return bool(self._formulas)
+    
+    def _recalculate(self, changed, forced=None):
+        """Recalcule les formules en aval des cellules modifiées ({colonne: étiquettes de lignes})
+
+        Renvoie les entrées d'annulation des cellules recalculées.
+        """
+        if not self._formulas:
+            return []
+        entries = []
+        
+        def write(column, rows, values):
+            series = self._base[column]
+            if values.dtype == series.dtype:
+                widened, converted = series, values  # Résultats déjà du type de la colonne
+            else:
+                widened, converted = column_types.coerce_for_column(series, values)
+            entries.append(self._write_cells(column, series, widened, rows, converted))
+        
+        started = time.perf_counter()
+        recalculated = self._formulas.recalculate(self._base, changed, write, forced)
+        if recalculated:
+            logger.info(f"{recalculated} cellules à formule recalculées en "
+                        f"{(time.perf_counter() - started) * 1000:.1f} ms")
+        return entries
+    
+    def export_formulas(self, file_format):
+        """Formules à écrire dans un export xlsx (voir FormulaBook.render), ou None
+
+        Une vue filtrée est exportée en valeurs: ses lignes ne correspondent
+        plus aux références des formules.
+        """
+        if file_format != 'xlsx' or not self._formulas or self._filters:
+            return None
+        return self._formulas.render(self._base)
+    
+    def export(self, file_format='xlsx'):
+        """Exporte le DataFrame (xlsx, csv ou parquet) et renvoie le chemin du fichier
+
+        L'écriture se fait par blocs à mémoire constante; un dataset inchangé
+        depuis le dernier export est resservi depuis le cache.
+        """
         try:
             if self.df is None:
                 return None
             
-            export_path = os.path.join(EXPORT_FOLDER, filename)
-            self.df.to_excel(export_path, index=False)
-            logger.info(f"Fichier exporté: {export_path}")
-            return export_path
+            return export_cache.export(self.df, self.dataset_id, self.version, file_format,
+                                       sheet_name=self.active_sheet, formulas=self.export_formulas(file_format))
         except Exception as e:
             logger.error(f"Erreur lors de l'export: {str(e)}")
             return None
@@ -133,11 +1178,28 @@ class ExcelProcessor:
 class AICommandProcessor:
     """Classe pour traiter les commandes IA en langage naturel"""
     
-    def __init__(self, api_key=None):
+    # Colonnes décrites (avec statistiques) dans le prompt du modèle
+    PROMPT_MAX_COLUMNS = 50
+    # Commandes d'historique traitées localement: la commande entière (normalisée) doit
+    # correspondre, "annule la commande 12 du client X" part au modèle
+    LAST_OPERATION = r"(?: (?:la |l')?(?:derniere )?(?:operation|action|modification))?"
+    UNDO_COMMAND = re.compile(rf"^(?:annule|annuler|undo){LAST_OPERATION}$")
+    REDO_COMMAND = re.compile(rf"^(?:retablis|retablir|redo){LAST_OPERATION}$")
+    CLEAR_FILTERS_COMMAND = re.compile(
+        r"^(?:supprime|supprimer|enleve|enlever|efface|effacer|retire|retirer|clear|remove)"
+        r"(?: tous)?(?: (?:les|le|the|all))? (?:filtres?|filters?)$")
+    
+    def __init__(self, api_key=None, cache=None, router=None, gateway=None):
         # Configuration OpenAI
         self.openai_client = openai
         if api_key:
             self.openai_client.api_key = api_key
+        self.gateway = gateway  # Délais, concurrence et disjoncteur des appels au modèle
+        if gateway is not None:
+            # Le disjoncteur remplace les nouvelles tentatives du client OpenAI
+            self.openai_client.max_retries = 0
+        self.cache = cache  # Interprétations déjà obtenues (partagées entre sessions)
+        self.router = router or IntentRouter()  # Routeur d'intentions local, aussi système de règles
         self.processor = None
         self.use_openai = True  # Activer l'IA OpenAI
     
@@ -148,39 +1210,71 @@ class AICommandProcessor:
     def interpret_command(self, command, df_info):
         """Interprète une commande en langage naturel et génère du code pandas"""
         
-        # Essayer d'abord avec OpenAI si disponible
+        # Historique (annuler/rétablir, retrait des filtres): traité localement
+        history = self._handle_history_command(command)
+        if history is not None:
+            return history
+        
+        # Routeur local: les commandes simples reconnues avec confiance n'attendent pas le modèle
+        decision = None
+        if self.processor.df is not None:
+            decision = self.router.route(command, df_info['columns'], df_info.get('references'))
+            if decision is not None and decision['local']:
+                return self._execute_ai_action(decision['action'], df_info)
+        
+        # Essayer ensuite avec OpenAI si disponible
         if self.use_openai and hasattr(self.openai_client, 'api_key'):
             try:
                 return self._interpret_with_openai(command, df_info)
             except Exception as e:
                 logger.warning(f"Erreur OpenAI: {e}. Utilisation du système de règles.")
         
-        # Système de règles simple en fallback
-        command_lower = command.lower()
-        
-        # Détection des types de commandes
-        if 'somme' in command_lower or 'sum' in command_lower:
-            return self._handle_sum_command(command, df_info)
-        elif 'moyenne' in command_lower or 'mean' in command_lower:
-            return self._handle_mean_command(command, df_info)
-        elif 'ajoute' in command_lower and 'colonne' in command_lower:
-            return self._handle_add_column_command(command, df_info)
-        elif 'filtre' in command_lower or 'filter' in command_lower:
-            return self._handle_filter_command(command, df_info)
-        elif 'trie' in command_lower or 'sort' in command_lower:
-            return self._handle_sort_command(command, df_info)
-        else:
-            return {
-                'success': False,
-                'message': 'Commande non reconnue. Essayez: "Calcule la somme de la colonne X", "Ajoute une colonne Y", "Filtre les lignes où X > 10"'
-            }
+        # Système de règles en fallback: la meilleure interprétation locale, même peu sûre
+        if decision is not None and decision['action'] is not None:
+            return self._execute_ai_action(decision['action'], df_info)
+        return {
+            'success': False,
+            'message': 'Commande non reconnue. Essayez: "Calcule la somme de la colonne X", "Ajoute une colonne Y", "Filtre les lignes où X > 10"'
+        }
+    
+    def _handle_history_command(self, command):
+        """Annuler / rétablir / retirer les filtres, sans appel au modèle (None si autre commande)"""
+        text = normalize_command(command)
+        if self.UNDO_COMMAND.match(text):
+            operation = self.processor.undo()
+            if operation is None:
+                return {'success': False, 'message': 'Rien à annuler'}
+            return {'success': True, 'message': f'Opération annulée ({operation})', 'refresh_needed': True}
+        if self.REDO_COMMAND.match(text):
+            operation = self.processor.redo()
+            if operation is None:
+                return {'success': False, 'message': 'Rien à rétablir'}
+            return {'success': True, 'message': f'Opération rétablie ({operation})', 'refresh_needed': True}
+        if self.CLEAR_FILTERS_COMMAND.match(text):
+            if not self.processor.clear_filters():
+                return {'success': False, 'message': 'Aucun filtre actif'}
+            return {'success': True, 'message': f'Filtres retirés: {len(self.processor.df)} lignes affichées',
+                    'refresh_needed': True}
+        return None
     
     def _interpret_with_openai(self, command, df_info):
         """Utilise OpenAI GPT pour interpréter la commande de manière avancée"""
         try:
+            # Même commande sur les mêmes colonnes (références comprises): réponse rejouée sans appel réseau
+            references = df_info.get('references') or {}
+            cache_columns = list(df_info['columns']) + [f'{name}.{column}' for name, columns in references.items()
+                                                        for column in columns]
+            if self.cache is not None:
+                cached = self.cache.get(command, cache_columns)
+                if cached is not None:
+                    logger.info("Interprétation IA servie depuis le cache")
+                    return self._execute_ai_action(cached, df_info)
+            
             # Préparer le contexte pour GPT
-            columns_info = ", ".join(df_info['columns'])
+            columns_info = self._describe_columns(df_info['columns'])
             data_shape = f"{df_info['shape'][0]} lignes, {df_info['shape'][1]} colonnes"
+            references_info = '; '.join(f"{name} ({', '.join(str(column) for column in columns[:self.PROMPT_MAX_COLUMNS])})"
+                                        for name, columns in references.items()) or 'aucun'
             
             # Prompt système pour GPT
             system_prompt = f"""Tu es un assistant IA spécialisé dans l'analyse de données Excel avec pandas.
@@ -188,31 +1282,46 @@ class AICommandProcessor:
 Contexte du fichier Excel:
 - Colonnes disponibles: {columns_info}
 - Taille des données: {data_shape}
+- Fichiers de référence (pour les jointures): {references_info}
 
-Tu dois interpréter les commandes utilisateur et retourner une réponse JSON avec:
-- "action": le type d'action (calculate, filter, add_column, sort, etc.)
-- "column": la colonne concernée (si applicable)
-- "operation": l'opération à effectuer
-- "value": la valeur ou paramètre (si applicable)
-- "message": message de confirmation pour l'utilisateur
+Tu dois traduire la commande utilisateur en un plan JSON {{"steps": [...], "message": "..."}}.
+Étapes possibles, exécutées dans l'ordre:
+- {{"op": "filter", "conditions": [{{"column": "Prix", "filterType": "number", "type": "greaterThan", "filter": 100}}], "combine": "and"}}
+  (type: equals, notEqual, greaterThan, greaterThanOrEqual, lessThan, lessThanOrEqual; filterType "text" avec type "contains" pour du texte; combine: "and" ou "or")
+- {{"op": "sort", "by": [{{"column": "Prix", "ascending": false}}]}}
+- {{"op": "compute", "column": "TTC", "expression": "[Prix HT] * 1.2"}} (+ - * / et parenthèses, noms de colonnes entre crochets)
+- {{"op": "aggregate", "function": "sum", "column": "Prix", "groupBy": ["Région"]}} (function: sum, mean, min, max, count, median; groupBy optionnel)
+- {{"op": "top", "column": "Prix", "n": 10, "largest": true}} (les n plus grandes valeurs, ou plus petites avec largest false)
+- {{"op": "lookup", "column": "Produit", "value": "Clavier"}} (lignes où une colonne texte vaut une valeur)
+- {{"op": "join", "reference": "tarifs", "on": "Référence", "rightOn": "Réf", "columns": ["Prix"]}} (ajoute des colonnes d'un fichier de référence, comme une RECHERCHEV; rightOn: clé dans la référence si son nom diffère)
+"message" est un message de confirmation pour l'utilisateur.
 
 Exemples de réponses:
-- Pour "Calcule la somme de la colonne Prix": {{"action": "calculate", "column": "Prix", "operation": "sum", "message": "Calcul de la somme de la colonne Prix"}}
-- Pour "Ajoute une colonne TVA à 20%": {{"action": "add_column", "column": "TVA", "operation": "percentage", "value": 20, "message": "Ajout d'une colonne TVA à 20%"}}
+- Pour "Calcule la somme de la colonne Prix": {{"steps": [{{"op": "aggregate", "function": "sum", "column": "Prix"}}], "message": "Somme de la colonne Prix"}}
+- Pour "Ajoute une colonne TVA à 20% du Prix": {{"steps": [{{"op": "compute", "column": "TVA", "expression": "[Prix] * 0.2"}}], "message": "Ajout d'une colonne TVA à 20%"}}
+- Pour "Moyenne des ventes par région pour les ventes > 100": {{"steps": [{{"op": "filter", "conditions": [{{"column": "Ventes", "filterType": "number", "type": "greaterThan", "filter": 100}}]}}, {{"op": "aggregate", "function": "mean", "column": "Ventes", "groupBy": ["Région"]}}], "message": "Moyenne des ventes par région"}}
+- Pour "Ajoute le prix depuis le fichier tarifs par référence": {{"steps": [{{"op": "join", "reference": "tarifs", "on": "Référence", "columns": ["Prix"]}}], "message": "Prix ajouté depuis tarifs"}}
 """
 
             user_prompt = f"Commande utilisateur: {command}"
             
-            # Appel à l'API OpenAI
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=500,
-                temperature=0.3
-            )
+            # Appel à l'API OpenAI (délai maximal, concurrence bornée, disjoncteur)
+            def request_completion(timeout):
+                return self.openai_client.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    max_tokens=500,
+                    temperature=0.3,
+                    timeout=timeout
+                )
+            
+            if self.gateway is not None:
+                response = self.gateway.call(request_completion)
+            else:
+                response = request_completion(None)
             
             # Parser la réponse
             ai_response = response.choices[0].message.content.strip()
@@ -221,6 +1330,8 @@ Exemples de réponses:
                 # Essayer de parser comme JSON
                 import json
                 parsed_response = json.loads(ai_response)
+                if self.cache is not None and isinstance(parsed_response, dict):
+                    self.cache.put(command, cache_columns, parsed_response)
                 
                 # Exécuter l'action déterminée par l'IA
                 return self._execute_ai_action(parsed_response, df_info)
@@ -237,190 +1348,151 @@ Exemples de réponses:
             logger.error(f"Erreur OpenAI: {e}")
             raise e
     
+    def _describe_columns(self, columns):
+        """Colonnes et leurs statistiques pour le prompt (type, étendue, valeurs distinctes)"""
+        if self.processor.df is None:
+            return ", ".join(columns)
+        descriptions = []
+        profile = self.processor.profile(columns[:self.PROMPT_MAX_COLUMNS])
+        for column in columns[:self.PROMPT_MAX_COLUMNS]:
+            summary = profile[str(column)]
+            if summary['sum'] is not None:
+                details = f"{summary['dtype']}, min {summary['min']:.6g}, max {summary['max']:.6g}, moyenne {summary['mean']:.4g}" \
+                    if summary['count'] else f"{summary['dtype']}, vide"
+            else:
+                distinct = summary['distinct'] if summary['distinct'] is not None else 'nombreuses'
+                details = f"{summary['dtype']}, {distinct} valeurs distinctes"
+            if summary['nulls']:
+                details += f", {summary['nulls']} vides"
+            descriptions.append(f"{column} ({details})")
+        if len(columns) > self.PROMPT_MAX_COLUMNS:
+            descriptions.append(f"... {len(columns) - self.PROMPT_MAX_COLUMNS} autres colonnes")
+        return ", ".join(descriptions)
+    
     def _execute_ai_action(self, ai_response, df_info):
-        """Exécute l'action déterminée par l'IA"""
-        try:
-            action = ai_response.get('action', '')
-            column = ai_response.get('column', '')
-            operation = ai_response.get('operation', '')
-            value = ai_response.get('value', '')
-            message = ai_response.get('message', 'Action IA exécutée')
-            
-            if action == 'calculate' and operation == 'sum':
-                # Calculer la somme
-                if column in self.processor.df.columns:
-                    result = self.processor.df[column].sum()
-                    return {
-                        'success': True,
-                        'message': f'{message}. Résultat: {result}',
-                        'operation': 'calculation',
-                        'result': result
-                    }
-            
-            elif action == 'add_column' and operation == 'percentage':
-                # Ajouter une colonne avec pourcentage
-                # Chercher une colonne de prix/montant
-                price_column = None
-                for col in self.processor.df.columns:
-                    if any(word in col.lower() for word in ['prix', 'price', 'montant', 'amount', 'total']):
-                        price_column = col
-                        break
-                
-                if price_column and value:
-                    self.processor.df[column] = self.processor.df[price_column] * (float(value) / 100)
-                    return {
-                        'success': True,
-                        'message': f'{message}. Colonne {column} ajoutée avec {value}% de {price_column}',
-                        'operation': 'add_column',
-                        'refresh_needed': True
-                    }
-            
-            # Action générique réussie
+        """Compile la réponse (du modèle ou du routeur local) en plan et l'exécute"""
+        message = ai_response.get('message')
+        plan = command_plan.compile_action(ai_response)
+        if plan is None:
+            # Réponse sans action exécutable: simple message de l'IA
             return {
                 'success': True,
-                'message': message,
+                'message': message or 'Action IA exécutée',
                 'operation': 'ai_action'
             }
-            
-        except Exception as e:
-            return {
-                'success': False,
-                'message': f'Erreur lors de l\'exécution de l\'action IA: {str(e)}'
-            }
-    
-    def _handle_sum_command(self, command, df_info):
-        """Traite les commandes de somme"""
-        try:
-            # Extraction simple du nom de colonne
-            words = command.split()
-            column_name = None
-            
-            for i, word in enumerate(words):
-                if word.lower() in ['colonne', 'column']:
-                    if i + 1 < len(words):
-                        column_name = words[i + 1]
-                        break
-            
-            if not column_name:
-                # Chercher directement dans les colonnes disponibles
-                for col in df_info['columns']:
-                    if col.lower() in command.lower():
-                        column_name = col
-                        break
-            
-            if column_name and column_name in self.processor.df.columns:
-                try:
-                    result = self.processor.df[column_name].sum()
-                    return {
-                        'success': True,
-                        'message': f'La somme de la colonne "{column_name}" est: {result}',
-                        'operation': 'calculation',
-                        'result': result
-                    }
-                except:
-                    return {
-                        'success': False,
-                        'message': f'Impossible de calculer la somme de la colonne "{column_name}". Vérifiez que les données sont numériques.'
-                    }
-            else:
-                return {
-                    'success': False,
-                    'message': f'Colonne "{column_name}" non trouvée. Colonnes disponibles: {list(self.processor.df.columns)}'
-                }
-        except Exception as e:
-            return {'success': False, 'message': f'Erreur: {str(e)}'}
-    
-    def _handle_add_column_command(self, command, df_info):
-        """Traite les commandes d'ajout de colonne"""
         try:
-            # Exemple: "Ajoute une colonne TVA à 18%"
-            if 'tva' in command.lower():
-                # Chercher une colonne de prix
-                price_column = None
-                for col in self.processor.df.columns:
-                    if any(word in col.lower() for word in ['prix', 'price', 'montant', 'amount']):
-                        price_column = col
-                        break
-                
-                if price_column:
-                    # Extraire le pourcentage
-                    import re
-                    percentage_match = re.search(r'(\d+(?:\.\d+)?)%', command)
-                    if percentage_match:
-                        percentage = float(percentage_match.group(1))
-                        self.processor.df['TVA'] = self.processor.df[price_column] * (percentage / 100)
-                        return {
-                            'success': True,
-                            'message': f'Colonne TVA ajoutée avec {percentage}% de {price_column}',
-                            'operation': 'add_column',
-                            'refresh_needed': True
-                        }
-                
+            result = command_plan.PlanExecutor(self.processor).execute(plan)
+        except (command_plan.PlanError, KeyError, TypeError, ValueError) as e:
             return {
                 'success': False,
-                'message': 'Format de commande non reconnu pour l\'ajout de colonne'
+                'message': f'Erreur lors de l\'exécution de l\'action IA: {str(e)}'
             }
-        except Exception as e:
-            return {'success': False, 'message': f'Erreur: {str(e)}'}
-    
-    def _handle_filter_command(self, command, df_info):
-        """Traite les commandes de filtrage"""
+        if message and result['success']:
+            result['message'] = f"{message}. {result['message']}"
+        return result
+
+
+# Initialisation du magasin de sessions (un classeur par utilisateur)
+def _create_session(session_id):
+    processor = ExcelProcessor()
+    ai_processor = AICommandProcessor(api_key=Config.OPENAI_API_KEY, cache=interpretation_cache,
+                                      router=intent_router, gateway=llm_gateway)
+    ai_processor.set_processor(processor)
+    return WorkbookSession(session_id, processor, ai_processor)
+
+session_store = SessionStore(
+    _create_session,
+    memory_budget=Config.SESSION_MEMORY_BUDGET,
+    spill_folder=Config.SESSION_FOLDER,
+    idle_seconds=Config.SESSION_IDLE_SECONDS,
+    expiry_seconds=Config.SESSION_EXPIRY_SECONDS
+)
+
+# Sessions partagées entre workers: état publié sur disque, verrou par session
+shared_sessions = SharedSessions(Config.SHARED_SESSION_FOLDER, Config.SESSION_EXPIRY_SECONDS) \
+    if Config.SHARED_SESSIONS else None
+if shared_sessions is not None:
+    shared_sessions.cleanup()
+
+# Endpoints qui modifient la session (verrou exclusif), les autres la lisent (verrou partagé)
+WRITE_ENDPOINTS = {'upload_file', 'select_sheet', 'update_cell', 'update_cells', 'process_ai_command',
+                   'upload_reference', 'remove_reference', 'join_reference',
+                   'clear_filters', 'undo', 'redo'}
+# Endpoints d'attente des tâches: sans verrou, la tâche doit pouvoir écrire pendant l'attente
+# (get_status lit l'état du processeur: verrou partagé comme toute lecture)
+UNLOCKED_ENDPOINTS = {'get_ai_job', 'stream_ai_job', 'get_file_job', 'cancel_file_job'}
+
+@contextmanager
+def _session_access(session, exclusive):
+    """Accès cohérent à une session: verrou lecteurs/rédacteur du processus, puis
+    synchronisation avec les autres workers si les sessions sont partagées
+
+    Une lecture voit un état figé (aucune écriture ne peut s'intercaler), les
+    écritures sont sérialisées.
+    """
+    with session.lock.write() if exclusive else session.lock.read():
+        session_store.ensure_loaded(session)
+        if shared_sessions is None:
+            yield session
+        else:
+            with shared_sessions.access(session, exclusive=exclusive):
+                yield session
+
+def _session_id():
+    """Identifiant de session envoyé par le client (en-tête X-Session-Id)"""
+    session_id = request.headers.get('X-Session-Id') or request.args.get('session_id') or 'default'
+    return session_id[:128]
+
+def _current_session():
+    return session_store.get(_session_id())
+
+@app.before_request
+def _lock_session():
+    """Verrouille la session de la requête (lecture ou écriture) jusqu'à la fin de la requête"""
+    if request.endpoint not in app.view_functions or request.endpoint in UNLOCKED_ENDPOINTS \
+            or request.method == 'OPTIONS':
+        return
+    stack = ExitStack()
+    stack.enter_context(_session_access(_current_session(), request.endpoint in WRITE_ENDPOINTS))
+    g.session_access = stack
+
+@app.teardown_request
+def _release_session(error=None):
+    """Publie les modifications d'une session partagée (écritures) puis libère son verrou"""
+    stack = g.pop('session_access', None)
+    if stack is not None:
         try:
-            # Exemple: "Filtre uniquement les lignes où le rendement est > 2"
-            import re
-            
-            # Recherche de pattern: colonne opérateur valeur
-            pattern = r'(\w+)\s*(>|<|>=|<=|=|==)\s*(\d+(?:\.\d+)?)'
-            match = re.search(pattern, command)
-            
-            if match:
-                column_name = match.group(1)
-                operator = match.group(2)
-                value = float(match.group(3))
-                
-                # Trouver la colonne correspondante
-                actual_column = None
-                for col in self.processor.df.columns:
-                    if column_name.lower() in col.lower():
-                        actual_column = col
-                        break
-                
-                if actual_column:
-                    if operator == '>':
-                        filtered_df = self.processor.df[self.processor.df[actual_column] > value]
-                    elif operator == '<':
-                        filtered_df = self.processor.df[self.processor.df[actual_column] < value]
-                    elif operator in ['=', '==']:
-                        filtered_df = self.processor.df[self.processor.df[actual_column] == value]
-                    elif operator == '>=':
-                        filtered_df = self.processor.df[self.processor.df[actual_column] >= value]
-                    elif operator == '<=':
-                        filtered_df = self.processor.df[self.processor.df[actual_column] <= value]
-                    
-                    self.processor.df = filtered_df.reset_index(drop=True)
-                    
-                    return {
-                        'success': True,
-                        'message': f'Filtre appliqué: {actual_column} {operator} {value}. {len(filtered_df)} lignes restantes.',
-                        'operation': 'filter',
-                        'refresh_needed': True
-                    }
-            
-            return {
-                'success': False,
-                'message': 'Format de filtre non reconnu. Utilisez: "Filtre colonne > valeur"'
-            }
+            stack.close()
         except Exception as e:
-            return {'success': False, 'message': f'Erreur: {str(e)}'}
+            logger.error(f"Erreur lors de la publication de la session partagée: {str(e)}")
 
-# Initialisation des processeurs
-excel_processor = ExcelProcessor()
-ai_processor = AICommandProcessor(api_key=Config.OPENAI_API_KEY)
-ai_processor.set_processor(excel_processor)
+@app.after_request
+def _enforce_memory_budget(response):
+    """Décharge les sessions les moins récentes si le budget mémoire est dépassé"""
+    try:
+        session_store.enforce_budget(keep=_session_id())
+    except Exception as e:
+        logger.error(f"Erreur lors de l'éviction des sessions: {str(e)}")
+    return response
+
+@app.after_request
+def _compress(response):
+    """Compression gzip/brotli des réponses JSON volumineuses, selon Accept-Encoding"""
+    return compress_response(
+        response,
+        request.accept_encodings,
+        min_bytes=Config.COMPRESSION_MIN_BYTES,
+        gzip_level=Config.COMPRESSION_GZIP_LEVEL,
+        brotli_quality=Config.COMPRESSION_BROTLI_QUALITY
+    )
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    """Endpoint pour uploader un fichier Excel ou CSV"""
+    """Endpoint pour uploader un fichier Excel ou CSV
+
+    Avec le champ de formulaire async=1, le fichier est parsé en tâche de
+    fond: la réponse (202) contient un jobId à suivre via /api/jobs/<jobId>.
+    """
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'Aucun fichier fourni'}), 400
@@ -436,24 +1508,30 @@ def upload_file():
         if file_ext not in allowed_extensions:
             return jsonify({'error': 'Format de fichier non supporté. Utilisez .xlsx, .xls ou .csv'}), 400
         
-        # Sauvegarder le fichier
-        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
+        # Les classeurs sont chargés en mémoire: seuls les CSV ont droit au mode hors mémoire
+        if file_ext != '.csv' and (request.content_length or 0) > Config.WORKBOOK_MAX_BYTES:
+            return jsonify({'error': f'Classeur trop volumineux (max {Config.WORKBOOK_MAX_BYTES // (1024 * 1024)} Mo). '
+                                     'Enregistrez-le en CSV pour l\'ouvrir en mode hors mémoire'}), 413
         
-        # Charger dans le processeur
-        file_type = 'csv' if file_ext == '.csv' else 'xlsx'
-        if excel_processor.load_file(file_path, file_type):
-            global current_filename
-            current_filename = filename
-            
-            data = excel_processor.get_data_for_frontend()
-            return jsonify({
-                'success': True,
-                'message': 'Fichier chargé avec succès',
-                'data': data,
-                'filename': filename
-            })
+        # Sauvegarder le fichier (dédupliqué par empreinte du contenu)
+        file_id, file_path = upload_cache.store(file, file_ext)
+        
+        # Charger dans le processeur de la session
+        session = _current_session()
+        file_type = file_ext.lstrip('.')
+        sheet = request.form.get('sheet') or None
+        if request.form.get('async') in ('1', 'true'):
+            job_id = file_jobs.submit(
+                session.session_id, 'upload', parse_upload,
+                (UPLOAD_FOLDER, file_path, file_type, file_id, sheet, Config.EXCEL_READER_ENGINE,
+                 Config.OUT_OF_CORE_THRESHOLD, Config.OUT_OF_CORE_CHUNK_ROWS),
+                on_done=lambda parsed, filename=file.filename: _finish_upload_job(
+                    session.session_id, file_path, file_type, file_id, filename, parsed['sheet']),
+                filename=file.filename)
+            return jsonify({'success': True, 'jobId': job_id, 'status': 'pending'}), 202
+        if session.processor.load_file(file_path, file_type, file_id=file_id, sheet=sheet):
+            session.filename = file.filename
+            return _upload_response(session.processor, _upload_info(session, file_id))
         else:
             return jsonify({'error': 'Erreur lors du chargement du fichier'}), 500
             
@@ -461,15 +1539,179 @@ def upload_file():
         logger.error(f"Erreur upload: {str(e)}")
         return jsonify({'error': f'Erreur serveur: {str(e)}'}), 500
 
-@app.route('/api/data', methods=['GET'])
+def _upload_info(session, file_id):
+    """Description du fichier chargé dans la session (sans les données)"""
+    return {
+        'success': True,
+        'message': 'Fichier chargé avec succès',
+        'filename': session.filename,
+        'fileId': file_id,
+        'sheets': session.processor.sheets,
+        'activeSheet': session.processor.active_sheet,
+        'outOfCore': session.processor.out_of_core
+    }
+
+def _upload_response(processor, info):
+    """Réponse d'upload: fenêtre AG-Grid, flux NDJSON ou données complètes"""
+    window = _window_request()
+    if window is None and _wants_ndjson(processor):
+        return _ndjson_response(processor, info)
+    if window is not None:
+        data = processor.get_rows_window(**window)
+    else:
+        data = processor.get_data_for_frontend(layout=_grid_layout())
+    return _grid_response(dict(info, data=data))
+
+def _finish_upload_job(session_id, file_path, file_type, file_id, filename, sheet):
+    """Fin d'un upload en tâche de fond: chargement dans la session depuis le cache (sans reparser)"""
+    session = session_store.get(session_id)
+    with _session_access(session, exclusive=True):
+        if not session.processor.load_file(file_path, file_type, file_id=file_id, sheet=sheet):
+            raise ValueError('Erreur lors du chargement du fichier')
+        session.filename = filename
+        return _upload_info(session, file_id)
+
+def _window_request():
+    """Paramètres de fenêtre AG-Grid (corps JSON ou query string), ou None"""
+    params = request.get_json(silent=True) if request.method == 'POST' else None
+    if params is None:
+        params = request.args.to_dict()
+        for key in ('sortModel', 'filterModel'):
+            if key in params:
+                params[key] = json.loads(params[key])
+    if 'startRow' not in params and 'endRow' not in params:
+        return None
+    return {
+        'start_row': params.get('startRow', 0),
+        'end_row': params.get('endRow'),
+        'sort_model': params.get('sortModel') or [],
+        'filter_model': params.get('filterModel') or {},
+        'layout': _grid_layout(params.get('layout', 'rows'))
+    }
+
+def _grid_layout(layout=None):
+    """Format des lignes: 'arrow' si le client demande Arrow IPC (en-tête Accept), sinon rows/columns"""
+    if arrow_transport.wants_arrow(request.accept_mimetypes):
+        return 'arrow'
+    return layout or request.args.get('layout', 'rows')
+
+def _grid_response(body):
+    """Réponse JSON, ou flux Arrow IPC si les lignes ont été construites au format arrow"""
+    data = body.get('data')
+    if not isinstance(data, dict) or data.get('layout') != 'arrow':
+        return jsonify(body)
+    # Tout sauf la table voyage en JSON dans les métadonnées du schéma Arrow
+    metadata = dict(body, data={key: value for key, value in data.items() if key != 'table'})
+    stream = arrow_transport.encode_stream(data['table'], app.json.dumps(metadata))
+    return Response(stream, mimetype=arrow_transport.ARROW_STREAM_MIMETYPE)
+
+def _wants_ndjson(processor):
+    """Vrai si le client demande un flux NDJSON (en-tête Accept) et que les données sont en mémoire
+
+    En mode hors mémoire la grille lit déjà le fichier par fenêtres: pas de flux complet.
+    """
+    best = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    return (best == NDJSON_MIMETYPE and request.accept_mimetypes[NDJSON_MIMETYPE] > 0
+            and processor.df is not None and not processor.out_of_core)
+
+def _ndjson_response(processor, info):
+    """Flux NDJSON des données: info et colonnes d'abord, lignes par blocs, résumé à la fin"""
+    layout = request.args.get('layout', 'rows')
+    records = processor.stream_records(layout=layout if layout in ('rows', 'columns') else 'rows')
+    
+    def with_info(records):
+        header = next(records)
+        yield dict(info, **header)
+        yield from records
+    
+    return Response(ndjson_lines(with_info(records), app.json.dumps), mimetype=NDJSON_MIMETYPE,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/data', methods=['GET', 'POST'])
 def get_data():
-    """Endpoint pour récupérer les données actuelles"""
+    """Endpoint pour récupérer les données actuelles (complètes ou par fenêtre)"""
     try:
-        data = excel_processor.get_data_for_frontend()
+        processor = _current_session().processor
+        window = _window_request()
+        if window is not None:
+            data = processor.get_rows_window(**window)
+        elif _wants_ndjson(processor):
+            return _ndjson_response(processor, {'success': True})
+        else:
+            layout = _grid_layout()
+            patch = processor.get_changes(request.args.get('sinceVersion'), layout=layout)
+            if patch is not None:
+                return jsonify({'success': True, 'patch': patch})
+            data = processor.get_data_for_frontend(layout=layout)
         if data:
-            return jsonify({'success': True, 'data': data})
+            return _grid_response({'success': True, 'data': data})
         else:
             return jsonify({'error': 'Aucune donnée chargée'}), 404
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': f'Paramètres de tri/filtre invalides: {e.args[0] if e.args else e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sheets', methods=['GET'])
+def list_sheets():
+    """Endpoint pour lister les feuilles du classeur courant"""
+    processor = _current_session().processor
+    if processor.source is None:
+        return jsonify({'error': 'Aucune donnée chargée'}), 404
+    return jsonify({
+        'success': True,
+        'sheets': processor.sheets,
+        'activeSheet': processor.active_sheet,
+        'engines': readers.available_engines()
+    })
+
+@app.route('/api/sheets/select', methods=['POST'])
+def select_sheet():
+    """Endpoint pour activer une feuille (parsée à la première demande)"""
+    try:
+        data = request.get_json()
+        processor = _current_session().processor
+        if not processor.select_sheet(data.get('sheet')):
+            return jsonify({'error': 'Feuille introuvable'}), 404
+        return _grid_response({
+            'success': True,
+            'activeSheet': processor.active_sheet,
+            'data': processor.get_data_for_frontend(layout=_grid_layout(data.get('layout', 'rows')))
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/preview', methods=['GET'])
+def preview_sheet():
+    """Endpoint d'aperçu rapide: premières lignes et colonnes choisies d'une feuille
+
+    usecols liste des noms de colonnes séparés par des virgules; letters
+    (classeurs Excel uniquement) des lettres ou plages de colonnes ("A:C,F").
+    """
+    try:
+        processor = _current_session().processor
+        nrows = min(int(request.args.get('nrows', 100)), Config.PREVIEW_MAX_ROWS)
+        usecols = request.args.get('usecols') or None
+        letters = request.args.get('letters') or None
+        if usecols and letters:
+            raise ValueError("usecols et letters ne peuvent pas être combinés")
+        if usecols:
+            usecols = [column.strip() for column in usecols.split(',') if column.strip()]
+        elif letters:
+            if processor.source and processor.source[1] == 'csv':
+                raise ValueError("letters ne s'applique qu'aux classeurs Excel")
+            usecols = letters.replace(' ', '').upper()
+        data = processor.preview(
+            sheet=request.args.get('sheet') or None,
+            usecols=usecols,
+            nrows=nrows,
+            layout=request.args.get('layout', 'rows')
+        )
+        if data is None:
+            return jsonify({'error': 'Aucune donnée chargée'}), 404
+        return jsonify({'success': True, 'data': data})
+    except ValueError as e:
+        return jsonify({'error': f'Paramètres d\'aperçu invalides: {str(e)}'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -482,17 +1724,54 @@ def update_cell():
         column = data.get('column')
         value = data.get('value')
         
-        if excel_processor.update_cell(row_id, column, value):
-            return jsonify({'success': True, 'message': 'Cellule mise à jour'})
+        processor = _current_session().processor
+        since_version = processor.version
+        if processor.update_cell(row_id, column, value):
+            result = {'success': True, 'message': 'Cellule mise à jour', 'version': processor.version}
+            if processor.has_formulas:
+                result['patch'] = processor.get_changes(since_version)
+            return jsonify(result)
         else:
             return jsonify({'error': 'Erreur lors de la mise à jour'}), 500
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/update-cells', methods=['POST'])
+def update_cells():
+    """Endpoint pour appliquer un lot de modifications (collage, recopie vers le bas)"""
+    try:
+        data = request.get_json() or {}
+        edits = data.get('edits', [])
+        if not isinstance(edits, list):
+            return jsonify({'error': 'Le champ edits doit être une liste'}), 400
+        
+        processor = _current_session().processor
+        since_version = processor.version
+        updated = processor.update_cells(edits)
+        logger.info(f"{updated} cellules mises à jour en un lot")
+        result = {
+            'success': True,
+            'message': f'{updated} cellules mises à jour',
+            'updated': updated,
+            'version': processor.version
+        }
+        if processor.has_formulas:
+            # Cellules recalculées par les formules: patch (None si un rechargement complet est nécessaire)
+            result['patch'] = processor.get_changes(since_version)
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/ai-command', methods=['POST'])
 def process_ai_command():
-    """Endpoint pour traiter les commandes IA en langage naturel"""
+    """Endpoint pour traiter les commandes IA en langage naturel
+
+    Avec "async": true, la commande est exécutée en arrière-plan: la réponse
+    (202) contient un jobId à suivre via /api/ai-jobs/<jobId>.
+    """
     try:
         data = request.get_json()
         command = data.get('command', '')
@@ -500,40 +1779,305 @@ def process_ai_command():
         if not command:
             return jsonify({'error': 'Commande vide'}), 400
         
-        # Informations sur le DataFrame actuel
-        df_info = {
-            'columns': list(excel_processor.df.columns) if excel_processor.df is not None else [],
-            'shape': excel_processor.df.shape if excel_processor.df is not None else (0, 0)
-        }
+        session = _current_session()
+        processor = session.processor
+        
+        if data.get('async'):
+            job_id = ai_jobs.submit(session.session_id, _run_ai_command_job, session, command)
+            return jsonify({'success': True, 'jobId': job_id, 'status': 'pending'}), 202
         
         # Traiter la commande
-        result = ai_processor.interpret_command(command, df_info)
+        result = _run_ai_command(session, command)
         
-        # Si une actualisation est nécessaire, renvoyer les nouvelles données
+        # Si une actualisation est nécessaire, renvoyer un patch depuis la version
+        # détenue par le client, ou les nouvelles données complètes à défaut
         if result.get('refresh_needed'):
-            result['data'] = excel_processor.get_data_for_frontend()
+            result.update(_refresh_payload(processor, data.get('version'), _grid_layout(data.get('layout', 'rows'))))
+        result['version'] = processor.version
         
-        return jsonify(result)
+        return _grid_response(result)
         
     except Exception as e:
         logger.error(f"Erreur commande IA: {str(e)}")
         return jsonify({'error': f'Erreur serveur: {str(e)}'}), 500
 
+def _run_ai_command(session, command):
+    """Interprète et exécute une commande sur le DataFrame de la session"""
+    processor = session.processor
+    
+    # Informations sur le DataFrame actuel
+    df_info = {
+        'columns': list(processor.df.columns) if processor.df is not None else [],
+        'shape': processor.df.shape if processor.df is not None else (0, 0),
+        'references': processor.reference_columns()
+    }
+    return session.ai_processor.interpret_command(command, df_info)
+
+def _run_ai_command_job(session, command):
+    """Commande IA en tâche de fond: la session est verrouillée et publiée comme pour une requête"""
+    with _session_access(session, exclusive=True):
+        return _run_ai_command(session, command)
+
+def _job_payload(job, session, since_version, layout):
+    """État d'une tâche IA, avec son résultat et la mise à jour des données une fois terminée
+
+    L'attente se fait sans verrou (la tâche écrit dans la session), la mise à
+    jour est lue ensuite sous verrou partagé, synchronisée avec les autres
+    workers comme une requête de lecture.
+    """
+    payload = ai_jobs.describe(job)
+    if job['status'] == 'done':
+        result = dict(job['result'])
+        with _session_access(session, exclusive=False):
+            processor = session.processor
+            if result.get('refresh_needed'):
+                result.update(_refresh_payload(processor, since_version, layout))
+            result['version'] = processor.version
+        payload.update(result)
+    return payload
+
+@app.route('/api/ai-jobs/<job_id>', methods=['GET'])
+def get_ai_job(job_id):
+    """Endpoint de suivi d'une commande IA asynchrone (attente optionnelle avec ?wait=secondes)"""
+    try:
+        session = _current_session()
+        job = ai_jobs.get(job_id, owner=session.session_id)
+        if job is None:
+            return jsonify({'error': 'Tâche inconnue ou expirée'}), 404
+        wait = min(float(request.args.get('wait', 0)), Config.AI_TIMEOUT_SECONDS)
+        if wait > 0:
+            ai_jobs.wait(job, wait)
+        return _grid_response(_job_payload(job, session, request.args.get('version'), _grid_layout()))
+    except ValueError as e:
+        return jsonify({'error': f'Paramètre wait invalide: {str(e)}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ai-jobs/<job_id>/stream', methods=['GET'])
+def stream_ai_job(job_id):
+    """Endpoint Server-Sent Events: état de la tâche puis son résultat dès qu'il est prêt"""
+    session = _current_session()
+    job = ai_jobs.get(job_id, owner=session.session_id)
+    if job is None:
+        return jsonify({'error': 'Tâche inconnue ou expirée'}), 404
+    since_version = request.args.get('version')
+    layout = request.args.get('layout', 'rows')
+    
+    def events():
+        yield f"event: status\ndata: {app.json.dumps(ai_jobs.describe(job))}\n\n"
+        # Commentaire SSE périodique pour garder la connexion ouverte
+        while not ai_jobs.wait(job, 5):
+            yield ": attente\n\n"
+        payload = _job_payload(job, session, since_version, layout)
+        yield f"event: result\ndata: {app.json.dumps(payload)}\n\n"
+    
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+def _refresh_payload(processor, since_version, layout):
+    """Patch depuis la version du client si possible, sinon les données complètes"""
+    patch = processor.get_changes(since_version, layout=layout)
+    if patch is not None:
+        return {'patch': patch}
+    return {'data': processor.get_data_for_frontend(layout=layout)}
+
+@app.route('/api/profile', methods=['GET'])
+def column_profile():
+    """Endpoint de profil des colonnes: effectif, vides, somme, min, max, moyenne, distinctes"""
+    try:
+        processor = _current_session().processor
+        if processor.df is None:
+            return jsonify({'error': 'Aucune donnée chargée'}), 404
+        columns = request.args.get('columns')
+        columns = [column.strip() for column in columns.split(',')] if columns else None
+        return jsonify({
+            'success': True,
+            'profile': processor.profile(columns),
+            'filtered': bool(processor.list_filters()),
+            'version': processor.version
+        })
+    except KeyError as e:
+        return jsonify({'error': f'Colonne inconnue: {e.args[0]}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/filters', methods=['GET'])
+def list_filters():
+    """Endpoint listant les filtres actifs et l'état de l'historique"""
+    processor = _current_session().processor
+    if processor.df is None:
+        return jsonify({'error': 'Aucune donnée chargée'}), 404
+    return jsonify({
+        'success': True,
+        'filters': processor.list_filters(),
+        'history': processor.history(),
+        'version': processor.version
+    })
+
+@app.route('/api/filters/clear', methods=['POST'])
+def clear_filters():
+    """Endpoint retirant tous les filtres (la base n'a jamais été modifiée)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        processor = _current_session().processor
+        if processor.df is None:
+            return jsonify({'error': 'Aucune donnée chargée'}), 404
+        processor.clear_filters()
+        result = {'success': True, 'filters': [], 'version': processor.version}
+        result.update(_refresh_payload(processor, data.get('version'), data.get('layout', 'rows')))
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/references', methods=['GET'])
+def list_references():
+    """Endpoint listant les fichiers de référence de la session (pour les jointures)"""
+    processor = _current_session().processor
+    return jsonify({'success': True, 'references': processor.list_references()})
+
+@app.route('/api/references', methods=['POST'])
+def upload_reference():
+    """Endpoint d'upload d'un fichier de référence (tarifs, référentiel...) joint ensuite à la feuille active
+
+    Champs de formulaire optionnels: name (nom de la référence, tiré du nom
+    de fichier par défaut) et sheet (feuille d'un classeur).
+    """
+    try:
+        if 'file' not in request.files or request.files['file'].filename == '':
+            return jsonify({'error': 'Aucun fichier fourni'}), 400
+        file = request.files['file']
+        file_ext = os.path.splitext(file.filename)[1].lower()
+        if file_ext not in {'.xlsx', '.xls', '.csv'}:
+            return jsonify({'error': 'Format de fichier non supporté. Utilisez .xlsx, .xls ou .csv'}), 400
+        if file_ext != '.csv' and (request.content_length or 0) > Config.WORKBOOK_MAX_BYTES:
+            return jsonify({'error': f'Classeur trop volumineux (max {Config.WORKBOOK_MAX_BYTES // (1024 * 1024)} Mo). '
+                                     'Enregistrez-le en CSV pour le joindre bloc par bloc'}), 413
+        
+        file_id, file_path = upload_cache.store(file, file_ext)
+        processor = _current_session().processor
+        reference = processor.load_reference(file_path, file_ext.lstrip('.'), file_id=file_id,
+                                             filename=file.filename, name=request.form.get('name') or None,
+                                             sheet=request.form.get('sheet') or None)
+        return jsonify({'success': True, 'reference': reference.describe(),
+                        'references': processor.list_references()})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erreur upload de référence: {str(e)}")
+        return jsonify({'error': f'Erreur serveur: {str(e)}'}), 500
+
+@app.route('/api/references/<name>', methods=['DELETE'])
+def remove_reference(name):
+    """Endpoint retirant un fichier de référence de la session"""
+    processor = _current_session().processor
+    try:
+        processor.remove_reference(name)
+    except JoinError as e:
+        return jsonify({'error': str(e)}), 404
+    return jsonify({'success': True, 'references': processor.list_references()})
+
+@app.route('/api/join', methods=['POST'])
+def join_reference():
+    """Endpoint de jointure: ajoute des colonnes d'un fichier de référence par colonne clé
+
+    Corps JSON: {"reference": "tarifs", "on": "Référence", "rightOn": "Réf",
+    "columns": ["Prix"], "version": ..., "layout": ...}; seule "on" peut
+    manquer si les deux fichiers ont une colonne commune, et "reference"
+    s'il n'y a qu'un fichier de référence. Même exécution (annulable) que
+    l'étape "join" des commandes IA.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        processor = _current_session().processor
+        if processor.df is None:
+            return jsonify({'error': 'Aucune donnée chargée'}), 404
+        step = {key: data.get(key) for key in ('reference', 'on', 'rightOn', 'columns')}
+        result = command_plan.PlanExecutor(processor).execute({'steps': [dict(step, op='join')]})
+        result.update(_refresh_payload(processor, data.get('version'), _grid_layout(data.get('layout', 'rows'))))
+        result['version'] = processor.version
+        return _grid_response(result)
+    except (command_plan.PlanError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Erreur jointure: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def _history_step(step):
+    """Annule ou rétablit une opération et renvoie la mise à jour pour le client"""
+    try:
+        data = request.get_json(silent=True) or {}
+        processor = _current_session().processor
+        if processor.df is None:
+            return jsonify({'error': 'Aucune donnée chargée'}), 404
+        operation = step(processor)
+        if operation is None:
+            return jsonify({'success': False, 'message': 'Historique vide', 'history': processor.history(),
+                            'version': processor.version})
+        result = {
+            'success': True,
+            'operation': operation,
+            'filters': processor.list_filters(),
+            'history': processor.history(),
+            'version': processor.version
+        }
+        result.update(_refresh_payload(processor, data.get('version'), data.get('layout', 'rows')))
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/undo', methods=['POST'])
+def undo():
+    """Endpoint d'annulation de la dernière opération"""
+    return _history_step(ExcelProcessor.undo)
+
+@app.route('/api/redo', methods=['POST'])
+def redo():
+    """Endpoint de rétablissement de la dernière opération annulée"""
+    return _history_step(ExcelProcessor.redo)
+
 @app.route('/api/export', methods=['POST'])
 def export_file():
-    """Endpoint pour exporter le fichier modifié"""
+    """Endpoint pour exporter le fichier modifié (xlsx, csv ou parquet)
+
+    Avec "async": true, le fichier est écrit en tâche de fond: la réponse
+    (202) contient un jobId; le fichier est ensuite téléchargé via
+    /api/jobs/<jobId>/result.
+    """
     try:
-        data = request.get_json()
-        filename = data.get('filename', f'export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx')
+        data = request.get_json() or {}
+        file_format = data.get('format')
+        filename = data.get('filename')
+        if not file_format:
+            extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+            file_format = extension if extension in EXPORT_FORMATS else 'xlsx'
+        if file_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'Format d\'export non supporté. Utilisez: {", ".join(EXPORT_FORMATS)}'}), 400
+        if not filename:
+            filename = f'export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{file_format}'
+        
+        session = _current_session()
+        processor = session.processor
+        if data.get('async'):
+            if processor.df is None:
+                return jsonify({'error': 'Aucune donnée à exporter'}), 400
+            # Copie superficielle: avec le Copy-on-Write, les modifications ultérieures ne l'atteignent pas
+            frame = processor.df.copy(deep=False) if isinstance(processor.df, pd.DataFrame) else processor.df
+            # Écriture dans un fil du worker: le DataFrame n'est pas sérialisé vers le pool de processus
+            job_id = file_jobs.submit(
+                session.session_id, 'export', export_dataset,
+                (EXPORT_FOLDER, Config.EXPORT_MAX_AGE_SECONDS, frame, processor.dataset_id, processor.version,
+                 file_format, processor.active_sheet, processor.export_formulas(file_format)),
+                threaded=True, filename=os.path.basename(filename), format=file_format)
+            return jsonify({'success': True, 'jobId': job_id, 'status': 'pending'}), 202
         
-        export_path = excel_processor.export_to_excel(filename)
+        export_path = processor.export(file_format)
         
         if export_path and os.path.exists(export_path):
+            # send_file diffuse le fichier par blocs, sans le charger en mémoire
             return send_file(
                 export_path,
                 as_attachment=True,
-                download_name=filename,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                download_name=os.path.basename(filename),
+                mimetype=EXPORT_FORMATS[file_format]
             )
         else:
             return jsonify({'error': 'Erreur lors de l\'export'}), 500
@@ -541,13 +2085,72 @@ def export_file():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_file_job(job_id):
+    """Endpoint de suivi d'une tâche de fichier: statut et avancement (attente optionnelle avec ?wait=secondes)"""
+    try:
+        wait = min(float(request.args.get('wait', 0)), 30)
+        job = file_jobs.wait(job_id, _session_id(), wait) if wait > 0 else file_jobs.get(job_id, owner=_session_id())
+        if job is None:
+            return jsonify({'error': 'Tâche inconnue ou expirée'}), 404
+        return jsonify(file_jobs.describe(job))
+    except ValueError as e:
+        return jsonify({'error': f'Paramètre wait invalide: {str(e)}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def file_job_result(job_id):
+    """Endpoint du résultat d'une tâche terminée: données chargées (upload) ou fichier exporté"""
+    try:
+        job = file_jobs.get(job_id, owner=_session_id())
+        if job is None:
+            return jsonify({'error': 'Tâche inconnue ou expirée'}), 404
+        if job['status'] != 'done':
+            return jsonify(dict(file_jobs.describe(job), error=job['error'] or 'Tâche non terminée')), 409
+        
+        if job['kind'] == 'export':
+            export_path = job['result']['path']
+            if not os.path.exists(export_path):
+                return jsonify({'error': 'Fichier exporté expiré, relancez l\'export'}), 410
+            return send_file(
+                export_path,
+                as_attachment=True,
+                download_name=job['meta']['filename'],
+                mimetype=EXPORT_FORMATS[job['meta']['format']]
+            )
+        return _upload_response(_current_session().processor, job['result'])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_file_job(job_id):
+    """Endpoint d'annulation d'une tâche de fichier (effective au prochain point d'avancement)"""
+    job = file_jobs.get(job_id, owner=_session_id())
+    if job is None:
+        return jsonify({'error': 'Tâche inconnue ou expirée'}), 404
+    if not file_jobs.cancel(job):
+        return jsonify(dict(file_jobs.describe(job), error='Tâche déjà terminée')), 409
+    return jsonify(dict(file_jobs.describe(job), cancelRequested=True)), 202
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
     """Endpoint pour vérifier le statut de l'application"""
+    session = _current_session()
     return jsonify({
         'status': 'active',
-        'has_data': excel_processor.df is not None,
-        'current_file': current_filename,
+        'has_data': session.processor.df is not None,
+        'current_file': session.filename,
+        'session': {
+            'memory_bytes': session.memory_usage(),
+            'load_memory': session.processor.load_report,
+            'indexes': session.processor.index_stats()
+        },
+        'memory': session_store.stats(),
+        'ai_cache': interpretation_cache.stats(),
+        'ai_router': intent_router.stats(),
+        'ai': dict(llm_gateway.stats(), jobs=ai_jobs.stats()),
+        'file_jobs': file_jobs.stats(),
         'timestamp': datetime.now().isoformat()
     })
 
@@ -558,9 +2161,19 @@ if __name__ == '__main__':
     print("📝 API endpoints:")
     print("   - POST /api/upload : Upload de fichier")
     print("   - GET  /api/data : Récupération des données")
+    print("   - GET  /api/sheets : Liste des feuilles")
+    print("   - GET  /api/preview : Aperçu rapide d'une feuille")
     print("   - POST /api/update-cell : Mise à jour de cellule")
-    print("   - POST /api/ai-command : Commandes IA")
-    print("   - POST /api/export : Export Excel")
+    print("   - POST /api/update-cells : Mise à jour de cellules par lot")
+    print("   - POST /api/ai-command : Commandes IA (\"async\": true pour une tâche de fond)")
+    print("   - GET  /api/ai-jobs/<id>[/stream] : Suivi d'une commande IA asynchrone")
+    print("   - GET  /api/profile : Statistiques des colonnes")
+    print("   - GET  /api/filters : Filtres actifs et historique")
+    print("   - POST /api/filters/clear : Retrait des filtres")
+    print("   - POST /api/undo | /api/redo : Annuler / rétablir")
+    print("   - POST /api/export : Export Excel / CSV / Parquet (\"async\": true pour une tâche de fond)")
+    print("   - GET  /api/jobs/<id>[/result] : Suivi et résultat d'un upload ou export asynchrone")
+    print("   - POST /api/jobs/<id>/cancel : Annulation d'une tâche de fichier")
     
     import os
     port = int(os.environ.get('PORT', 5000))
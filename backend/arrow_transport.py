@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Transport binaire Arrow IPC des données de la grille
+Un client qui envoie "Accept: application/vnd.apache.arrow.stream" reçoit les
+lignes sous forme de flux Arrow IPC au lieu d'objets JSON: chaque colonne est
+convertie d'un bloc depuis le DataFrame (aucune conversion ligne par ligne),
+les noms de colonnes ne sont transmis qu'une fois et le navigateur lit les
+tableaux sans parser de JSON. Le reste de la réponse (message, columnDefs,
+nombre de lignes, version...) est placé en JSON dans les métadonnées du
+schéma, sous la clé METADATA_KEY. JSON reste le format par défaut.
+"""
+
+import logging
+
+import column_types
+
+try:
+    import pyarrow as pa
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+logger = logging.getLogger(__name__)
+
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+METADATA_KEY = b'smart_excel'
+
+
+def wants_arrow(accept_mimetypes):
+    """Vrai si le client préfère explicitement Arrow IPC à JSON (et si pyarrow est installé)"""
+    if not HAS_ARROW:
+        return False
+    best = accept_mimetypes.best_match(['application/json', ARROW_STREAM_MIMETYPE])
+    return best == ARROW_STREAM_MIMETYPE and accept_mimetypes[ARROW_STREAM_MIMETYPE] > 0
+
+
+def _column_array(series):
+    """Colonne pandas -> tableau Arrow (types natifs: entiers, décimaux, dates, catégories)"""
+    try:
+        return pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # Colonne objet aux types mélangés: valeurs affichées dans la grille, en texte
+        return pa.array([str(value) for value in column_types.display_values(series)], type=pa.string())
+
+
+def frame_to_table(frame):
+    """DataFrame (ou fenêtre) -> table Arrow, avec la colonne 'id' de la grille en tête"""
+    arrays = [pa.array(frame.index.to_numpy())]
+    arrays.extend(_column_array(frame.iloc[:, i]) for i in range(frame.shape[1]))
+    return pa.Table.from_arrays(arrays, names=['id'] + [str(column) for column in frame.columns])
+
+
+def encode_stream(table, metadata_json):
+    """Sérialise une table au format Arrow IPC stream, métadonnées JSON dans le schéma"""
+    table = table.replace_schema_metadata({METADATA_KEY: metadata_json.encode('utf-8')})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Mode hors mémoire pour les CSV trop gros pour un DataFrame
+Au-delà de Config.OUT_OF_CORE_THRESHOLD, un CSV uploadé n'est pas chargé:
+il est converti une fois, bloc par bloc, en Parquet (un groupe de lignes par
+bloc) à côté de l'upload, puis interrogé en flux:
+- les fenêtres de la grille ne lisent que les groupes de lignes concernés
+- filtres, statistiques et agrégats parcourent les blocs en ne lisant que
+  les colonnes utiles
+La mémoire dépend de la taille d'un bloc, pas de celle du fichier; un filtre
+actif coûte un octet par ligne. Le dataset est en lecture seule.
+"""
+
+import logging
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import column_types
+import grid_query
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+logger = logging.getLogger(__name__)
+
+# Type de colonne inféré sur l'ensemble des blocs -> type pandas de lecture et type Arrow
+COLUMN_KINDS = {
+    'int': ('Int64', 'int64'),
+    'float': ('float64', 'float64'),
+    'bool': ('boolean', 'bool_'),
+    'text': ('str', 'string'),
+}
+# Valeurs distinctes suivies au plus par colonne (au-delà, le nombre n'est pas calculé)
+DISTINCT_LIMIT = 10000
+
+
+def _chunk_kind(series):
+    if series.isna().all():
+        return None  # Bloc vide: compatible avec tous les types
+    if pd.api.types.is_bool_dtype(series):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(series):
+        return 'int'
+    if pd.api.types.is_float_dtype(series):
+        return 'float'
+    return 'text'
+
+
+def _merge_kind(current, kind):
+    if kind is None:
+        return current
+    if current is None or current == kind:
+        return kind
+    if {current, kind} == {'int', 'float'}:
+        return 'float'
+    return 'text'
+
+
+def _csv_chunks(csv_path, chunk_rows, progress=None, **options):
+    """Blocs du CSV; progress(octets lus, taille) après chaque bloc"""
+    with open(csv_path, 'rb') as handle:
+        size = os.fstat(handle.fileno()).st_size
+        for chunk in pd.read_csv(handle, chunksize=chunk_rows, **options):
+            yield chunk
+            if progress is not None:
+                progress(min(handle.tell(), size), size)
+
+
+def infer_kinds(csv_path, chunk_rows, progress=None):
+    """Première passe: type de chaque colonne sur tous les blocs (entier, décimal, booléen, texte)"""
+    kinds = {}
+    for chunk in _csv_chunks(csv_path, chunk_rows, progress):
+        for column in chunk.columns:
+            kinds[column] = _merge_kind(kinds.get(column), _chunk_kind(chunk[column]))
+    return {column: kind or 'text' for column, kind in kinds.items()}
+
+
+def convert_csv(csv_path, parquet_path, chunk_rows, progress=None):
+    """Convertit un CSV en Parquet par blocs de chunk_rows lignes (deux passes, mémoire bornée)
+
+    Le type de chaque colonne est fixé sur l'ensemble du fichier avant
+    l'écriture, pour que tous les groupes de lignes partagent le même schéma.
+    progress(octets traités, total) couvre les deux passes (total = deux fois
+    la taille du CSV).
+    """
+    if not HAS_ARROW:
+        raise ValueError("Le mode hors mémoire nécessite pyarrow")
+    started = time.perf_counter()
+    first_pass = second_pass = None
+    if progress is not None:
+        first_pass = lambda done, size: progress(done, 2 * size)
+        second_pass = lambda done, size: progress(size + done, 2 * size)
+    kinds = infer_kinds(csv_path, chunk_rows, first_pass)
+    schema = pa.schema([(str(column), getattr(pa, COLUMN_KINDS[kind][1])()) for column, kind in kinds.items()])
+    dtypes = {column: COLUMN_KINDS[kind][0] for column, kind in kinds.items()}
+
+    temp_path = f'{parquet_path}.{uuid.uuid4().hex[:8]}.part'
+    rows = 0
+    try:
+        with pq.ParquetWriter(temp_path, schema) as writer:
+            for chunk in _csv_chunks(csv_path, chunk_rows, second_pass, dtype=dtypes):
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False),
+                                   row_group_size=chunk_rows)
+                rows += len(chunk)
+        os.replace(temp_path, parquet_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    logger.info(f"CSV converti pour le mode hors mémoire: {rows} lignes, {len(kinds)} colonnes "
+                f"en {time.perf_counter() - started:.1f}s")
+    return rows
+
+
+class ChunkedDataset:
+    """Fichier Parquet lu par groupes de lignes, éventuellement restreint à une vue filtrée
+
+    Expose la partie de l'interface DataFrame utilisée par le processeur
+    (columns, shape, len, head) et des lectures en flux. Les identifiants de
+    lignes sont les positions dans le fichier; positions (triées) restreint
+    le dataset aux lignes visibles.
+    """
+
+    def __init__(self, path, positions=None):
+        self.path = path
+        self.positions = positions
+        self._open()
+
+    def _open(self):
+        self._file = pq.ParquetFile(self.path, memory_map=True)
+        metadata = self._file.metadata
+        sizes = [metadata.row_group(group).num_rows for group in range(metadata.num_row_groups)]
+        self._offsets = np.concatenate(([0], np.cumsum(sizes, dtype=np.int64)))
+        self._schema = self._file.schema_arrow
+        self.columns = pd.Index(self._schema.names)
+        self._summaries = {}
+        self._last_group = (None, None)
+
+    def __getstate__(self):
+        # Le fichier est rouvert au rechargement (session déchargée sur disque)
+        return {'path': self.path, 'positions': self.positions}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self.positions = state['positions']
+        self._open()
+
+    def __len__(self):
+        return int(self._offsets[-1]) if self.positions is None else len(self.positions)
+
+    @property
+    def shape(self):
+        return (len(self), len(self.columns))
+
+    @property
+    def row_count(self):
+        """Nombre de lignes du fichier (toutes vues confondues)"""
+        return int(self._offsets[-1])
+
+    def view(self, mask):
+        """Vue des lignes du masque (masque sur toutes les lignes du fichier)"""
+        return ChunkedDataset(self.path, np.flatnonzero(mask))
+
+    def dtype(self, column):
+        return str(self._schema.field(column).type)
+
+    def is_integer(self, column):
+        return pa.types.is_integer(self._schema.field(column).type)
+
+    def is_numeric(self, column):
+        kind = self._schema.field(column).type
+        return pa.types.is_integer(kind) or pa.types.is_floating(kind)
+
+    def memory_usage(self):
+        return self.positions.nbytes if self.positions is not None else 0
+
+    def _read_group(self, group, columns=None):
+        key = (group, tuple(columns) if columns is not None else None)
+        if self._last_group[0] == key:
+            return self._last_group[1]
+        frame = self._file.read_row_group(group, columns=columns).to_pandas()
+        frame.index = pd.RangeIndex(self._offsets[group], self._offsets[group + 1])
+        # Le défilement de la grille relit souvent le même groupe de lignes
+        self._last_group = (key, frame)
+        return frame
+
+    def chunks(self, columns=None):
+        """Blocs successifs des lignes visibles (index = identifiants de lignes)"""
+        for group in range(len(self._offsets) - 1):
+            if self.positions is not None:
+                start, end = np.searchsorted(self.positions, self._offsets[group:group + 2])
+                if start == end:
+                    continue
+            frame = self._file.read_row_group(group, columns=columns).to_pandas()
+            frame.index = pd.RangeIndex(self._offsets[group], self._offsets[group + 1])
+            if self.positions is not None:
+                frame = frame.iloc[self.positions[start:end] - self._offsets[group]]
+            yield frame
+
+    def take(self, rows, columns=None):
+        """Lignes aux positions données dans la vue, dans l'ordre demandé"""
+        rows = np.asarray(rows, dtype=np.int64)
+        ids = rows if self.positions is None else self.positions[rows]
+        if len(ids) == 0:
+            frame = self._schema.empty_table().to_pandas()
+            return frame if columns is None else frame[columns]
+        order = np.argsort(ids, kind='stable')
+        sorted_ids = ids[order]
+        groups = np.searchsorted(self._offsets, sorted_ids, side='right') - 1
+        bounds = np.flatnonzero(np.diff(groups)) + 1
+        parts = []
+        for group_ids, group in zip(np.split(sorted_ids, bounds), groups[np.concatenate(([0], bounds))]):
+            parts.append(self._read_group(group, columns).iloc[group_ids - self._offsets[group]])
+        frame = pd.concat(parts) if len(parts) > 1 else parts[0]
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        return frame.iloc[inverse]
+
+    def head(self, n=5):
+        return self.take(np.arange(min(n, len(self))))
+
+    def mask(self, predicate, columns=None):
+        """Masque sur toutes les lignes du fichier: predicate(bloc) évalué bloc par bloc"""
+        parts = [np.asarray(predicate(self._read_group(group, columns)), dtype=bool)
+                 for group in range(len(self._offsets) - 1)]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=bool)
+
+    def condition_mask(self, column, condition):
+        """Masque d'une condition AG-Grid, en ne lisant que la colonne concernée"""
+        if column not in self.columns:
+            raise KeyError(column)
+        return self.mask(lambda frame: grid_query.condition_mask(frame[column], condition), columns=[column])
+
+    def summaries(self, columns):
+        """Statistiques (format ColumnStats) de plusieurs colonnes des lignes visibles, en un parcours"""
+        missing = [column for column in columns if column not in self._summaries]
+        unknown = [column for column in missing if column not in self.columns]
+        if unknown:
+            raise KeyError(unknown[0])
+        if missing:
+            entries = {column: {'count': 0, 'nulls': 0, 'total': None, 'min': None, 'max': None, 'uniques': set()}
+                       for column in missing}
+            numeric = {column for column in missing
+                       if pa.types.is_integer(self._schema.field(column).type)
+                       or pa.types.is_floating(self._schema.field(column).type)}
+            for frame in self.chunks(missing):
+                for column in missing:
+                    self._accumulate(entries[column], frame[column], column in numeric, self.is_integer(column))
+            for column in missing:
+                self._summaries[column] = self._finish(column, entries[column], column in numeric)
+        return {column: self._summaries[column] for column in columns}
+
+    def summarize(self, column):
+        return self.summaries([column])[column]
+
+    @staticmethod
+    def _accumulate(entry, series, numeric, integer):
+        present = series.dropna()
+        entry['count'] += len(present)
+        entry['nulls'] += len(series) - len(present)
+        if numeric:
+            values = present.astype(np.int64) if integer else column_types.as_float64(present)
+            total = int(values.sum()) if integer else float(values.sum())
+            entry['total'] = total if entry['total'] is None else entry['total'] + total
+            if len(values):
+                low, high = column_types.python_scalar(values.min()), column_types.python_scalar(values.max())
+                entry['min'] = low if entry['min'] is None else min(entry['min'], low)
+                entry['max'] = high if entry['max'] is None else max(entry['max'], high)
+        if entry['uniques'] is not None:
+            entry['uniques'].update(pd.unique(present))
+            if len(entry['uniques']) > DISTINCT_LIMIT:
+                entry['uniques'] = None
+
+    def _finish(self, column, entry, numeric):
+        total = entry['total'] if numeric else None
+        if numeric and total is None:
+            total = 0
+        return {
+            'dtype': self.dtype(column),
+            'rows': len(self),
+            'count': entry['count'],
+            'nulls': entry['nulls'],
+            'sum': total,
+            'min': entry['min'],
+            'max': entry['max'],
+            'distinct': len(entry['uniques']) if entry['uniques'] is not None else None,
+            'mean': total / entry['count'] if total is not None and entry['count'] else None
+        }
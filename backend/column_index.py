@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Index de colonnes réutilisables pour les filtres répétés
+- SortedIndex (colonnes numériques et dates): positions triées par valeur,
+  une plage ou une égalité se résout par searchsorted en O(log n + k)
+- HashIndex (colonnes texte/catégories): positions groupées par valeur
+  normalisée, une égalité ou un ensemble de valeurs en O(1 + k)
+Les index portent sur le DataFrame de base (les filtres sont des vues) et
+sont construits à la deuxième requête sur une colonne: un filtre isolé garde
+le simple parcours, moins coûteux qu'un tri. Le processeur invalide l'index
+d'une colonne à chaque modification de celle-ci.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Requêtes sur une colonne avant de construire son index
+INDEX_MIN_USES = 2
+
+
+def _is_number(series):
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def _is_naive_date(series):
+    return pd.api.types.is_datetime64_any_dtype(series) and not isinstance(series.dtype, pd.DatetimeTZDtype)
+
+
+def _text_keys(series):
+    """Même normalisation que les filtres texte de grid_query: minuscules, vides -> ''"""
+    return series.astype(object).where(series.notna(), '').astype(str).str.lower()
+
+
+def positions_mask(positions, size, negate=False):
+    mask = np.zeros(size, dtype=bool)
+    mask[positions] = True
+    return ~mask if negate else mask
+
+
+class SortedIndex:
+    """Positions des valeurs non nulles triées (argsort stable)"""
+
+    def __init__(self, series):
+        self.size = len(series)
+        self.is_date = _is_naive_date(series)
+        values = series.to_numpy() if self.is_date else pd.to_numeric(series, errors='coerce').to_numpy(
+            dtype=np.float64, na_value=np.nan)
+        valid = ~pd.isna(values)
+        positions = np.flatnonzero(valid)
+        values = values[valid]
+        order = np.argsort(values, kind='stable')
+        self.positions = positions[order]
+        self.values = values[order]
+
+    def _target(self, value):
+        return np.datetime64(pd.Timestamp(value).to_datetime64()) if self.is_date else float(value)
+
+    def between(self, low=None, high=None, low_closed=True, high_closed=True):
+        """Positions des valeurs dans l'intervalle (bornes None = non bornées)"""
+        start = 0 if low is None else np.searchsorted(
+            self.values, self._target(low), side='left' if low_closed else 'right')
+        end = len(self.values) if high is None else np.searchsorted(
+            self.values, self._target(high), side='right' if high_closed else 'left')
+        return self.positions[start:max(start, end)]
+
+    def top(self, n, largest=True):
+        """Positions des n plus grandes (ou plus petites) valeurs"""
+        if largest:
+            return self.positions[::-1][:n]
+        return self.positions[:n]
+
+    def condition_mask(self, condition):
+        """Masque d'une condition AG-Grid number/date, ou None si non prise en charge"""
+        kind = condition.get('type', 'equals')
+        if self.is_date:
+            target = condition.get('dateFrom') or condition.get('filter')
+            high = condition.get('dateTo') or condition.get('filterTo')
+        else:
+            target, high = condition.get('filter'), condition.get('filterTo')
+        if target is None:
+            return None
+
+        if kind == 'inRange':
+            if high is None:
+                return None
+            positions = self.between(target, high)
+        elif kind == 'equals':
+            positions = self.between(target, target)
+        elif kind == 'notEqual':
+            # NaN != valeur est vrai dans grid_query: complément de l'égalité
+            return positions_mask(self.between(target, target), self.size, negate=True)
+        elif kind == 'greaterThan':
+            positions = self.between(low=target, low_closed=False)
+        elif kind == 'greaterThanOrEqual' and not self.is_date:
+            positions = self.between(low=target)
+        elif kind == 'lessThan':
+            positions = self.between(high=target, high_closed=False)
+        elif kind == 'lessThanOrEqual' and not self.is_date:
+            positions = self.between(high=target)
+        else:
+            return None
+        return positions_mask(positions, self.size)
+
+
+class HashIndex:
+    """Positions groupées par valeur texte normalisée"""
+
+    def __init__(self, series):
+        self.size = len(series)
+        codes, uniques = pd.factorize(_text_keys(series))
+        order = np.argsort(codes, kind='stable')
+        self.positions = order
+        self.bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        self.codes = {key: code for code, key in enumerate(uniques)}
+
+    def lookup(self, value):
+        """Positions des lignes dont la valeur (sans casse) vaut value"""
+        code = self.codes.get(str(value).lower())
+        if code is None:
+            return self.positions[:0]
+        return self.positions[self.bounds[code]:self.bounds[code + 1]]
+
+    def condition_mask(self, condition):
+        """Masque d'une condition AG-Grid texte (égalité) ou ensemble, ou None"""
+        if condition.get('filterType') == 'set':
+            values = condition.get('values', [])
+            positions = np.concatenate([self.lookup(value) for value in values]) if values else self.positions[:0]
+            return positions_mask(positions, self.size)
+        kind = condition.get('type', 'contains')
+        if kind not in ('equals', 'notEqual'):
+            return None
+        return positions_mask(self.lookup(condition.get('filter', '')), self.size, negate=kind == 'notEqual')
+
+
+class IndexCache:
+    """Index des colonnes d'un DataFrame de base, construits à la demande"""
+
+    def __init__(self):
+        self._indexes = {}
+        self._uses = {}
+        self.counters = {'builds': 0, 'hits': 0, 'scans': 0}
+        self._lock = threading.Lock()  # Lectures simultanées (workers à threads)
+
+    def invalidate(self, columns=None):
+        """Oublie les index des colonnes modifiées (toutes si columns est None)"""
+        with self._lock:
+            if columns is None:
+                self._indexes.clear()
+                self._uses.clear()
+                return
+            for column in columns:
+                self._indexes.pop(column, None)
+                self._uses.pop(column, None)
+
+    def get(self, frame, column, force=False):
+        """Index de la colonne (construit à partir de INDEX_MIN_USES requêtes), ou None
+
+        L'index est construit sous le verrou: des lectures simultanées sur la
+        même colonne attendent la construction au lieu de la répéter.
+        """
+        with self._lock:
+            index = self._indexes.get(column)
+            if index is not None:
+                self.counters['hits'] += 1
+                return index
+            self._uses[column] = self._uses.get(column, 0) + 1
+            if not force and self._uses[column] < INDEX_MIN_USES:
+                self.counters['scans'] += 1
+                return None
+
+            series = frame[column]
+            if _is_number(series) or _is_naive_date(series):
+                index = SortedIndex(series)
+            elif isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_object_dtype(series) \
+                    or pd.api.types.is_string_dtype(series):
+                index = HashIndex(series)
+            else:
+                return None
+            self._indexes[column] = index
+            self.counters['builds'] += 1
+            return index
+
+    def condition_mask(self, frame, column, condition):
+        """Masque d'une condition AG-Grid via l'index de la colonne, ou None (parcours classique)"""
+        if 'conditions' in condition or 'condition1' in condition or condition.get('type') in ('blank', 'notBlank'):
+            return None
+        filter_type = condition.get('filterType', 'text')
+        series = frame[column]
+        if filter_type in ('number', 'date') and not (_is_number(series) or _is_naive_date(series)):
+            return None
+        if filter_type == 'date' and not _is_naive_date(series):
+            return None
+        if filter_type == 'number' and _is_naive_date(series):
+            return None
+        if filter_type in ('text', 'set') and (_is_number(series) or _is_naive_date(series)):
+            return None
+        index = self.get(frame, column)
+        if index is None:
+            return None
+        return index.condition_mask(condition)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, indexed_columns=[str(column) for column in self._indexes])
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Statistiques par colonne maintenues de façon incrémentale
+Effectif, nulls, somme, min, max, moyenne et nombre de valeurs distinctes
+sont calculés une fois par colonne puis mis à jour à partir des seules
+cellules modifiées (valeurs avant/après). Une modification qui retire le
+minimum ou le maximum ne marque que ce champ à recalculer; les valeurs
+distinctes sont recalculées à la demande après une modification.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+import column_types
+
+def _is_tracked_number(series):
+    """Colonnes dont somme/min/max sont suivis (numériques hors booléens)"""
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def _as_number(value):
+    value = column_types.python_scalar(value)
+    return None if isinstance(value, float) and np.isnan(value) else value
+
+
+def _extreme(series, name):
+    if _is_tracked_number(series):
+        values = series.dropna()
+        return _as_number(getattr(values, name)()) if len(values) else None
+    if pd.api.types.is_datetime64_any_dtype(series):
+        value = getattr(series, name)()
+        return None if pd.isna(value) else value.isoformat()
+    return None
+
+
+def summarize(series):
+    """Résumé complet d'une colonne (une passe vectorisée par statistique)"""
+    count = int(series.notna().sum())
+    entry = {
+        'dtype': str(series.dtype),
+        'rows': len(series),
+        'count': count,
+        'nulls': len(series) - count,
+        'sum': None,
+        'min': _extreme(series, 'min'),
+        'max': _extreme(series, 'max'),
+        'distinct': int(series.nunique(dropna=True)),
+        'stale': set()
+    }
+    if _is_tracked_number(series):
+        if pd.api.types.is_integer_dtype(series):
+            entry['sum'] = int(series.sum())
+        else:
+            entry['sum'] = float(column_types.as_float64(series).sum())
+    return entry
+
+
+class ColumnStats:
+    """Statistiques des colonnes d'un DataFrame, calculées à la demande et tenues à jour"""
+
+    def __init__(self):
+        self._columns = {}
+        # Lectures simultanées (workers à threads): get complète les champs périmés
+        self._lock = threading.Lock()
+
+    def build(self, df):
+        """Calcule les statistiques de toutes les colonnes (au chargement)"""
+        columns = {column: summarize(df[column]) for column in df.columns}
+        with self._lock:
+            self._columns = columns
+
+    def get(self, df, column):
+        """Statistiques publiques d'une colonne (les champs périmés sont recalculés)"""
+        series = df[column]
+        with self._lock:
+            entry = self._columns.get(column)
+            if entry is None or entry['dtype'] != str(series.dtype) or entry['rows'] != len(series):
+                entry = self._columns[column] = summarize(series)
+            for field in list(entry['stale']):
+                if field == 'distinct':
+                    entry['distinct'] = int(series.nunique(dropna=True))
+                else:
+                    entry[field] = _extreme(series, field)
+                entry['stale'].discard(field)
+
+            public = {key: value for key, value in entry.items() if key != 'stale'}
+        public['mean'] = public['sum'] / public['count'] if public['sum'] is not None and public['count'] else None
+        return public
+
+    def invalidate(self, columns):
+        """Oublie les statistiques de colonnes remplacées ou supprimées"""
+        with self._lock:
+            for column in columns:
+                self._columns.pop(column, None)
+
+    def update_cells(self, column, before, after):
+        """Met à jour une colonne à partir des valeurs avant/après des cellules modifiées
+
+        before et after sont des tableaux alignés (mêmes lignes); le type de la
+        colonne doit être inchangé, sinon appeler invalidate.
+        """
+        with self._lock:
+            self._update_cells(column, before, after)
+
+    def _update_cells(self, column, before, after):
+        entry = self._columns.get(column)
+        if entry is None:
+            return
+        before_missing = pd.isna(before)
+        after_missing = pd.isna(after)
+        delta = int(before_missing.sum()) - int(after_missing.sum())
+        entry['count'] += delta
+        entry['nulls'] -= delta
+        entry['stale'].add('distinct')
+
+        if entry['sum'] is None:
+            entry['stale'].update(('min', 'max'))
+            return
+
+        before_values = column_types.as_float64(pd.Series(before)).to_numpy()[~before_missing]
+        after_values = column_types.as_float64(pd.Series(after)).to_numpy()[~after_missing]
+        integer = isinstance(entry['sum'], int)
+        if integer:
+            entry['sum'] += int(after_values.sum()) - int(before_values.sum())
+        else:
+            entry['sum'] += float(after_values.sum()) - float(before_values.sum())
+
+        for field, pick, beats in (('min', np.min, np.less_equal), ('max', np.max, np.greater_equal)):
+            if field in entry['stale']:
+                continue
+            current = entry[field]
+            if len(after_values) and (current is None or beats(pick(after_values), current)):
+                # La nouvelle valeur extrême est présente dans la colonne: résultat exact
+                entry[field] = int(pick(after_values)) if integer else float(pick(after_values))
+            elif len(before_values) and current is not None and beats(pick(before_values), current):
+                # L'ancienne valeur extrême a peut-être disparu
+                entry['stale'].add(field)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Typage compact des colonnes au chargement
+Conserve les vrais types avec des valeurs nulles (au lieu de fillna('')),
+réduit les entiers/décimaux quand c'est sans perte et convertit le texte
+peu varié en catégories. Les nulls ne deviennent '' qu'à la sérialisation.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Une colonne texte devient catégorielle si (valeurs distinctes / lignes) <= ce ratio
+CATEGORY_RATIO = 0.5
+# En dessous de ce nombre de lignes, la conversion en catégorie ne rapporte rien
+CATEGORY_MIN_ROWS = 50
+
+
+def _is_text(series):
+    return pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+
+
+def _compact_integer(series):
+    return pd.to_numeric(series, downcast='integer')
+
+
+def _compact_float(series):
+    """float64 -> float32 uniquement si chaque valeur est représentée exactement"""
+    if series.dtype != np.float64:
+        return series
+    values = series.to_numpy()
+    narrowed = values.astype(np.float32)
+    same = (narrowed.astype(np.float64) == values) | np.isnan(values)
+    if same.all():
+        return series.astype(np.float32)
+    return series
+
+
+def _compact_text(series):
+    """Texte peu varié -> catégorie (les codes comme '00123' restent du texte)"""
+    non_null = series.dropna()
+    if len(non_null) == 0:
+        return series
+
+    if len(series) >= CATEGORY_MIN_ROWS and non_null.nunique() <= CATEGORY_RATIO * len(series):
+        if non_null.map(type).eq(str).all():
+            return series.astype('category')
+    return series
+
+
+def _compact_numeric(series):
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        return _compact_integer(series)
+    if pd.api.types.is_float_dtype(series):
+        return _compact_float(series)
+    return series
+
+
+def compact_dtypes(df):
+    """Renvoie (DataFrame compacté, rapport mémoire avant/après en octets)"""
+    before = int(df.memory_usage(deep=True).sum())
+    result = df.copy(deep=False)
+    for position in range(df.shape[1]):
+        series = df.iloc[:, position]
+        if _is_text(series):
+            result.isetitem(position, _compact_text(series))
+        elif pd.api.types.is_numeric_dtype(series):
+            result.isetitem(position, _compact_numeric(series))
+
+    after = int(result.memory_usage(deep=True).sum())
+    report = {
+        'before_bytes': before,
+        'after_bytes': after,
+        'saved_bytes': before - after,
+        'dtypes': {str(column): str(dtype) for column, dtype in result.dtypes.items()}
+    }
+    return result, report
+
+
+def python_values(series, null='', naive_datetimes=False):
+    """Valeurs Python natives d'une colonne, les nulls remplacés par null
+
+    naive_datetimes retire le fuseau horaire des dates (requis par openpyxl).
+    """
+    if naive_datetimes and isinstance(series.dtype, pd.DatetimeTZDtype):
+        series = series.dt.tz_localize(None)
+    mask = series.isna().to_numpy()
+    if not mask.any():
+        return series.tolist()
+    values = series.to_numpy(dtype=object, copy=True)
+    values[mask] = null
+    return values.tolist()
+
+
+def display_values(series):
+    """Valeurs Python natives d'une colonne, les nulls remplacés par ''"""
+    return python_values(series, null='')
+
+
+def python_scalar(value):
+    """Convertit un scalaire NumPy (np.int64, np.float32...) en type Python natif"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def as_float64(series):
+    """Vue float64 d'une colonne pour les calculs (évite l'arithmétique en float32/int8)"""
+    return pd.to_numeric(series, errors='coerce').astype(np.float64)
+
+
+def _guess_numbers(raw):
+    """Colonnes non typées: les textes numériques deviennent des nombres"""
+    numeric = pd.to_numeric(raw, errors='coerce')
+    return raw.where(numeric.isna(), numeric.astype(object))
+
+
+def _numeric_target(dtype, converted):
+    """Type numérique capable de stocker sans perte la colonne et les nouvelles valeurs"""
+    values = converted.dropna()
+    if pd.api.types.is_integer_dtype(dtype) and len(values) < len(converted):
+        dtype = np.dtype(np.float64)
+    if len(values) == 0:
+        return dtype
+    if pd.api.types.is_integer_dtype(dtype):
+        if (values % 1 != 0).any():
+            return np.dtype(np.float64)
+        info = np.iinfo(dtype)
+        if values.min() >= info.min and values.max() <= info.max:
+            return dtype
+        return np.result_type(dtype, pd.to_numeric(values.astype(np.int64), downcast='integer').dtype)
+    if dtype == np.float32:
+        narrowed = values.to_numpy(dtype=np.float64).astype(np.float32).astype(np.float64)
+        if not (narrowed == values.to_numpy(dtype=np.float64)).all():
+            return np.dtype(np.float64)
+    return dtype
+
+
+def coerce_for_column(series, raw_values):
+    """Convertit un lot de valeurs brutes (JSON) vers le type de la colonne
+
+    Renvoie (colonne, valeurs converties). La colonne renvoyée est élargie
+    (int -> float, nombre -> object, nouvelles catégories...) si les valeurs
+    ne rentrent pas dans son type actuel.
+    """
+    raw = pd.Series(list(raw_values), dtype=object)
+    empty = (raw.isna() | raw.eq('')).to_numpy()
+    raw = raw.where(~empty, None)
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        new_categories = pd.unique(raw[~empty])
+        missing = [value for value in new_categories if value not in series.cat.categories]
+        if missing:
+            series = series.cat.add_categories(missing)
+        return series, raw.to_numpy()
+
+    if pd.api.types.is_bool_dtype(series):
+        mapping = {'true': True, 'vrai': True, '1': True, 'false': False, 'faux': False, '0': False}
+        converted = raw.astype(str).str.lower().map(mapping)
+        if converted[~empty].notna().all() and not empty.any():
+            return series, converted.to_numpy(dtype=bool)
+        return series.astype(object), _guess_numbers(raw).to_numpy()
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        converted = pd.to_datetime(raw, errors='coerce')
+        if converted[~empty].notna().all():
+            if isinstance(series.dtype, pd.DatetimeTZDtype) and converted.dt.tz is None:
+                converted = converted.dt.tz_localize(series.dt.tz)
+            return series, converted.astype(series.dtype).array
+        return series.astype(object), raw.to_numpy()
+
+    if pd.api.types.is_numeric_dtype(series):
+        converted = pd.to_numeric(raw, errors='coerce')
+        if converted[~empty].notna().all():
+            target = _numeric_target(series.dtype, converted)
+            if target != series.dtype:
+                series = series.astype(target)
+            return series, converted.to_numpy(dtype=series.dtype)
+        return series.astype(object), _guess_numbers(raw).to_numpy()
+
+    if pd.api.types.is_object_dtype(series):
+        return series, _guess_numbers(raw).to_numpy()
+
+    # Colonne texte typée (pandas StringDtype): les valeurs restent du texte
+    return series, raw.map(lambda value: value if value is None else str(value)).to_numpy()
@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+"""
+Plans de commande et leur exécution vectorisée
+Une commande (venue du modèle ou du routeur local) est compilée en un plan:
+une liste d'étapes JSON exécutées dans l'ordre sur le DataFrame visible.
+
+    {"steps": [
+        {"op": "filter", "conditions": [{"column": "Prix", "filterType": "number",
+                                          "type": "greaterThan", "filter": 100}],
+         "combine": "and"},
+        {"op": "sort", "by": [{"column": "Prix", "ascending": false}]},
+        {"op": "compute", "column": "TTC", "expression": "[Prix HT] * 1.18"},
+        {"op": "aggregate", "function": "sum", "column": "Prix", "groupBy": ["Région"]},
+        {"op": "top", "column": "Prix", "n": 10, "largest": true},
+        {"op": "lookup", "column": "Produit", "value": "Clavier"},
+        {"op": "join", "reference": "tarifs", "on": "Référence", "columns": ["Prix"]}
+    ]}
+
+Filtres, tris, colonnes calculées et jointures avec un fichier de référence
+passent par l'ExcelProcessor (annulables);
+les agrégats sont calculés sur la vue courante, colonne par colonne, ou bloc
+par bloc pour un dataset hors mémoire.
+"""
+
+import ast
+import re
+
+import numpy as np
+import pandas as pd
+
+import column_types
+import grid_query
+from ai_cache import normalize_command
+
+AGGREGATES = ('sum', 'mean', 'min', 'max', 'count', 'median')
+AGGREGATE_LABELS = {
+    'sum': 'Somme', 'mean': 'Moyenne', 'min': 'Minimum',
+    'max': 'Maximum', 'count': 'Nombre de valeurs', 'median': 'Médiane'
+}
+# Agrégats lus dans les statistiques de colonne du processeur
+SUMMARY_AGGREGATES = ('sum', 'mean', 'min', 'max', 'count')
+STEP_OPS = ('filter', 'sort', 'compute', 'aggregate', 'top', 'lookup', 'join')
+# Lignes renvoyées au plus par top / lookup
+MAX_RESULT_ROWS = 1000
+# Nombre de groupes détaillés dans le message (le résultat complet est renvoyé)
+MESSAGE_GROUPS = 10
+
+OPERATOR_TYPES = {
+    '>': 'greaterThan', '>=': 'greaterThanOrEqual', '<': 'lessThan',
+    '<=': 'lessThanOrEqual', '=': 'equals', '==': 'equals', '!=': 'notEqual'
+}
+CONDITION_SYMBOLS = {
+    'greaterThan': '>', 'greaterThanOrEqual': '>=', 'lessThan': '<',
+    'lessThanOrEqual': '<=', 'equals': '=', 'notEqual': '!=', 'contains': 'contient'
+}
+
+_BINARY = {
+    ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide,
+    ast.FloorDiv: np.floor_divide, ast.Mod: np.mod, ast.Pow: np.power,
+}
+_FUNCTIONS = {'abs': np.abs, 'round': np.round, 'sqrt': np.sqrt}
+
+
+class PlanError(ValueError):
+    """Plan invalide: opération inconnue, colonne absente, expression refusée"""
+
+
+def resolve_name(name, columns):
+    """Colonne désignée par name (exacte, sinon sans casse ni accents)"""
+    if name in columns:
+        return name
+    wanted = normalize_command(str(name))
+    for column in columns:
+        if normalize_command(str(column)) == wanted:
+            return column
+    raise PlanError(f"Colonne inconnue: {name}")
+
+
+def compile_action(action):
+    """Traduit une réponse au format action ({"action", "column", ...}) en plan, ou None
+
+    Une réponse contenant déjà des étapes ({"steps": [...]}) est renvoyée telle quelle.
+    """
+    if not isinstance(action, dict):
+        return None
+    if isinstance(action.get('steps'), list):
+        return {'steps': action['steps']}
+
+    kind = action.get('action')
+    column = action.get('column')
+    operation = action.get('operation')
+    if kind in ('calculate', 'aggregate') and operation in AGGREGATES:
+        step = {'op': 'aggregate', 'function': operation, 'column': column or None,
+                'groupBy': action.get('groupBy') or []}
+        steps = [step]
+        if action.get('condition') and column:
+            # Comptage conditionnel: agrégat sur les lignes vérifiant la condition, sans filtrer la vue
+            step['where'] = [dict(action['condition'], column=column)]
+        return {'steps': steps}
+    if kind == 'filter' and column:
+        condition = action.get('condition')
+        if condition is None and action.get('operator') in OPERATOR_TYPES:
+            condition = {'filterType': 'number', 'type': OPERATOR_TYPES[action['operator']],
+                         'filter': action.get('value')}
+        if condition is not None:
+            return {'steps': [{'op': 'filter', 'conditions': [dict(condition, column=column)]}]}
+    if kind == 'sort' and column:
+        ascending = action.get('ascending', True) not in (False, 'false', 'desc')
+        return {'steps': [{'op': 'sort', 'by': [{'column': column, 'ascending': ascending}]}]}
+    if kind == 'top' and column:
+        return {'steps': [{'op': 'top', 'column': column, 'n': action.get('n', 10),
+                           'largest': action.get('largest', True)}]}
+    if kind == 'join':
+        return {'steps': [{'op': 'join', 'reference': action.get('reference'), 'on': action.get('on'),
+                           'rightOn': action.get('rightOn'), 'columns': action.get('columns')}]}
+    if kind == 'add_column' and column:
+        if action.get('expression'):
+            return {'steps': [{'op': 'compute', 'column': column, 'expression': action['expression']}]}
+        if operation == 'percentage' and action.get('value') not in (None, ''):
+            return {'steps': [{'op': 'compute', 'column': column, 'source': action.get('source'),
+                               'percentage': float(action['value'])}]}
+    return None
+
+
+def evaluate_expression(expression, frame):
+    """Évalue une expression arithmétique sur les colonnes de frame (float64 vectorisé)
+
+    Les noms de colonnes contenant des espaces s'écrivent entre crochets:
+    "[Prix HT] * (1 + TVA / 100)". Seuls nombres, colonnes, + - * / // % **
+    et abs/round/sqrt sont acceptés.
+    """
+    placeholders = {}
+
+    def placeholder(match):
+        key = f'__colonne{len(placeholders)}'
+        placeholders[key] = match.group(1)
+        return key
+
+    source = re.sub(r'\[([^\]]+)\]', placeholder, str(expression))
+    try:
+        tree = ast.parse(source, mode='eval')
+    except SyntaxError as e:
+        raise PlanError(f"Expression invalide: {expression}") from e
+    columns = list(frame.columns)
+
+    def visit(node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+                and not isinstance(node.value, bool):
+            return float(node.value)
+        if isinstance(node, ast.Name):
+            column = resolve_name(placeholders.get(node.id, node.id), columns)
+            return column_types.as_float64(frame[column]).to_numpy()
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            return _BINARY[type(node.op)](visit(node.left), visit(node.right))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            value = visit(node.operand)
+            return -value if isinstance(node.op, ast.USub) else value
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS \
+                and not node.keywords:
+            args = [visit(arg) for arg in node.args]
+            if node.func.id == 'round' and len(args) == 2:
+                return np.round(args[0], int(args[1]))
+            if len(args) != 1:
+                raise PlanError(f"Nombre d'arguments invalide pour {node.func.id}")
+            return _FUNCTIONS[node.func.id](args[0])
+        raise PlanError(f"Élément non autorisé dans l'expression: {ast.dump(node)[:60]}")
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        values = visit(tree.body)
+    values = np.broadcast_to(np.asarray(values, dtype=np.float64), (len(frame),)).copy()
+    # Division par zéro: cellule vide plutôt qu'un infini
+    values[~np.isfinite(values)] = np.nan
+    return pd.Series(values, index=frame.index)
+
+
+def conditions_mask(frame, conditions, combine='and', mask_of=None):
+    """Masque NumPy de plusieurs conditions AG-Grid ({"column", "type", ...}) combinées
+
+    mask_of(colonne, condition), s'il est fourni, calcule le masque d'une
+    condition (par exemple via les index du processeur) à la place du parcours.
+    """
+    masks = []
+    for condition in conditions:
+        column = resolve_name(condition.get('column'), list(frame.columns))
+        spec = {key: value for key, value in condition.items() if key != 'column'}
+        if mask_of is not None:
+            masks.append(mask_of(column, spec))
+        else:
+            masks.append(grid_query.condition_mask(frame[column], spec))
+    if not masks:
+        return np.ones(len(frame), dtype=bool)
+    if str(combine).lower() == 'or':
+        return np.logical_or.reduce(masks)
+    return np.logical_and.reduce(masks)
+
+
+def describe_conditions(conditions, combine='and'):
+    parts = [f"{condition.get('column')} {CONDITION_SYMBOLS.get(condition.get('type'), condition.get('type'))} "
+             f"{condition.get('filter')}" for condition in conditions]
+    return f" {'ou' if str(combine).lower() == 'or' else 'et'} ".join(parts)
+
+
+def aggregate_series(series, function):
+    """Agrégat d'une colonne en type Python natif (calcul en float64 sauf entiers)"""
+    if function == 'count':
+        return int(series.notna().sum())
+    if function in ('min', 'max') and not pd.api.types.is_numeric_dtype(series):
+        values = series.dropna().astype(object)
+        return column_types.python_scalar(getattr(values, function)()) if len(values) else None
+    if not pd.api.types.is_integer_dtype(series) or function in ('mean', 'median'):
+        series = column_types.as_float64(series)
+    value = column_types.python_scalar(getattr(series, function)())
+    return None if isinstance(value, float) and np.isnan(value) else value
+
+
+def _aggregate_values(frame, column, function):
+    values = frame[column]
+    if function != 'count' and (function in ('mean', 'median') or not pd.api.types.is_integer_dtype(values)):
+        values = column_types.as_float64(values)
+    return values
+
+
+def _group_aggregate(frame, column, function, group_by):
+    """Agrégat par groupes: liste de {clé: valeur, ..., function: résultat}"""
+    if column is None:
+        grouped = frame.groupby(group_by, observed=True, sort=True, dropna=False).size()
+    else:
+        keys = [frame[key] for key in group_by]
+        grouped = _aggregate_values(frame, column, function).groupby(
+            keys, observed=True, sort=True, dropna=False).agg(function)
+    return _group_rows(grouped, function, group_by)
+
+
+# Agrégats partiels d'un bloc et leur combinaison entre blocs
+PARTIALS = {'sum': ('sum',), 'mean': ('sum', 'count'), 'min': ('min',), 'max': ('max',), 'count': ('count',)}
+COMBINE = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+
+
+def stream_aggregate(dataset, column, function, group_by=(), mask=None):
+    """Agrégat d'un dataset hors mémoire, combiné bloc par bloc
+
+    Chaque bloc produit des agrégats partiels par groupe (somme et effectif
+    pour la moyenne), fusionnés au fur et à mesure: la mémoire dépend du
+    nombre de groupes, pas du nombre de lignes. mask (sur toutes les lignes du
+    fichier) restreint les lignes. Renvoie une Series par groupe si group_by,
+    sinon un scalaire.
+    """
+    if function not in PARTIALS:
+        raise PlanError(f"{AGGREGATE_LABELS[function]}: agrégat non disponible en mode hors mémoire")
+    needed = list(dict.fromkeys([key for key in [column, *group_by] if key is not None])) or [dataset.columns[0]]
+    accumulated = None
+    for frame in dataset.chunks(needed):
+        if mask is not None:
+            frame = frame[mask[frame.index.to_numpy()]]
+        keys = [frame[key] for key in group_by] or [np.zeros(len(frame), dtype=np.int8)]
+        if column is None:
+            partial = frame.groupby(keys, observed=True, dropna=False).size().to_frame('count')
+        else:
+            partial = _aggregate_values(frame, column, function).groupby(
+                keys, observed=True, dropna=False).agg(list(PARTIALS[function]))
+        if accumulated is not None:
+            partial = pd.concat([accumulated, partial])
+            partial = partial.groupby(level=list(range(partial.index.nlevels)), dropna=False).agg(
+                {name: COMBINE[name] for name in partial.columns})
+        accumulated = partial
+
+    if accumulated is None or accumulated.empty:
+        result = pd.Series(dtype=np.float64)
+    elif function == 'mean':
+        result = accumulated['sum'] / accumulated['count']
+    else:
+        result = accumulated[function]
+        # Blocs entiers et blocs avec vides (lus en décimal): résultat entier pour une colonne entière
+        if column is not None and dataset.is_integer(column) and result.notna().all():
+            result = result.astype(np.int64)
+    if group_by:
+        return result.sort_index()
+    if result.empty:
+        return 0 if function in ('count', 'sum') else None
+    value = column_types.python_scalar(result.iloc[0])
+    return None if isinstance(value, float) and np.isnan(value) else value
+
+
+def _group_rows(grouped, function, group_by):
+    """Series d'agrégats par groupe -> liste de {clé: valeur, ..., function: résultat}"""
+    rows = []
+    for key, value in grouped.items():
+        key = key if isinstance(key, tuple) else (key,)
+        row = {str(name): (None if pd.isna(part) else column_types.python_scalar(part))
+               for name, part in zip(group_by, key)}
+        value = column_types.python_scalar(value)
+        row[function] = None if isinstance(value, float) and np.isnan(value) else value
+        rows.append(row)
+    return rows
+
+
+def _records(frame):
+    """Lignes d'un DataFrame en dictionnaires de valeurs Python (identifiant de ligne inclus)"""
+    columns = {'id': frame.index.tolist()}
+    columns.update((str(column), column_types.python_values(frame[column], null=None)) for column in frame.columns)
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+class PlanExecutor:
+    """Exécute les étapes d'un plan sur l'ExcelProcessor d'une session"""
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    def execute(self, plan):
+        """Renvoie le résultat au format des commandes IA (success, message, result...)"""
+        if self.processor.df is None:
+            return {'success': False, 'message': 'Aucune donnée chargée'}
+        steps = plan.get('steps') or []
+        if not steps:
+            raise PlanError("Plan vide")
+
+        messages, results, refresh = [], [], False
+        for step in steps:
+            handler = getattr(self, f"_{step.get('op')}", None)
+            if handler is None or step.get('op') not in STEP_OPS:
+                raise PlanError(f"Opération inconnue: {step.get('op')}")
+            message, result, modifies = handler(step)
+            messages.append(message)
+            refresh = refresh or modifies
+            if result is not None:
+                results.append(result)
+
+        response = {
+            'success': True,
+            'message': '. '.join(messages),
+            'operation': 'calculation' if results and not refresh else steps[-1]['op'],
+            'plan': {'steps': steps}
+        }
+        if results:
+            response['result'] = results[0] if len(results) == 1 else results
+        if refresh:
+            response['refresh_needed'] = True
+        return response
+
+    def _filter(self, step):
+        conditions = step.get('conditions') or []
+        combine = step.get('combine', 'and')
+        if not conditions:
+            raise PlanError("Filtre sans condition")
+        columns = list(self.processor.df.columns)
+        conditions = [dict(condition, column=resolve_name(condition.get('column'), columns))
+                      for condition in conditions]
+        description = describe_conditions(conditions, combine)
+        remaining = self.processor.add_filter(
+            lambda frame: conditions_mask(frame, conditions, combine, mask_of=self.processor.condition_mask),
+            description
+        )
+        return f'Filtre appliqué: {description}. {remaining} lignes restantes', None, True
+
+    def _sort(self, step):
+        columns = list(self.processor.df.columns)
+        by = step.get('by') or []
+        if not by:
+            raise PlanError("Tri sans colonne")
+        sort_model = [{'colId': resolve_name(item.get('column'), columns),
+                       'sort': 'asc' if item.get('ascending', True) not in (False, 'false', 'desc') else 'desc'}
+                      for item in by]
+        self.processor.sort_rows(sort_model)
+        description = ', '.join(f"{item['colId']} ({'croissant' if item['sort'] == 'asc' else 'décroissant'})"
+                                for item in sort_model)
+        return f'Lignes triées par {description}', None, True
+
+    def _compute(self, step):
+        name = step.get('column')
+        if not name:
+            raise PlanError("Colonne calculée sans nom")
+        if 'percentage' in step:
+            source = self._price_column(step.get('source'))
+            rate = float(step['percentage']) / 100
+            self.processor.set_column(name, lambda frame: column_types.as_float64(frame[source]) * rate)
+            return f"Colonne {name} ajoutée avec {step['percentage']:g}% de {source}", None, True
+
+        expression = step.get('expression')
+        if not expression:
+            raise PlanError(f"Colonne {name}: expression manquante")
+        # Validation sur une ligne avant de calculer toute la colonne
+        evaluate_expression(expression, self.processor.df.head(1))
+        self.processor.set_column(name, lambda frame: evaluate_expression(expression, frame))
+        return f'Colonne {name} calculée: {expression}', None, True
+
+    def _top(self, step):
+        """N plus grandes (ou plus petites) valeurs d'une colonne, via son index trié"""
+        frame = self.processor.df
+        column = resolve_name(step.get('column'), list(frame.columns))
+        n = min(int(step.get('n', 10)), MAX_RESULT_ROWS)
+        largest = step.get('largest', True) not in (False, 'false')
+        positions = self.processor.top_positions(column, n, largest)
+        rows = _records(frame.iloc[positions])
+        values = ', '.join(str(row[str(column)]) for row in rows[:MESSAGE_GROUPS])
+        label = 'plus grandes' if largest else 'plus petites'
+        return f'{len(rows)} {label} valeurs de {column}: {values}', rows, False
+
+    def _lookup(self, step):
+        """Lignes dont une colonne texte vaut une valeur donnée, via son index de hachage"""
+        frame = self.processor.df
+        column = resolve_name(step.get('column'), list(frame.columns))
+        positions = self.processor.lookup_positions(column, step.get('value', ''))
+        rows = _records(frame.iloc[positions[:MAX_RESULT_ROWS]])
+        return f"{len(positions)} lignes où {column} = {step.get('value', '')}", rows, False
+
+    def _join(self, step):
+        """Colonnes d'un fichier de référence ajoutées ligne à ligne par clé (RECHERCHEV vectorisée)"""
+        columns = step.get('columns') or ([step['column']] if step.get('column') else None)
+        if isinstance(columns, str):
+            columns = [columns]
+        summary = self.processor.join_reference(step.get('reference'), step.get('on'), step.get('rightOn'), columns)
+        message = (f"{', '.join(summary['columns'])} ajouté(es) depuis {summary['reference']} "
+                   f"par {summary['on']}: {summary['matched']}/{summary['rows']} lignes trouvées")
+        if summary['duplicates']:
+            message += f" ({summary['duplicates']} clés en double dans {summary['reference']}: première ligne retenue)"
+        return message, summary, True
+
+    def _price_column(self, source):
+        columns = list(self.processor.df.columns)
+        if source:
+            return resolve_name(source, columns)
+        for column in columns:
+            if any(word in str(column).lower() for word in ['prix', 'price', 'montant', 'amount', 'total']):
+                return column
+        raise PlanError("Aucune colonne de prix ou de montant trouvée")
+
+    def _aggregate(self, step):
+        function = step.get('function')
+        if function not in AGGREGATES:
+            raise PlanError(f"Agrégat inconnu: {function}")
+        frame = self.processor.df
+        columns = list(frame.columns)
+        column = resolve_name(step['column'], columns) if step.get('column') else None
+        if column is None and function != 'count':
+            raise PlanError(f"{AGGREGATE_LABELS[function]}: colonne manquante")
+        group_by = [resolve_name(key, columns) for key in step.get('groupBy') or []]
+        label = AGGREGATE_LABELS[function] if column is not None else 'Nombre de lignes'
+        target = f' de la colonne "{column}"' if column is not None else ''
+        streamed = self.processor.out_of_core and (group_by or step.get('where') or function not in SUMMARY_AGGREGATES)
+        mask = None
+        if step.get('where') and self.processor.out_of_core:
+            # Masque sur toutes les lignes du fichier, appliqué bloc par bloc
+            mask = conditions_mask(frame, step['where'], step.get('combine', 'and'),
+                                   mask_of=self.processor.condition_mask)
+        elif step.get('where'):
+            frame = frame[conditions_mask(frame, step['where'], step.get('combine', 'and'))]
+
+        if group_by:
+            if streamed:
+                rows = _group_rows(stream_aggregate(frame, column, function, group_by, mask), function, group_by)
+            else:
+                rows = _group_aggregate(frame, column, function, group_by)
+            details = ', '.join(f"{' / '.join(str(row[str(key)]) for key in group_by)}: {row[function]}"
+                                for row in rows[:MESSAGE_GROUPS])
+            more = f' (+{len(rows) - MESSAGE_GROUPS} groupes)' if len(rows) > MESSAGE_GROUPS else ''
+            return f"{label}{target} par {', '.join(group_by)}: {details}{more}", rows, False
+
+        if streamed:
+            result = stream_aggregate(frame, column, function, (), mask)
+        elif column is None:
+            result = len(frame)
+        else:
+            result = None
+            if function in SUMMARY_AGGREGATES and not step.get('where'):
+                # Statistiques tenues à jour par le processeur: pas de nouveau parcours de la colonne
+                result = self.processor.column_summary(column)[function]
+            if result is None and not self.processor.out_of_core:
+                result = aggregate_series(frame[column], function)
+        return f'{label}{target}: {result}', result, False
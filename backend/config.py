@@ -10,14 +10,63 @@ class Config:
     
     # Configuration Flask
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'smart-excel-secret-key-dev'
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_UPLOAD_MB', 4096)) * 1024 * 1024  # Gros CSV compris
+    WORKBOOK_MAX_BYTES = 16 * 1024 * 1024  # Classeurs xlsx/xls, toujours chargés en mémoire
     
     # Configuration des dossiers
     UPLOAD_FOLDER = 'uploads'
     EXPORT_FOLDER = 'exports'
+    SESSION_FOLDER = 'sessions'
+    EXPORT_MAX_AGE_SECONDS = int(os.environ.get('EXPORT_MAX_AGE_SECONDS', 24 * 3600))
+    
+    # Configuration de la lecture des classeurs
+    EXCEL_READER_ENGINE = os.environ.get('EXCEL_READER_ENGINE', 'auto')  # auto, calamine, openpyxl, xlrd
+    PREVIEW_MAX_ROWS = 1000
+    
+    # Mode hors mémoire: CSV convertis en Parquet par blocs et interrogés en flux
+    OUT_OF_CORE_THRESHOLD = int(os.environ.get('OUT_OF_CORE_THRESHOLD_MB', 256)) * 1024 * 1024
+    OUT_OF_CORE_CHUNK_ROWS = 100000  # Lignes par bloc (groupe de lignes Parquet)
+    
+    # Fichiers de référence joints à la feuille active (RECHERCHEV sur toute une colonne)
+    MAX_REFERENCES = 8  # Par session
+    # CSV de référence au-delà de ce seuil: lus et joints bloc par bloc, jamais chargés en entier
+    REFERENCE_OUT_OF_CORE_THRESHOLD = int(os.environ.get('REFERENCE_OUT_OF_CORE_THRESHOLD_MB', 64)) * 1024 * 1024
+    
+    # Configuration des sessions (un classeur par utilisateur)
+    SESSION_MEMORY_BUDGET = int(os.environ.get('SESSION_MEMORY_BUDGET_MB', 512)) * 1024 * 1024
+    SESSION_IDLE_SECONDS = int(os.environ.get('SESSION_IDLE_SECONDS', 30 * 60))  # Déchargement sur disque
+    SESSION_EXPIRY_SECONDS = int(os.environ.get('SESSION_EXPIRY_SECONDS', 24 * 3600))  # Suppression
+    # Sessions partagées entre workers gunicorn (actives par défaut si WEB_CONCURRENCY > 1)
+    SHARED_SESSIONS = os.environ.get(
+        'SHARED_SESSIONS', '1' if int(os.environ.get('WEB_CONCURRENCY', 1)) > 1 else '0') == '1'
+    SHARED_SESSION_FOLDER = 'shared_sessions'
+    
+    # Tâches de fond sur les fichiers (parsing, conversion, export) dans un pool de processus
+    FILE_JOB_FOLDER = 'file_jobs'
+    FILE_JOB_WORKERS = int(os.environ.get('FILE_JOB_WORKERS', 2))  # Processus de travail par worker
+    FILE_JOB_TTL_SECONDS = 3600  # Conservation des tâches terminées
+    
+    # Configuration des réponses HTTP
+    JSON_ENGINE = os.environ.get('JSON_ENGINE', 'auto')  # auto, orjson, json
+    COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))  # Réponses plus petites non compressées
+    COMPRESSION_GZIP_LEVEL = 5  # 1 (rapide) à 9 (compact)
+    COMPRESSION_BROTLI_QUALITY = 4  # 0 (rapide) à 11 (compact)
+    STREAM_FIRST_CHUNK_ROWS = 200  # Premier bloc NDJSON réduit: affichage immédiat
+    STREAM_CHUNK_ROWS = 5000  # Lignes par bloc NDJSON ensuite
     
     # Configuration OpenAI
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY') or 'your-openai-api-key-here'
+    AI_CACHE_FOLDER = 'ai_cache'
+    AI_CACHE_SIZE = 256  # Entrées gardées en mémoire (LRU)
+    AI_CACHE_TTL_SECONDS = int(os.environ.get('AI_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+    AI_TIMEOUT_SECONDS = float(os.environ.get('AI_TIMEOUT_SECONDS', 15))  # Délai maximal d'un appel
+    AI_MAX_CONCURRENCY = int(os.environ.get('AI_MAX_CONCURRENCY', 4))  # Appels simultanés au modèle
+    AI_BREAKER_FAILURES = 5  # Échecs consécutifs avant ouverture du disjoncteur
+    AI_BREAKER_RESET_SECONDS = 30  # Durée d'ouverture avant un appel d'essai
+    AI_JOB_WORKERS = int(os.environ.get('AI_JOB_WORKERS', 4))
+    AI_JOB_TTL_SECONDS = 600  # Conservation des tâches terminées
+    AI_JOB_FOLDER = 'ai_jobs_state'  # État des tâches IA, lu par tous les workers (sessions partagées)
+    INTENT_CONFIDENCE_THRESHOLD = float(os.environ.get('INTENT_CONFIDENCE_THRESHOLD', 0.8))  # Routage local
     
     # Configuration CORS
     CORS_ORIGINS = [
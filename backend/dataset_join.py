@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Jointures avec des fichiers de référence (RECHERCHEV sur toute une colonne)
+Un second fichier uploadé dans la session (tarifs, référentiel clients...)
+enrichit la feuille active: pour chaque ligne, la première ligne de la
+référence ayant la même clé fournit les colonnes demandées.
+
+Les clés sont normalisées (texte sans casse ni espaces autour, nombres
+entiers sans décimales: 123, 123.0 et " 123 " se rejoignent). Une
+référence en mémoire garde un index de hachage par colonne clé, construit
+à la première jointure et réutilisé ensuite. Une référence hors mémoire
+(gros CSV lu par blocs) est parcourue bloc par bloc: seules les lignes dont
+la clé est cherchée sont gardées, la mémoire dépend du nombre de clés
+distinctes de la feuille, pas de la taille de la référence.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+import column_types
+from ai_cache import normalize_command
+from chunked_dataset import ChunkedDataset
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+
+class JoinError(ValueError):
+    """Jointure impossible: référence ou colonne inconnue, clé absente"""
+
+
+def reference_name(filename):
+    """Nom court d'une référence tiré de son nom de fichier ("Tarifs 2024.xlsx" -> "tarifs_2024")"""
+    stem = filename.rsplit('.', 1)[0] if '.' in filename else filename
+    return re.sub(r'[^\w]+', '_', normalize_command(stem)).strip('_') or 'reference'
+
+
+def resolve_reference(name, references):
+    """Référence désignée par name (exacte, sinon sans casse ni accents); seule référence par défaut"""
+    if not name:
+        if len(references) == 1:
+            return next(iter(references.values()))
+        raise JoinError(f"Précisez le fichier de référence: {', '.join(references) or 'aucun fichier chargé'}")
+    if name in references:
+        return references[name]
+    wanted = reference_name(str(name))
+    for key, reference in references.items():
+        if key == wanted or reference_name(reference.filename or '') == wanted:
+            return reference
+    raise JoinError(f"Fichier de référence inconnu: {name}")
+
+
+def key_kind(left_numeric, right_numeric):
+    """Type des clés comparées: 'number' si les deux colonnes sont numériques, sinon 'text'"""
+    return 'number' if left_numeric and right_numeric else 'text'
+
+
+def is_numeric(series):
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def join_keys(series, kind='text'):
+    """Clés de jointure normalisées d'une colonne
+
+    kind='number': float64 (NaN pour une cellule vide); kind='text': Series
+    'string' sans casse ni espaces autour (nombres entiers sans décimales),
+    <NA> pour une cellule vide.
+    """
+    if kind == 'number':
+        return column_types.as_float64(series).to_numpy()
+    if not is_numeric(series):
+        text = series.astype('string').str.strip().str.lower()
+        return text.where(text != '').reset_index(drop=True)
+    values = column_types.as_float64(series).to_numpy()
+    keys = np.full(len(values), None, dtype=object)
+    finite = np.isfinite(values)
+    whole = finite & (np.mod(values, 1, where=finite, out=np.ones_like(values)) == 0) \
+        & (np.abs(values, where=finite, out=np.zeros_like(values)) < 2 ** 53)
+    keys[whole] = values[whole].astype(np.int64).astype(str)
+    keys[finite & ~whole] = values[finite & ~whole].astype(str)
+    return pd.Series(keys, dtype='string')
+
+
+class KeyIndex:
+    """Index de hachage de clés normalisées: clé -> position de sa première occurrence
+
+    Les clés texte sont cherchées par la table de hachage Arrow (index_in)
+    quand pyarrow est disponible, les clés numériques par un index float64.
+    """
+
+    def __init__(self, keys):
+        present = np.flatnonzero(pd.notna(keys))
+        keys = pd.Index(keys)[present]
+        first = ~keys.duplicated()
+        self.keys = keys[first]
+        self.positions = present[first]
+        self.duplicates = int((~first).sum())  # Occurrences ignorées (clé déjà vue plus haut)
+        self._arrow = pa.array(self.keys, from_pandas=True) \
+            if HAS_ARROW and not pd.api.types.is_numeric_dtype(self.keys) else None
+
+    @classmethod
+    def build(cls, series, kind):
+        return cls(join_keys(series, kind))
+
+    def codes(self, keys):
+        """Rang de chaque clé parmi les clés distinctes, -1 si absente"""
+        if self._arrow is None:
+            return self.keys.get_indexer(keys)
+        found = pc.index_in(pa.array(keys, from_pandas=True, type=self._arrow.type), value_set=self._arrow)
+        return pc.fill_null(found, -1).to_numpy(zero_copy_only=False).astype(np.int64, copy=False)
+
+    def get_indexer(self, keys):
+        """Position de la première occurrence de chaque clé, -1 sans correspondance"""
+        found = self.codes(keys)
+        return np.where(found >= 0, self.positions[np.maximum(found, 0)], -1)
+
+
+class ReferenceDataset:
+    """Fichier de référence d'une session: DataFrame ou ChunkedDataset, et index de ses clés"""
+
+    def __init__(self, name, frame, filename=None, load_report=None):
+        self.name = name
+        self.frame = frame
+        self.filename = filename
+        self.load_report = load_report
+        self._indexes = {}
+
+    @property
+    def out_of_core(self):
+        return isinstance(self.frame, ChunkedDataset)
+
+    @property
+    def columns(self):
+        return list(self.frame.columns)
+
+    def column(self, name):
+        """Colonne de la référence désignée par name (exacte, sinon sans casse ni accents)"""
+        if name in self.frame.columns:
+            return name
+        wanted = normalize_command(str(name))
+        for column in self.frame.columns:
+            if normalize_command(str(column)) == wanted:
+                return column
+        raise JoinError(f"Colonne inconnue dans {self.name}: {name}")
+
+    def is_numeric(self, column):
+        if self.out_of_core:
+            return self.frame.is_numeric(column)
+        return is_numeric(self.frame[column])
+
+    def key_index(self, column, kind):
+        """Index de la colonne clé, construit à la première jointure puis réutilisé"""
+        index = self._indexes.get((column, kind))
+        if index is None:
+            index = self._indexes[(column, kind)] = KeyIndex.build(self.frame[column], kind)
+        return index
+
+    def memory_usage(self):
+        if self.out_of_core:
+            return 0
+        indexes = sum(index.positions.nbytes + index.keys.memory_usage(deep=True) for index in self._indexes.values())
+        return int(self.frame.memory_usage(deep=True).sum()) + indexes
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'filename': self.filename,
+            'rows': len(self.frame),
+            'columns': [str(column) for column in self.frame.columns],
+            'outOfCore': self.out_of_core,
+            'indexedKeys': list(dict.fromkeys(str(column) for column, _ in self._indexes))
+        }
+
+
+def _stream_matches(keys, dataset, right_key, columns, kind):
+    """Première ligne de chaque clé cherchée, lue bloc par bloc
+
+    Renvoie (lignes trouvées, position de chaque clé de keys dans ces lignes
+    ou -1). Le parcours s'arrête dès que toutes les clés sont trouvées.
+    """
+    wanted = KeyIndex(keys)
+    pending = np.ones(len(wanted.keys), dtype=bool)
+    parts, codes = [], []
+    for chunk in dataset.chunks(list(dict.fromkeys([right_key, *columns]))):
+        hits = wanted.codes(join_keys(chunk[right_key], kind))
+        keep = hits >= 0
+        keep[keep] = pending[hits[keep]]
+        if not keep.any():
+            continue
+        rows = np.flatnonzero(keep)
+        chunk_codes, first = np.unique(hits[rows], return_index=True)
+        pending[chunk_codes] = False
+        parts.append(chunk.iloc[rows[first]][columns])
+        codes.append(chunk_codes)
+        if not pending.any():
+            break
+    if not parts:
+        matched = pd.DataFrame({column: pd.Series(dtype=object) for column in columns})
+        return matched, np.full(len(keys), -1)
+    matched = pd.concat(parts, ignore_index=True)
+    slots = np.full(len(wanted.keys), -1)
+    slots[np.concatenate(codes)] = np.arange(len(matched))
+    found = wanted.codes(keys)
+    return matched, np.where(found >= 0, slots[np.maximum(found, 0)], -1)
+
+
+def lookup_columns(left, reference, right_key, columns):
+    """Valeurs des colonnes de la référence pour chaque ligne de left (Series clé)
+
+    Renvoie ({colonne: Series alignée sur left}, lignes avec correspondance,
+    doublons de clés ignorés dans la référence ou None en mode bloc par bloc).
+    """
+    kind = key_kind(is_numeric(left), reference.is_numeric(right_key))
+    keys = join_keys(left, kind)
+    if reference.out_of_core:
+        matched, positions = _stream_matches(keys, reference.frame, right_key, columns, kind)
+        duplicates = None
+    else:
+        index = reference.key_index(right_key, kind)
+        matched, positions, duplicates = reference.frame, index.get_indexer(keys), index.duplicates
+    values = {}
+    for column in columns:
+        series = matched[column].reset_index(drop=True)
+        values[column] = series.reindex(positions).set_axis(left.index)
+    return values, int((positions >= 0).sum()), duplicates
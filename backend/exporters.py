@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Export des DataFrames en xlsx, CSV ou Parquet à mémoire constante
+Les lignes sont écrites par blocs (openpyxl en mode write_only, to_csv par
+morceaux, ParquetWriter par groupes de lignes). Les fichiers produits sont
+gardés en cache par (dataset, version, format): un dataset inchangé est
+resservi sans être régénéré, et les anciennes versions sont supprimées
+après un délai de grâce.
+Un dataset hors mémoire (ChunkedDataset) est exporté bloc par bloc depuis
+le disque.
+"""
+
+import glob
+import logging
+import os
+import time
+import uuid
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import column_types
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+logger = logging.getLogger(__name__)
+
+# Nombre de lignes converties à la fois pendant l'export
+EXPORT_CHUNK_ROWS = 10000
+# Lignes de données au plus dans une feuille xlsx (hors en-tête)
+XLSX_MAX_ROWS = 1048575
+# Délai avant suppression d'une ancienne version: un export asynchrone terminé
+# reste téléchargeable aussi longtemps que sa tâche (FILE_JOB_TTL_SECONDS)
+OUTDATED_GRACE_SECONDS = 3600
+
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def _chunks(df, progress=None):
+    """Blocs de lignes du DataFrame; progress(lignes écrites, total) après chaque bloc"""
+    total = len(df)
+    written = 0
+    if not isinstance(df, pd.DataFrame):
+        blocks = df.chunks()
+    else:
+        blocks = (df.iloc[start:start + EXPORT_CHUNK_ROWS] for start in range(0, total, EXPORT_CHUNK_ROWS))
+    for chunk in blocks:
+        yield chunk
+        written += len(chunk)
+        if progress is not None:
+            progress(written, total)
+
+
+def write_xlsx(df, path, sheet_name=None, progress=None, formulas=None):
+    """Écrit le DataFrame en xlsx via un classeur openpyxl write_only
+
+    formulas ({colonne: (positions triées, textes)}, voir
+    FormulaBook.render) remplace la valeur de ces cellules par leur formule.
+    """
+    if len(df) > XLSX_MAX_ROWS:
+        raise ValueError(f"{len(df)} lignes: au-delà de la limite d'une feuille Excel, exportez en CSV ou Parquet")
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title=(sheet_name or 'Feuille1')[:31])
+    worksheet.append([str(column) for column in df.columns])
+    formula_columns = [(i, formulas[column]) for i, column in enumerate(df.columns)
+                       if formulas and column in formulas]
+    try:
+        start = 0
+        for chunk in _chunks(df, progress):
+            columns = [column_types.python_values(chunk.iloc[:, i], null=None, naive_datetimes=True)
+                       for i in range(chunk.shape[1])]
+            for i, (positions, texts) in formula_columns:
+                first, last = np.searchsorted(positions, [start, start + len(chunk)])
+                columns[i] = list(columns[i])
+                for position, text in zip(positions[first:last], texts[first:last]):
+                    columns[i][position - start] = text
+            start += len(chunk)
+            for row in zip(*columns):
+                worksheet.append(row)
+    except Exception:
+        worksheet.close()  # Export interrompu (annulation): fichier temporaire de la feuille refermé
+        raise
+    workbook.save(path)
+
+
+def write_csv(df, path, progress=None):
+    if isinstance(df, pd.DataFrame) and (progress is None or df.empty):
+        df.to_csv(path, index=False, chunksize=EXPORT_CHUNK_ROWS, encoding='utf-8')
+        return
+    with open(path, 'w', encoding='utf-8', newline='') as handle:
+        for position, chunk in enumerate(_chunks(df, progress)):
+            chunk.to_csv(handle, index=False, header=position == 0)
+
+
+# Contenus de colonne object convertibles tels quels en Parquet (pandas.api.types.infer_dtype)
+UNIFORM_OBJECT_KINDS = {'string', 'bytes', 'integer', 'floating', 'mixed-integer-float', 'decimal', 'boolean',
+                        'datetime64', 'datetime', 'date', 'timedelta64', 'timedelta', 'time'}
+
+
+def _parquet_schema(df):
+    """Schéma Parquet de tout le DataFrame, fixé avant le premier bloc
+
+    Renvoie (schéma, colonnes à écrire en texte). Le type d'une colonne
+    object est déduit de toutes ses valeurs: une colonne vide en début de
+    fichier garde le type de ses valeurs suivantes, une colonne aux types
+    mêlés (nombre édité en texte...) est écrite en texte.
+    """
+    schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    text_columns = []
+    for position, column in enumerate(df.columns):
+        series = df.iloc[:, position]
+        if not pd.api.types.is_object_dtype(series):
+            continue
+        values = series.dropna().to_numpy()
+        kind = None
+        # infer_type suit la première valeur: les types mêlés sont détectés par pandas
+        if pd.api.types.infer_dtype(values, skipna=True) in UNIFORM_OBJECT_KINDS:
+            try:
+                kind = pa.infer_type(values, from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                pass
+        if kind is None or pa.types.is_null(kind):
+            kind = pa.string()
+            text_columns.append(position)
+        schema = schema.set(position, pa.field(str(column), kind))
+    return schema, text_columns
+
+
+def write_parquet(df, path, progress=None):
+    """Écrit le DataFrame en Parquet, un groupe de lignes par bloc"""
+    if not HAS_ARROW:
+        raise ValueError("L'export Parquet nécessite pyarrow")
+    if isinstance(df, pd.DataFrame):
+        schema, text_columns = _parquet_schema(df)
+    else:
+        # Dataset hors mémoire: blocs lus d'un même fichier Parquet, types constants
+        schema, text_columns = None, []
+    writer = None
+    try:
+        for chunk in _chunks(df, progress):
+            if text_columns:
+                chunk = chunk.copy(deep=False)
+                for position in text_columns:
+                    values = chunk.iloc[:, position]
+                    chunk.isetitem(position, values.where(values.isna(), values.astype(str)))
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, schema or table.schema)
+            writer.write_table(table if schema is not None else table.cast(writer.schema))
+        if writer is None:
+            df.to_parquet(path, index=False)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+class ExportCache:
+    """Fichiers exportés indexés par (dataset, version, format) dans EXPORT_FOLDER"""
+
+    def __init__(self, folder, max_age_seconds=None):
+        self.folder = folder
+        self.max_age_seconds = max_age_seconds
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, dataset_id, version, file_format, sheet_name=None):
+        sheet = ''.join(ch for ch in (sheet_name or '') if ch.isalnum())[:31]
+        suffix = f'_{sheet}' if sheet else ''
+        return os.path.join(self.folder, f'{dataset_id}_{version}{suffix}.{file_format}')
+
+    def export(self, df, dataset_id, version, file_format, sheet_name=None, progress=None, formulas=None):
+        """Renvoie le chemin de l'export (depuis le cache si la version n'a pas changé)
+
+        progress(lignes écrites, total) est appelé après chaque bloc écrit;
+        formulas (xlsx uniquement) est passé à write_xlsx.
+        """
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError(f"Format d'export non supporté: {file_format}")
+
+        path = self._path(dataset_id, version, file_format, sheet_name)
+        if os.path.exists(path):
+            logger.info(f"Export servi depuis le cache: {os.path.basename(path)}")
+            return path
+
+        started = time.perf_counter()
+        temp_path = f'{path}.{uuid.uuid4().hex[:8]}.part'  # Exports simultanés de la même version
+        try:
+            if file_format == 'xlsx':
+                write_xlsx(df, temp_path, sheet_name, progress, formulas)
+            elif file_format == 'csv':
+                write_csv(df, temp_path, progress)
+            else:
+                write_parquet(df, temp_path, progress)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        logger.info(f"Fichier exporté: {path} ({len(df)} lignes en {time.perf_counter() - started:.2f}s)")
+        self.cleanup(dataset_id, version)
+        return path
+
+    def cleanup(self, dataset_id=None, current_version=None):
+        """Supprime les exports périmés: anciennes versions du dataset et fichiers trop vieux
+
+        Les fichiers en cours d'écriture (.part) ne sont jamais touchés; une
+        ancienne version n'est supprimée qu'après OUTDATED_GRACE_SECONDS, le
+        temps pour le client de télécharger un export asynchrone terminé.
+        """
+        now = time.time()
+        for path in glob.glob(os.path.join(self.folder, '*_*.*')):
+            name = os.path.basename(path)
+            if name.endswith('.part'):
+                continue
+            try:
+                age = now - os.path.getmtime(path)
+            except OSError:
+                continue
+            expired = self.max_age_seconds and age > self.max_age_seconds
+            outdated = (dataset_id and age > OUTDATED_GRACE_SECONDS and name.startswith(f'{dataset_id}_')
+                        and not name.startswith((f'{dataset_id}_{current_version}_', f'{dataset_id}_{current_version}.')))
+            if expired or outdated:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Tâches de fond sur les fichiers: parsing, conversion et export hors requête
+Parser un gros classeur dans /api/upload ou écrire un xlsx dans /api/export
+occupe un cœur pendant toute la requête: le worker est bloqué et le proxy
+peut couper la connexion. FileJobQueue confie ce travail à un pool de
+processus borné (Config.FILE_JOB_WORKERS), sans broker externe. Un export
+s'exécute dans un fil du worker (threaded=True): le DataFrame n'est pas
+sérialisé vers un autre processus, ce qui doublerait la mémoire.
+- submit programme une tâche et renvoie aussitôt son identifiant
+- la tâche publie son avancement en pourcentage (octets lus, lignes écrites)
+- cancel demande l'arrêt: la tâche s'interrompt au point d'avancement suivant
+L'état des tâches est tenu dans des fichiers, lisibles par tous les workers:
+- <id>.json: statut, propriétaire, résultat ou erreur (worker qui a soumis la tâche)
+- <id>.progress: avancement (processus ou fil de travail)
+- <id>.cancel: demande d'annulation
+Les fonctions des tâches (parse_upload, export_dataset) ne dépendent que
+des modules de lecture et d'écriture, pas de l'application.
+"""
+
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import column_types
+import readers
+from chunked_dataset import convert_csv
+from exporters import ExportCache
+from formula_engine import FORMULA_FILE_TYPES, read_formulas
+from upload_cache import UploadCache
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ('done', 'error', 'cancelled')
+
+
+class JobCancelled(Exception):
+    """Tâche interrompue à la demande de l'utilisateur"""
+
+
+def _write_json(path, value):
+    temp_path = f'{path}.{uuid.uuid4().hex[:8]}.part'
+    with open(temp_path, 'w', encoding='utf-8') as handle:
+        json.dump(value, handle)
+    os.replace(temp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as handle:
+            return json.load(handle)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class JobProgress:
+    """Avancement d'une tâche, publié par le processus de travail
+
+    Le fichier n'est réécrit (et l'annulation vérifiée) qu'à chaque point de
+    pourcentage gagné, quel que soit le nombre d'appels.
+    """
+
+    def __init__(self, folder, job_id):
+        self._path = os.path.join(folder, f'{job_id}.progress')
+        self._cancel_path = os.path.join(folder, f'{job_id}.cancel')
+        self._last = None
+
+    def cancelled(self):
+        return os.path.exists(self._cancel_path)
+
+    def update(self, stage, done, total, unit='lignes', start=0, end=100):
+        """Reporte done/total sur la plage [start, end] du pourcentage; lève JobCancelled si demandé"""
+        percent = start + (end - start) * (min(done / total, 1) if total else 1)
+        key = (stage, int(percent))
+        if key == self._last:
+            return
+        self._last = key
+        if self.cancelled():
+            raise JobCancelled('Tâche annulée')
+        _write_json(self._path, {'stage': stage, 'percent': round(percent, 1),
+                                 'done': done, 'total': total, 'unit': unit})
+
+    def callback(self, stage, unit, start=0, end=100):
+        """progress(done, total) pour les fonctions de lecture et d'écriture"""
+        return lambda done, total: self.update(stage, done, total, unit, start, end)
+
+
+def parse_upload(progress, upload_folder, file_path, file_type, file_id, sheet, engine,
+                 out_of_core_threshold, chunk_rows):
+    """Parse un upload et remplit le cache des uploads
+
+    Le chargement dans la session (ExcelProcessor.load_file) relit ensuite
+    la version parsée sans reparser. Un gros CSV est converti en Parquet
+    pour le mode hors mémoire.
+    """
+    cache = UploadCache(upload_folder)
+    if file_type == 'csv' and os.path.getsize(file_path) >= out_of_core_threshold:
+        parquet_path = cache.out_of_core_path(file_id)
+        if not os.path.exists(parquet_path):
+            convert_csv(file_path, parquet_path, chunk_rows, progress.callback('conversion', 'octets'))
+        return {'sheet': None}
+
+    if sheet is None:
+        sheets = readers.list_sheets(file_path, file_type)
+        sheet = sheets[0] if sheets else None
+    variant = f'sheet:{sheet}' if sheet is not None else ''
+    if cache.has_parsed(file_id, variant):
+        return {'sheet': sheet}
+
+    df = readers.read_sheet(file_path, file_type, sheet, engine=engine,
+                            progress=progress.callback('lecture', 'octets', 0, 80))
+    progress.update('typage', 0, 1, start=80, end=90)
+    df, report = column_types.compact_dtypes(df)
+    progress.update('cache', 0, 1, start=90, end=100)
+    cache.save_parsed(file_id, df, report, variant)
+    if file_type in FORMULA_FILE_TYPES:
+        cache.save_formulas(file_id, read_formulas(file_path, file_type, sheet, df.columns), variant)
+    return {'sheet': sheet, 'rows': len(df), 'columns': df.shape[1]}
+
+
+def export_dataset(progress, export_folder, max_age_seconds, df, dataset_id, version, file_format, sheet_name,
+                   formulas=None):
+    """Écrit l'export dans le cache des exports et renvoie son chemin"""
+    path = ExportCache(export_folder, max_age_seconds).export(
+        df, dataset_id, version, file_format, sheet_name=sheet_name,
+        progress=progress.callback('écriture', 'lignes'), formulas=formulas)
+    return {'path': path}
+
+
+def _execute(folder, job_id, task, args):
+    """Point d'entrée dans le processus de travail"""
+    progress = JobProgress(folder, job_id)
+    progress.update('démarrage', 0, 1)
+    return task(progress, *args)
+
+
+class FileJobQueue:
+    """Tâches de fichiers exécutées dans un pool de processus, suivies sur disque"""
+
+    def __init__(self, folder, max_workers=2, ttl_seconds=3600):
+        self.folder = folder
+        self.max_workers = max_workers
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(folder, exist_ok=True)
+        # Un fil par tâche en cours: il attend le processus puis applique le résultat
+        self._dispatcher = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='file-job')
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _path(self, job_id, extension):
+        return os.path.join(self.folder, f'{job_id}.{extension}')
+
+    def _process_pool(self):
+        # Créé à la première tâche; 'spawn': pas de copie des verrous et fils du worker
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _reset_pool(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, owner, kind, task, args, on_done=None, threaded=False, **meta):
+        """Programme task(progress, *args) dans le pool; renvoie l'identifiant de la tâche
+
+        on_done(résultat), appelé dans le worker une fois la tâche terminée,
+        produit le résultat publié (par exemple après chargement dans la session).
+        threaded: task s'exécute dans un fil du worker, ses arguments (un
+        DataFrame à exporter...) ne sont pas copiés vers le pool de processus.
+        """
+        self.cleanup()
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'owner': owner,
+            'status': 'pending',
+            'meta': meta,
+            'result': None,
+            'error': None,
+            'created': time.time(),
+            'started': None,
+            'finished': None
+        }
+        _write_json(self._path(job['id'], 'json'), job)
+        self._dispatcher.submit(self._run, job, task, args, on_done, threaded)
+        return job['id']
+
+    def _run(self, job, task, args, on_done, threaded=False):
+        try:
+            if os.path.exists(self._path(job['id'], 'cancel')):
+                raise JobCancelled('Tâche annulée')
+            job['status'] = 'running'
+            job['started'] = time.time()
+            _write_json(self._path(job['id'], 'json'), job)
+            if threaded:
+                result = _execute(self.folder, job['id'], task, args)
+            else:
+                result = self._process_pool().submit(_execute, self.folder, job['id'], task, args).result()
+            job['result'] = on_done(result) if on_done is not None else result
+            job['status'] = 'done'
+        except JobCancelled:
+            logger.info(f"Tâche {job['kind']} {job['id'][:8]} annulée")
+            job['status'] = 'cancelled'
+        except BrokenProcessPool as e:
+            # Processus de travail tué (mémoire...): le pool est recréé à la tâche suivante
+            logger.error(f"Pool de tâches interrompu: {str(e)}")
+            self._reset_pool()
+            job['error'] = 'Processus de travail interrompu'
+            job['status'] = 'error'
+        except Exception as e:
+            logger.error(f"Tâche {job['kind']} {job['id'][:8]} en échec: {str(e)}")
+            job['error'] = str(e)
+            job['status'] = 'error'
+        finally:
+            job['finished'] = time.time()
+            _write_json(self._path(job['id'], 'json'), job)
+
+    def get(self, job_id, owner=None):
+        """Tâche connue (et appartenant à owner si précisé), ou None"""
+        if not job_id.isalnum():
+            return None
+        job = _read_json(self._path(job_id, 'json'))
+        if job is None or (owner is not None and job['owner'] != owner):
+            return None
+        return job
+
+    def wait(self, job_id, owner, timeout):
+        """Attend la fin de la tâche au plus timeout secondes; renvoie son dernier état"""
+        deadline = time.monotonic() + timeout
+        job = self.get(job_id, owner)
+        while job is not None and job['status'] not in FINISHED_STATUSES and time.monotonic() < deadline:
+            time.sleep(0.2)
+            job = self.get(job_id, owner)
+        return job
+
+    def cancel(self, job):
+        """Demande l'annulation; False si la tâche est déjà terminée"""
+        if job['status'] in FINISHED_STATUSES:
+            return False
+        with open(self._path(job['id'], 'cancel'), 'w'):
+            pass
+        return True
+
+    def describe(self, job):
+        """État publiable d'une tâche, avec son avancement"""
+        description = {
+            'jobId': job['id'],
+            'kind': job['kind'],
+            'status': job['status'],
+            'queuedSeconds': round((job['started'] or time.time()) - job['created'], 3)
+        }
+        if job['status'] == 'running':
+            progress = _read_json(self._path(job['id'], 'progress')) or {}
+            description['progress'] = {'percent': progress.get('percent', 0), 'stage': progress.get('stage'),
+                                       'done': progress.get('done'), 'total': progress.get('total'),
+                                       'unit': progress.get('unit')}
+        elif job['status'] == 'done':
+            description['progress'] = {'percent': 100, 'stage': 'terminé'}
+        if job['finished'] is not None and job['started'] is not None:
+            description['runSeconds'] = round(job['finished'] - job['started'], 3)
+        if job['status'] == 'error':
+            description['error'] = job['error']
+        return description
+
+    def cleanup(self):
+        """Supprime les tâches terminées depuis plus de ttl_seconds"""
+        limit = time.time() - self.ttl_seconds
+        for path in glob.glob(os.path.join(self.folder, '*.json')):
+            if os.path.getmtime(path) >= limit:
+                continue
+            job = _read_json(path)
+            if job is not None and job['status'] not in FINISHED_STATUSES:
+                continue
+            job_id = os.path.basename(path)[:-len('.json')]
+            for extension in ('json', 'progress', 'cancel'):
+                try:
+                    os.remove(self._path(job_id, extension))
+                except OSError:
+                    pass
+
+    def stats(self):
+        statuses = [(_read_json(path) or {}).get('status')
+                    for path in glob.glob(os.path.join(self.folder, '*.json'))]
+        return {status: statuses.count(status) for status in ('pending', 'running') + FINISHED_STATUSES}
@@ -0,0 +1,1349 @@
+# -*- coding: utf-8 -*-
+"""
+Moteur de formules Excel à recalcul incrémental
+pandas.read_excel ne lit que les valeurs en cache des formules: après une
+modification de cellule, les totaux qui en dépendent sont faux, et l'export
+n'écrit que des valeurs. FormulaBook garde les formules de la feuille (lues
+une fois au chargement avec openpyxl) et les recalcule:
+- les formules recopiées vers le bas (même forme relative: "=A2*B2",
+  "=A3*B3"...) forment un groupe, évalué d'un bloc par opérations
+  vectorisées sur les colonnes
+- un graphe de dépendances entre groupes (colonnes référencées) donne
+  l'ordre de recalcul; après une modification, seules les cellules en aval
+  des cellules modifiées sont réévaluées
+- à l'export xlsx, le texte des formules est régénéré pour la disposition
+  courante des lignes et des colonnes
+Pris en charge: SUM, AVERAGE, MIN, MAX, COUNT, COUNTA, IF, IFERROR, AND, OR,
+NOT, ROUND, ABS, VLOOKUP, opérateurs arithmétiques, de comparaison et de
+concaténation, références de cellules et plages de la feuille. Une formule
+hors de ce périmètre (autre feuille, noms définis, formule matricielle...)
+garde sa valeur en cache et son texte d'origine à l'export, sans être
+recalculée. Les erreurs Excel (#DIV/0!, #N/A...) deviennent des cellules
+vides, et une cellule vide vaut 0 dans un calcul.
+
+Les cellules sont identifiées par (étiquette de ligne, nom de colonne): la
+ligne 1 de la feuille est l'en-tête, la ligne r est la position r - 2 de la
+base. Une référence relative suit la position courante (comme dans Excel
+après un tri), une référence absolue suit sa ligne.
+"""
+
+import logging
+import re
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+AGGREGATES = {'SUM', 'AVERAGE', 'MIN', 'MAX', 'COUNT', 'COUNTA'}
+# Nombre d'arguments (minimum, maximum) des autres fonctions
+FUNCTION_ARITY = {'IF': (2, 3), 'IFERROR': (2, 2), 'AND': (1, 255), 'OR': (1, 255), 'NOT': (1, 1),
+                  'ROUND': (2, 2), 'ABS': (1, 1), 'VLOOKUP': (3, 4)}
+HEADER_ROWS = 1
+# Types de fichiers dont les formules sont lues (les autres n'ont que des valeurs)
+FORMULA_FILE_TYPES = ('xlsx', 'xlsm')
+
+SPREADSHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+RELATIONSHIP_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_RELATIONSHIP_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+SHEET_DATA_TAG = f'{SPREADSHEET_NS}sheetData'
+ROW_TAG = f'{SPREADSHEET_NS}row'
+CELL_TAG = f'{SPREADSHEET_NS}c'
+FORMULA_TAG = f'{SPREADSHEET_NS}f'
+
+
+class FormulaError(ValueError):
+    """Formule invalide ou hors du périmètre du moteur"""
+
+
+def column_letter(index):
+    """Position de colonne (0 = A) -> lettres Excel"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def column_index(letters):
+    """Lettres Excel -> position de colonne (A = 0)"""
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - 64
+    return index - 1
+
+
+# --- Analyse syntaxique --------------------------------------------------------
+
+_TOKEN = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<string>"(?:[^"]|"")*")
+  | (?P<error>\#[A-Za-z0-9/]+[!?]?)
+  | (?P<sheet>(?:'(?:[^']|'')+'|[A-Za-z_][\w.]*)!)
+  | (?P<range>\$?[A-Za-z]{1,3}\$?[0-9]+:\$?[A-Za-z]{1,3}\$?[0-9]+(?![\w(])|\$?[A-Za-z]{1,3}:\$?[A-Za-z]{1,3}(?![\w(]))
+  | (?P<cell>\$?[A-Za-z]{1,3}\$?[0-9]+)(?![\w(])
+  | (?P<number>(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?)
+  | (?P<function>[A-Za-z_][\w.]*)(?=\()
+  | (?P<name>[A-Za-z_][\w.]*)
+  | (?P<operator><>|<=|>=|[-+*/^&=<>%(),;])
+''', re.VERBOSE)
+
+_CELL = re.compile(r'(\$?)([A-Za-z]{1,3})(\$?)([0-9]+)?')
+
+# Référence (hors chaînes) dont la ligne est rendue relative à la cellule hôte, pour grouper les recopies
+_RELATIVE_REF = re.compile(r'"(?:[^"]|"")*"|(\$?[A-Za-z]{1,3})(\$?)([0-9]+)(?![\w(!])')
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            raise FormulaError(f"Caractère inattendu: {text[position:position + 10]!r}")
+        kind = match.lastgroup
+        if kind in ('sheet', 'error'):
+            raise FormulaError(f"Non pris en charge: {match.group()}")
+        if kind != 'space':
+            tokens.append((kind, match.group()))
+        position = match.end()
+    return tokens
+
+
+def _parse_cell(text):
+    col_abs, letters, row_abs, row = _CELL.fullmatch(text).groups()
+    return (column_index(letters), int(row) if row else None, bool(col_abs), bool(row_abs))
+
+
+class _Parser:
+    """Descente récursive selon les priorités Excel: comparaison < & < +- < */ < ^ < % < négation"""
+
+    COMPARISONS = ('=', '<>', '<', '>', '<=', '>=')
+
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.position = 0
+
+    def parse(self):
+        node = self.comparison()
+        if self.position != len(self.tokens):
+            raise FormulaError(f"Élément inattendu: {self.tokens[self.position][1]}")
+        return node
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _accept(self, *operators):
+        kind, text = self._peek()
+        if kind == 'operator' and text in operators:
+            self.position += 1
+            return text
+        return None
+
+    def _binary(self, operand, operators):
+        node = operand()
+        while True:
+            operator = self._accept(*operators)
+            if operator is None:
+                return node
+            node = ('op', operator, node, operand())
+
+    def comparison(self):
+        return self._binary(self.concat, self.COMPARISONS)
+
+    def concat(self):
+        return self._binary(self.additive, ('&',))
+
+    def additive(self):
+        return self._binary(self.term, ('+', '-'))
+
+    def term(self):
+        return self._binary(self.power, ('*', '/'))
+
+    def power(self):
+        return self._binary(self.percent, ('^',))
+
+    def percent(self):
+        node = self.unary()
+        while self._accept('%'):
+            node = ('pct', node)
+        return node
+
+    def unary(self):
+        operator = self._accept('-', '+')
+        if operator == '-':
+            return ('neg', self.unary())
+        if operator == '+':
+            return self.unary()
+        return self.primary()
+
+    def primary(self):
+        kind, text = self._peek()
+        if kind is None:
+            raise FormulaError("Formule incomplète")
+        self.position += 1
+        if kind == 'number':
+            return ('num', float(text))
+        if kind == 'string':
+            return ('str', text[1:-1].replace('""', '"'))
+        if kind == 'cell':
+            return ('cell',) + _parse_cell(text)
+        if kind == 'range':
+            start, end = text.split(':')
+            return ('area', _parse_cell(start), _parse_cell(end))
+        if kind == 'name' and text.upper() in ('TRUE', 'FALSE'):
+            return ('bool', text.upper() == 'TRUE')
+        if kind == 'function':
+            return self.call(text.upper())
+        if kind == 'operator' and text == '(':
+            node = self.comparison()
+            if not self._accept(')'):
+                raise FormulaError("Parenthèse fermante manquante")
+            return node
+        raise FormulaError(f"Non pris en charge: {text}")
+
+    def call(self, name):
+        if name.startswith('_XLFN.'):
+            name = name[len('_XLFN.'):]
+        if name not in AGGREGATES and name not in FUNCTION_ARITY:
+            raise FormulaError(f"Fonction non prise en charge: {name}")
+        self._accept('(')
+        args = []
+        if not self._accept(')'):
+            while True:
+                args.append(self.comparison())
+                if self._accept(')'):
+                    break
+                if not self._accept(',', ';'):
+                    raise FormulaError(f"Séparateur attendu dans {name}")
+        low, high = FUNCTION_ARITY.get(name, (1, 255))
+        if not low <= len(args) <= high:
+            raise FormulaError(f"{name}: nombre d'arguments invalide")
+        return ('call', name, tuple(args))
+
+
+# --- Compilation: références A1 -> (colonne, ligne relative ou étiquette) ------
+
+def _row_spec(row, row_abs, host_position, label_at):
+    """Ligne de feuille -> ('rel', décalage) ou ('abs', étiquette)"""
+    position = row - HEADER_ROWS - 1
+    if not row_abs:
+        return ('rel', position - host_position)
+    if position < 0:
+        raise FormulaError("Référence absolue à l'en-tête")
+    return ('abs', label_at(position))
+
+
+def compile_formula(text, host_position, columns, label_at):
+    """Texte d'une formule -> gabarit indépendant de la ligne hôte (références relatives)
+
+    columns: noms des colonnes par position (A = 0); label_at(position) donne
+    l'étiquette de ligne d'une position de la base.
+    """
+    node = _Parser(text[1:] if text.startswith('=') else text).parse()
+
+    def column_name(index):
+        if index >= len(columns):
+            raise FormulaError(f"Colonne {column_letter(index)} hors des données")
+        return columns[index]
+
+    def build(node, area_allowed=False):
+        kind = node[0]
+        if kind in ('num', 'str', 'bool'):
+            return node
+        if kind == 'cell':
+            index, row, col_abs, row_abs = node[1:]
+            return ('cell', column_name(index), _row_spec(row, row_abs, host_position, label_at), col_abs)
+        if kind == 'area':
+            if not area_allowed:
+                raise FormulaError("Plage utilisée hors d'une fonction d'agrégat")
+            (c1, r1, c1_abs, r1_abs), (c2, r2, c2_abs, r2_abs) = node[1], node[2]
+            if (r1 is None) != (r2 is None):
+                raise FormulaError("Plage invalide")
+            if c1 > c2:
+                c1, c2, c1_abs, c2_abs = c2, c1, c2_abs, c1_abs
+            if r1 is not None and r1 > r2:
+                r1, r2, r1_abs, r2_abs = r2, r1, r2_abs, r1_abs
+            names = tuple(column_name(index) for index in range(c1, c2 + 1))
+            start = _row_spec(r1, r1_abs, host_position, label_at) if r1 is not None else None
+            end = _row_spec(r2, r2_abs, host_position, label_at) if r2 is not None else None
+            return ('area', names, start, end, (c1_abs, c2_abs))
+        if kind in ('neg', 'pct'):
+            return (kind, build(node[1]))
+        if kind == 'op':
+            return ('op', node[1], build(node[2]), build(node[3]))
+        name, args = node[1], node[2]
+        if name in AGGREGATES:
+            return ('call', name, tuple(build(arg, area_allowed=True) for arg in args))
+        if name == 'VLOOKUP':
+            table = build(args[1], area_allowed=True)
+            if table[0] != 'area':
+                raise FormulaError("VLOOKUP: la table doit être une plage")
+            if args[2][0] != 'num' or not 1 <= args[2][1] <= len(table[1]):
+                raise FormulaError("VLOOKUP: numéro de colonne constant attendu")
+            if len(args) == 4 and args[3][0] not in ('num', 'bool'):
+                raise FormulaError("VLOOKUP: type de recherche constant attendu")
+            return ('call', name, (build(args[0]), table) + tuple(args[2:]))
+        return ('call', name, tuple(build(arg) for arg in args))
+
+    return build(node)
+
+
+def _lookup_tables(node, found=None):
+    """Tables ('area', ...) des VLOOKUP d'un gabarit"""
+    found = [] if found is None else found
+    kind = node[0]
+    if kind in ('neg', 'pct'):
+        _lookup_tables(node[1], found)
+    elif kind == 'op':
+        _lookup_tables(node[2], found)
+        _lookup_tables(node[3], found)
+    elif kind == 'call':
+        if node[1] == 'VLOOKUP':
+            found.append(node[2][1])
+        for arg in node[2]:
+            _lookup_tables(arg, found)
+    return found
+
+
+def _references(node, found=None):
+    """Références d'un gabarit: ('cell', colonne, ligne) et ('area', colonnes, début, fin)"""
+    found = [] if found is None else found
+    kind = node[0]
+    if kind == 'cell':
+        found.append(node[:3])
+    elif kind == 'area':
+        found.append(node[:4])
+    elif kind in ('neg', 'pct'):
+        _references(node[1], found)
+    elif kind == 'op':
+        _references(node[2], found)
+        _references(node[3], found)
+    elif kind == 'call':
+        for arg in node[2]:
+            _references(arg, found)
+    return found
+
+
+# --- Évaluation vectorisée -----------------------------------------------------
+
+_EXCEL_EPOCH = np.datetime64('1899-12-30')
+
+
+def _is_array(value):
+    return isinstance(value, np.ndarray)
+
+
+def _blank(value):
+    return value is None or (isinstance(value, float) and value != value) or value is pd.NA or value is pd.NaT
+
+
+def _scalar_number(value, blank=0.0):
+    """Nombre d'une valeur pour un calcul: vide -> blank, texte numérique converti, sinon NaN"""
+    if _blank(value) or (isinstance(value, str) and value == ''):
+        return blank
+    if isinstance(value, (bool, np.bool_)):
+        return float(value)
+    if isinstance(value, (int, float, np.number)):
+        return float(value)
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return (np.datetime64(value, 'ns') - _EXCEL_EPOCH) / np.timedelta64(1, 'D')
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return np.nan
+    return np.nan
+
+
+def _numbers(value, blank=0.0):
+    """Valeurs numériques (float64) d'un scalaire ou d'un tableau, pour l'arithmétique"""
+    if not _is_array(value):
+        return _scalar_number(value, blank)
+    if value.dtype.kind in 'fiub':
+        values = value.astype(float)
+        return np.where(np.isnan(values), blank, values) if blank == blank else values
+    if value.dtype.kind == 'M':
+        values = (value - _EXCEL_EPOCH) / np.timedelta64(1, 'D')
+        return np.where(np.isnan(values), blank, values) if blank == blank else values
+    return np.array([_scalar_number(item, blank) for item in value], dtype=float)
+
+
+def _range_numbers(values):
+    """Nombres d'une plage pour les agrégats: le texte, les booléens et les vides sont ignorés (NaN)"""
+    if values.dtype.kind in 'fiu':
+        return values.astype(float)
+    if values.dtype.kind == 'M':
+        return (values - _EXCEL_EPOCH) / np.timedelta64(1, 'D')
+    if values.dtype.kind == 'b':
+        return np.full(len(values), np.nan)
+    return np.array([float(item) if isinstance(item, (int, float, np.number)) and not isinstance(item, (bool, np.bool_))
+                     else np.nan for item in values], dtype=float)
+
+
+def _non_blank(values):
+    if values.dtype.kind in 'fM':
+        return ~pd.isna(values)
+    if values.dtype.kind in 'iub':
+        return np.ones(len(values), dtype=bool)
+    return np.array([not _blank(item) and item != '' for item in values], dtype=bool)
+
+
+def _scalar_text(value):
+    if _blank(value):
+        return ''
+    if isinstance(value, (bool, np.bool_)):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _scalar_truth(value):
+    if isinstance(value, str):
+        return value.upper() == 'TRUE'
+    number = _scalar_number(value)
+    return bool(number == number and number != 0)
+
+
+def _elementwise(function, *values):
+    """Applique function élément par élément (tableaux diffusés, résultat objet)"""
+    size = max(len(value) for value in values if _is_array(value))
+    columns = [value if _is_array(value) else [value] * size for value in values]
+    return np.array([function(*items) for items in zip(*columns)], dtype=object)
+
+
+def _compare_key(value, other):
+    """Clé de comparaison Excel: nombres < texte < booléens, texte sans casse, vide selon l'autre terme"""
+    if _blank(value) or (isinstance(value, str) and value == ''):
+        value = '' if isinstance(other, str) else False if isinstance(other, (bool, np.bool_)) else 0.0
+    if isinstance(value, (bool, np.bool_)):
+        return (2, bool(value))
+    if isinstance(value, str):
+        return (1, value.lower())
+    number = _scalar_number(value)
+    return (0, number)
+
+
+_COMPARE = {
+    '=': lambda a, b: a == b, '<>': lambda a, b: a != b, '<': lambda a, b: a < b,
+    '>': lambda a, b: a > b, '<=': lambda a, b: a <= b, '>=': lambda a, b: a >= b,
+}
+
+
+def _numeric_operand(value):
+    if _is_array(value):
+        return value.dtype.kind in 'fiuM'
+    return not isinstance(value, (str, bool, np.bool_))
+
+
+def _finite(values):
+    if _is_array(values):
+        return np.where(np.isfinite(values), values, np.nan)
+    return values if np.isfinite(values) else np.nan
+
+
+class _Context:
+    """Colonnes de la base vues depuis un ensemble de lignes hôtes (positions courantes)"""
+
+    def __init__(self, base, positions, override=None):
+        self.base = base
+        self.positions = positions
+        self.size = len(positions)
+        self.length = len(base)
+        self._columns = {}
+        self._override = override or {}
+
+    def column(self, name):
+        if name in self._override:
+            return self._override[name]
+        if name not in self._columns:
+            if name not in self.base.columns:
+                raise FormulaError(f"Colonne supprimée: {name}")
+            values = self.base[name].to_numpy()
+            if values.dtype.kind not in 'fiubM':
+                values = np.asarray(self.base[name].astype(object).to_numpy(), dtype=object)
+            self._columns[name] = values
+        return self._columns[name]
+
+    def label_position(self, label):
+        try:
+            position = self.base.index.get_loc(label)
+        except KeyError:
+            return -1
+        return position if isinstance(position, (int, np.integer)) else -1
+
+    def rows(self, spec):
+        """Positions désignées par une ligne relative ou absolue, pour chaque ligne hôte"""
+        if spec[0] == 'rel':
+            return self.positions + spec[1]
+        return np.full(self.size, self.label_position(spec[1]))
+
+    def take(self, name, rows):
+        values = self.column(name)
+        valid = (rows >= 0) & (rows < self.length)
+        taken = values[np.where(valid, rows, 0)]
+        if valid.all():
+            return taken
+        if taken.dtype.kind in 'fM':
+            taken = taken.copy()
+            taken[~valid] = np.nan if taken.dtype.kind == 'f' else np.datetime64('NaT')
+            return taken
+        taken = taken.astype(object)
+        taken[~valid] = None
+        return taken
+
+    def span(self, start, end):
+        """Bornes (début, fin incluse) fixes d'une plage absolue ou de colonnes entières
+
+        Une borne relative n'est fixe que pour une seule ligne hôte (table
+        de VLOOKUP d'une formule non recopiée).
+        """
+        if start is None:
+            return 0, self.length - 1
+        return self._bound(start), self._bound(end)
+
+    def _bound(self, spec):
+        if spec[0] == 'abs':
+            return self.label_position(spec[1])
+        position = int(self.positions[0]) + spec[1]
+        return position if 0 <= position < self.length else -1
+
+
+def _evaluate(node, context):
+    kind = node[0]
+    if kind in ('num', 'str', 'bool'):
+        return node[1]
+    if kind == 'cell':
+        return context.take(node[1], context.rows(node[2]))
+    if kind == 'neg':
+        return -_numbers(_evaluate(node[1], context))
+    if kind == 'pct':
+        return _numbers(_evaluate(node[1], context)) / 100
+    if kind == 'op':
+        return _operate(node[1], _evaluate(node[2], context), _evaluate(node[3], context))
+    return _call(node[1], node[2], context)
+
+
+def _operate(operator, left, right):
+    if operator == '&':
+        if _is_array(left) or _is_array(right):
+            return _elementwise(lambda a, b: _scalar_text(a) + _scalar_text(b), left, right)
+        return _scalar_text(left) + _scalar_text(right)
+    if operator in _COMPARE:
+        compare = _COMPARE[operator]
+        if _numeric_operand(left) and _numeric_operand(right):
+            return compare(_numbers(left), _numbers(right))
+        if _is_array(left) or _is_array(right):
+            return _elementwise(lambda a, b: compare(_compare_key(a, b), _compare_key(b, a)), left, right)
+        return compare(_compare_key(left, right), _compare_key(right, left))
+    a, b = _numbers(left), _numbers(right)
+    with np.errstate(all='ignore'):
+        if operator == '+':
+            result = np.add(a, b)
+        elif operator == '-':
+            result = np.subtract(a, b)
+        elif operator == '*':
+            result = np.multiply(a, b)
+        elif operator == '/':
+            result = np.divide(a, b)
+        else:
+            result = np.power(a, b)
+    return _finite(result)
+
+
+def _truth(value):
+    if not _is_array(value):
+        return _scalar_truth(value)
+    if value.dtype.kind == 'b':
+        return value
+    if value.dtype.kind in 'fiu':
+        return np.nan_to_num(value.astype(float)) != 0
+    return np.array([_scalar_truth(item) for item in value], dtype=bool)
+
+
+def _where(condition, when_true, when_false):
+    if not _is_array(condition):
+        return when_true if condition else when_false
+    if _numeric_operand(when_true) and _numeric_operand(when_false) \
+            and not isinstance(when_true, (bool, np.bool_)) and not isinstance(when_false, (bool, np.bool_)):
+        return np.where(condition, _numbers(when_true, np.nan), _numbers(when_false, np.nan))
+    size = len(condition)
+    true_values = when_true if _is_array(when_true) else np.full(size, when_true, dtype=object)
+    false_values = when_false if _is_array(when_false) else np.full(size, when_false, dtype=object)
+    return np.where(condition, true_values.astype(object), false_values.astype(object))
+
+
+def _is_error(value):
+    if _is_array(value):
+        return np.isnan(value) if value.dtype.kind == 'f' else pd.isna(value)
+    return _blank(value)
+
+
+def _round_half_away(values, digits):
+    factor = np.power(10.0, digits)
+    with np.errstate(all='ignore'):
+        return _finite(np.sign(values) * np.floor(np.abs(values) * factor + 0.5 + 1e-9) / factor)
+
+
+def _call(name, args, context):
+    if name in AGGREGATES:
+        return _aggregate(name, args, context)
+    if name == 'VLOOKUP':
+        return _vlookup(args, context)
+    if name == 'IF':
+        condition = _truth(_evaluate(args[0], context))
+        when_false = _evaluate(args[2], context) if len(args) == 3 else False
+        return _where(condition, _evaluate(args[1], context), when_false)
+    if name == 'IFERROR':
+        value = _evaluate(args[0], context)
+        return _where(_is_error(value), _evaluate(args[1], context), value)
+    if name in ('AND', 'OR'):
+        truths = [_truth(_evaluate(arg, context)) for arg in args]
+        return np.logical_and.reduce(truths) if name == 'AND' else np.logical_or.reduce(truths)
+    if name == 'NOT':
+        return np.logical_not(_truth(_evaluate(args[0], context)))
+    if name == 'ABS':
+        return np.abs(_numbers(_evaluate(args[0], context)))
+    # ROUND: arrondi à la demie supérieure en valeur absolue, comme Excel
+    return _round_half_away(_numbers(_evaluate(args[0], context)), _numbers(_evaluate(args[1], context)))
+
+
+def _aggregate(name, args, context):
+    """SUM, AVERAGE, MIN, MAX, COUNT, COUNTA sur des plages et des valeurs, pour chaque ligne hôte"""
+    size = context.size
+    total = np.zeros(size)
+    count = np.zeros(size)
+    filled = np.zeros(size)
+    low = np.full(size, np.inf)
+    high = np.full(size, -np.inf)
+
+    def add(values, present):
+        nonlocal total, count, low, high
+        total = total + np.where(present, values, 0)
+        count = count + present
+        low = np.fmin(low, np.where(present, values, np.inf))
+        high = np.fmax(high, np.where(present, values, -np.inf))
+
+    for arg in args:
+        if arg[0] != 'area':
+            value = _evaluate(arg, context)
+            if name == 'COUNTA':
+                filled = filled + (~_is_error(value) if _is_array(value) else (not _blank(value)))
+                continue
+            values = _numbers(value, blank=np.nan)
+            add(values, ~np.isnan(values))
+            continue
+
+        _, names, start, end, _ = arg
+        if start is None or (start[0] == 'abs' and end[0] == 'abs'):
+            # Plage fixe: agrégée une fois, le résultat vaut pour toutes les lignes hôtes
+            first, last = context.span(start, end)
+            if first < 0 or last < 0:
+                continue
+            for column in names:
+                block = context.column(column)[first:last + 1]
+                if name == 'COUNTA':
+                    filled = filled + int(_non_blank(block).sum())
+                    continue
+                numbers = _range_numbers(block)
+                numbers = numbers[~np.isnan(numbers)]
+                if len(numbers):
+                    total = total + numbers.sum()
+                    count = count + len(numbers)
+                    low = np.fmin(low, numbers.min())
+                    high = np.fmax(high, numbers.max())
+        elif start == end:
+            # Plage sur une seule ligne relative (=SUM(A2:C2) recopiée): colonnes alignées
+            rows = context.rows(start)
+            for column in names:
+                block = context.take(column, rows)
+                if name == 'COUNTA':
+                    filled = filled + _non_blank(block)
+                    continue
+                numbers = _range_numbers(block)
+                add(np.nan_to_num(numbers), ~np.isnan(numbers))
+        else:
+            # Plage aux bornes mobiles (=SUM($A$2:A2)): sommes cumulées par colonne
+            first = np.clip(context.rows(start), 0, context.length)
+            last = np.clip(context.rows(end), -1, context.length - 1)
+            first, last = np.minimum(first, last + 1), np.maximum(first - 1, last)
+            for column in names:
+                block = context.column(column)
+                if name == 'COUNTA':
+                    cumulative = np.concatenate(([0], np.cumsum(_non_blank(block))))
+                    filled = filled + cumulative[last + 1] - cumulative[first]
+                    continue
+                numbers = _range_numbers(block)
+                present = ~np.isnan(numbers)
+                sums = np.concatenate(([0.0], np.cumsum(np.where(present, numbers, 0))))
+                counts = np.concatenate(([0], np.cumsum(present)))
+                total = total + sums[last + 1] - sums[first]
+                count = count + counts[last + 1] - counts[first]
+                if name not in ('MIN', 'MAX'):
+                    continue
+                filled_window = last >= first
+                if start[0] == 'abs' or end[0] == 'abs':
+                    # Une borne fixe: minimum et maximum cumulés depuis cette borne
+                    reverse = start[0] != 'abs'
+                    ordered = numbers[::-1] if reverse else numbers
+                    lows = np.fmin.accumulate(np.where(np.isnan(ordered), np.inf, ordered))
+                    highs = np.fmax.accumulate(np.where(np.isnan(ordered), -np.inf, ordered))
+                    edge = (context.length - 1 - first) if reverse else last
+                    edge = np.clip(edge, 0, max(context.length - 1, 0))
+                    if len(numbers):
+                        low = np.where(filled_window, np.fmin(low, lows[edge]), low)
+                        high = np.where(filled_window, np.fmax(high, highs[edge]), high)
+                    continue
+                # Fenêtre glissante (deux bornes relatives): fenêtres courtes, parcourues ligne à ligne
+                for i in np.flatnonzero(filled_window):
+                    window = numbers[first[i]:last[i] + 1]
+                    window = window[~np.isnan(window)]
+                    if len(window):
+                        low[i] = min(low[i], window.min())
+                        high[i] = max(high[i], window.max())
+
+    with np.errstate(all='ignore'):
+        if name == 'SUM':
+            return total
+        if name == 'COUNT':
+            return count
+        if name == 'COUNTA':
+            return filled
+        if name == 'AVERAGE':
+            return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+        if name == 'MIN':
+            return np.where(count > 0, low, 0.0)
+        return np.where(count > 0, high, 0.0)
+
+
+def _lookup_keys(values):
+    """Clés de recherche exacte: nombres en float, texte en minuscules (préfixé), vides à NaN"""
+    if values.dtype.kind in 'fiubM':
+        return pd.Series(_numbers(values, blank=np.nan), dtype=object)
+    series = pd.Series(values, dtype=object)
+    is_text = np.fromiter((isinstance(value, str) for value in values), dtype=bool, count=len(values))
+    keys = pd.to_numeric(series.where(~is_text), errors='coerce').astype(object)
+    if is_text.any():
+        keys[is_text] = 's:' + series[is_text].str.lower()
+    return keys
+
+
+def _vlookup(args, context):
+    lookup = _evaluate(args[0], context)
+    _, names, start, end, _ = args[1]
+    first, last = context.span(start, end)
+    keys = context.column(names[0])[first:last + 1] if first >= 0 and last >= 0 else np.array([], dtype=object)
+    results = context.column(names[int(args[2][1]) - 1])[first:len(keys) + first]
+    approximate = len(args) < 4 or bool(args[3][1])
+    lookups = lookup if _is_array(lookup) else np.array([lookup], dtype=object)
+
+    if approximate and _numeric_operand(lookup):
+        # Recherche approchée: plus grande clé <= valeur (clés supposées triées, comme Excel)
+        numbers = _range_numbers(keys)
+        valid = ~np.isnan(numbers)
+        positions = np.flatnonzero(valid)
+        found = np.searchsorted(numbers[valid], _numbers(lookups, np.nan), side='right') - 1
+        matched = (found >= 0) & ~np.isnan(_numbers(lookups, np.nan))
+        indexes = np.where(matched, positions[np.clip(found, 0, max(len(positions) - 1, 0))] if len(positions)
+                           else -1, -1)
+    else:
+        # Recherche exacte (sans casse): première occurrence de chaque clé
+        keys = _lookup_keys(keys)
+        unique = (keys.notna() & ~keys.duplicated()).to_numpy()
+        found = pd.Index(keys[unique]).get_indexer(_lookup_keys(lookups))
+        indexes = np.where(found >= 0, np.flatnonzero(unique)[found], -1)
+
+    values = results[np.maximum(indexes, 0)] if len(results) else np.full(len(indexes), np.nan)
+    values = values.astype(object) if values.dtype.kind not in 'fM' else values.astype(float) \
+        if values.dtype.kind == 'f' else values
+    if (indexes < 0).any():
+        values = values.astype(object) if values.dtype.kind != 'f' else values.copy()
+        values[indexes < 0] = np.nan if values.dtype.kind == 'f' else None
+    return values if _is_array(lookup) else values[0]
+
+
+def _same(current, values):
+    """Cellules dont la valeur ne change pas (deux vides sont égaux)"""
+    empty = pd.isna(current) & pd.isna(values)
+    if current.dtype.kind in 'fiub' and values.dtype.kind in 'fiub':
+        return empty | (current == values)
+    return empty | np.array([a is not None and b is not None and type(a) is type(b) and a == b
+                             for a, b in zip(current.tolist(), values.tolist())], dtype=bool)
+
+
+def _running_increment(template, column):
+    """Terme ajouté à la cellule précédente de la colonne (=D2+C3 dans D), ou None"""
+    if template[0] != 'op' or template[1] != '+':
+        return None
+    previous = ('cell', column, ('rel', -1))
+    for own, other in ((template[2], template[3]), (template[3], template[2])):
+        if own[:3] == previous and not any(ref[0] == 'cell' and ref[1] == column or
+                                           ref[0] == 'area' and column in ref[1] for ref in _references(other)):
+            return other
+    return None
+
+
+def _result_array(value, size):
+    """Résultat d'une évaluation diffusé sur les lignes hôtes"""
+    if _is_array(value):
+        return value
+    if isinstance(value, (float, int, np.number)) and not isinstance(value, (bool, np.bool_)):
+        return np.full(size, float(value))
+    return np.full(size, value, dtype=object)
+
+
+# --- Rendu en texte A1 ---------------------------------------------------------
+
+_LEVELS = {'=': 1, '<>': 1, '<': 1, '>': 1, '<=': 1, '>=': 1, '&': 2, '+': 3, '-': 3, '*': 4, '/': 4, '^': 5}
+
+
+def _number_text(value):
+    return str(int(value)) if float(value).is_integer() and abs(value) < 1e15 else repr(float(value))
+
+
+def _render_parts(node, letters, abs_row, level=0):
+    """Gabarit -> morceaux de texte; un entier d représente la ligne relative (position hôte + d)"""
+    kind = node[0]
+    if kind == 'num':
+        return [_number_text(node[1])]
+    if kind == 'str':
+        return ['"' + node[1].replace('"', '""') + '"']
+    if kind == 'bool':
+        return ['TRUE' if node[1] else 'FALSE']
+    if kind == 'cell':
+        _, column, spec, col_abs = node
+        prefix = ('$' if col_abs else '') + letters(column)
+        return [prefix, ('$' + str(abs_row(spec[1])))] if spec[0] == 'abs' else [prefix, spec[1]]
+    if kind == 'area':
+        _, names, start, end, (c1_abs, c2_abs) = node
+        left = ('$' if c1_abs else '') + letters(names[0])
+        right = ('$' if c2_abs else '') + letters(names[-1])
+        if start is None:
+            return [f'{left}:{right}']
+        parts = [left]
+        parts += ['$' + str(abs_row(start[1]))] if start[0] == 'abs' else [start[1]]
+        parts += [':' + right]
+        parts += ['$' + str(abs_row(end[1]))] if end[0] == 'abs' else [end[1]]
+        return parts
+    if kind == 'neg':
+        parts = ['-'] + _render_parts(node[1], letters, abs_row, 6)
+    elif kind == 'pct':
+        parts = _render_parts(node[1], letters, abs_row, 7) + ['%']
+    elif kind == 'op':
+        own = _LEVELS[node[1]]
+        parts = (_render_parts(node[2], letters, abs_row, own) + [node[1]]
+                 + _render_parts(node[3], letters, abs_row, own + 1))
+        if own < level:
+            parts = ['('] + parts + [')']
+        return parts
+    else:
+        parts = [node[1] + '(']
+        for position, arg in enumerate(node[2]):
+            if position:
+                parts.append(',')
+            parts += _render_parts(arg, letters, abs_row)
+        parts.append(')')
+        return parts
+    return ['('] + parts + [')'] if kind == 'neg' and level > 6 else parts
+
+
+# --- Lecture du classeur ---------------------------------------------------------
+
+def _sheet_member(archive, sheet):
+    """Chemin du xml d'une feuille dans l'archive xlsx"""
+    workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+    relations = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    targets = {relation.get('Id'): relation.get('Target') for relation in relations.iter(f'{PACKAGE_RELATIONSHIP_NS}Relationship')}
+    for node in workbook.iter(f'{SPREADSHEET_NS}sheet'):
+        if sheet is None or node.get('name') == sheet:
+            target = targets[node.get(f'{RELATIONSHIP_NS}id')].lstrip('/')
+            return target if target.startswith('xl/') else f'xl/{target}'
+    raise FormulaError(f"Feuille inconnue: {sheet}")
+
+
+def sheet_has_formulas(file_path, sheet=None):
+    """Recherche rapide d'une balise de formule dans le xml de la feuille, sans le parser"""
+    with zipfile.ZipFile(file_path) as archive:
+        member = _sheet_member(archive, sheet)
+        with archive.open(member) as handle:
+            tail = b''
+            while True:
+                chunk = handle.read(1024 * 1024)
+                if not chunk:
+                    return False
+                if b'<f>' in tail + chunk or b'<f ' in tail + chunk:
+                    return True
+                tail = chunk[-4:]
+
+
+def _sheet_formulas(file_path, sheet):
+    """Formules lues dans le xml de la feuille: (colonne, ligne, texte, partage)
+
+    Les cellules qui suivent la cellule maîtresse d'une formule partagée
+    (recopie enregistrée par Excel) n'ont pas de texte: partage vaut alors
+    l'identifiant de la formule. Il vaut 'array' ou 'dataTable' pour les
+    formules matricielles et les tables de données.
+    """
+    with zipfile.ZipFile(file_path) as archive, archive.open(_sheet_member(archive, sheet)) as handle:
+        sheet_row = 0
+        index = -1
+        pending = []  # Formules de la ligne en cours (le numéro de ligne est connu à sa fermeture)
+        for _, element in ET.iterparse(handle):
+            tag = element.tag
+            if tag == CELL_TAG:
+                reference = element.get('r')
+                index = column_index(reference.rstrip('0123456789')) if reference else index + 1
+                formula = element.find(FORMULA_TAG)
+                if formula is not None:
+                    kind = formula.get('t')
+                    pending.append((index, f'={formula.text}' if formula.text else None,
+                                    formula.get('si') if kind == 'shared' else kind))
+            elif tag == ROW_TAG:
+                sheet_row = int(element.get('r', sheet_row + 1))
+                for index, text, shared in pending:
+                    yield index, sheet_row, text, shared
+                pending = []
+                index = -1
+                element.clear()
+            elif tag == SHEET_DATA_TAG:
+                element.clear()
+
+
+def _translate(text, index, sheet_row, target_index, target_row):
+    """Texte d'une formule recopiée d'une cellule vers une autre (références relatives décalées)"""
+    from openpyxl.formula.translate import Translator
+    origin = f'{column_letter(index)}{sheet_row}'
+    return Translator(text, origin=origin).translate_formula(f'{column_letter(target_index)}{target_row}')
+
+
+def _texts(index, positions, texts):
+    """{position: texte} d'une forme relative, textes des cellules partagées reconstitués"""
+    first_row = positions[0] + HEADER_ROWS + 1
+    return {position: text if text is not None else
+            _translate(texts[0], index, first_row, index, position + HEADER_ROWS + 1)
+            for position, text in zip(positions, texts)}
+
+
+def _relative_key(text, sheet_row):
+    """Texte de formule aux lignes relatives réécrites par rapport à la ligne hôte (clé de recopie)"""
+    def replace(match):
+        if match.group(1) is None or match.group(2):
+            return match.group()
+        return f'{match.group(1)}R[{int(match.group(3)) - sheet_row}]'
+    return _RELATIVE_REF.sub(replace, text)
+
+
+def read_formulas(file_path, file_type, sheet, columns):
+    """Formules d'une feuille (FormulaBook vide hors xlsx ou si le classeur est illisible)"""
+    if file_type not in FORMULA_FILE_TYPES:
+        return FormulaBook()
+    try:
+        return FormulaBook.from_workbook(file_path, sheet, list(columns))
+    except Exception as e:
+        logger.warning(f"Formules non lues, valeurs en cache seules: {str(e)}")
+        return FormulaBook()
+
+
+# --- Classeur de formules ------------------------------------------------------------
+
+class FormulaGroup:
+    """Formules de même gabarit dans une colonne (une formule recopiée vers le bas)"""
+
+    def __init__(self, column, template, labels):
+        self.column = column
+        self.template = template
+        self.labels = np.asarray(labels)
+        self.refs = _references(template)
+        # Référence à la ligne précédente de sa propre colonne (cumul): évaluation ligne à ligne
+        self.sequential = any(ref[0] == 'cell' and ref[1] == column and ref[2][0] == 'rel' for ref in self.refs)
+
+    @property
+    def key(self):
+        return (self.column, self.template)
+
+    def columns(self):
+        names = set()
+        for ref in self.refs:
+            names.update((ref[1],) if ref[0] == 'cell' else ref[1])
+        return names
+
+    def check(self, base):
+        """Lève FormulaError si le groupe dépend de ses propres cellules (référence circulaire)
+
+        Une plage de la colonne du groupe est acceptée si elle ne contient
+        aucune de ses cellules (total =SUM(C2:C5) en C6); ses bornes relatives
+        sont résolues pour chaque ligne hôte.
+        """
+        positions = base.index.get_indexer(self.labels)
+        positions = positions[positions >= 0]
+
+        def rows(spec):
+            if spec[0] == 'rel':
+                return positions + spec[1]
+            return np.full(len(positions), base.index.get_indexer([spec[1]])[0])
+
+        for ref in self.refs:
+            if ref[0] == 'cell' and ref[1] == self.column:
+                spec = ref[2]
+                if spec[0] == 'rel' and (spec[1] == 0 or spec[1] > 0 and np.isin(rows(spec), positions).any()):
+                    raise FormulaError("Référence circulaire (cellule de la même colonne, même ligne ou plus bas)")
+                if spec[0] == 'abs' and np.isin(spec[1], self.labels):
+                    raise FormulaError("Référence circulaire")
+            elif ref[0] == 'area' and self.column in ref[1]:
+                _, _, start, end = ref
+                if start is None:
+                    raise FormulaError("Référence circulaire (plage contenant la formule)")
+                first, last = rows(start), rows(end)
+                first, last = np.minimum(first, last), np.maximum(first, last)
+                # Cellules du groupe dans la plage d'une de ses lignes: évaluation d'un bloc impossible
+                hosts = np.sort(positions)
+                inside = np.searchsorted(hosts, last, side='right') - np.searchsorted(hosts, first)
+                if (inside > 0).any():
+                    raise FormulaError("Référence circulaire (plage contenant la formule)")
+        if len(self.labels) > 1 and any(spec is not None and spec[0] == 'rel'
+                                        for table in _lookup_tables(self.template) for spec in table[2:4]):
+            raise FormulaError("VLOOKUP: la table d'une formule recopiée doit être une plage absolue")
+
+
+class FormulaBook:
+    """Formules d'une feuille, groupées par gabarit, avec recalcul incrémental et rendu pour l'export"""
+
+    def __init__(self):
+        self.groups = {}
+        self.raw = {}  # {colonne: {étiquette: texte}} formules hors périmètre, gardées telles quelles
+        self._order = None
+        self._cyclic = False
+
+    def __len__(self):
+        return sum(len(group.labels) for group in self.groups.values()) + sum(map(len, self.raw.values()))
+
+    @classmethod
+    def from_workbook(cls, file_path, sheet, columns):
+        """Lit les formules d'une feuille xlsx pour un DataFrame aux colonnes columns
+
+        Les formules recopiées sont reconnues par leur forme relative (ou leur
+        identifiant de formule partagée): une seule analyse syntaxique par
+        groupe.
+        """
+        book = cls()
+        if not sheet_has_formulas(file_path, sheet):
+            return book
+
+        started = time.perf_counter()
+        found = {}  # (colonne, forme relative) -> (positions, textes ou None)
+        masters, shared_keys = {}, {}
+        for index, sheet_row, text, shared in _sheet_formulas(file_path, sheet):
+            position = sheet_row - HEADER_ROWS - 1
+            if index >= len(columns) or position < 0:
+                continue
+            if shared in ('array', 'dataTable'):
+                if text:
+                    book.raw.setdefault(columns[index], {})[position] = text
+                continue
+            if shared is not None:
+                if text is not None:
+                    masters[shared] = (text, index, sheet_row)
+                elif (shared, index) in shared_keys:
+                    positions, texts = found[shared_keys[(shared, index)]]
+                    positions.append(position)
+                    texts.append(None)
+                    continue
+                elif shared in masters:
+                    # Formule partagée sur plusieurs colonnes: texte de la première cellule de cette colonne
+                    text = _translate(*masters[shared], index, sheet_row)
+                else:
+                    continue
+            key = (index, _relative_key(text, sheet_row))
+            if shared is not None:
+                shared_keys.setdefault((shared, index), key)
+            positions, texts = found.setdefault(key, ([], []))
+            positions.append(position)
+            texts.append(text)
+
+        labels = lambda position: position  # Au chargement, l'étiquette d'une ligne est sa position
+        sources = {}
+        unsupported = 0
+        for key, (positions, texts) in found.items():
+            column = columns[key[0]]
+            try:
+                template = compile_formula(texts[0], positions[0], columns, labels)
+            except FormulaError as e:
+                logger.debug(f"Formule gardée sans recalcul ({texts[0]}): {str(e)}")
+                unsupported += len(positions)
+                book.raw.setdefault(column, {}).update(_texts(key[0], positions, texts))
+                continue
+            group = book.groups.setdefault((column, template), FormulaGroup(column, template, []))
+            group.labels = np.concatenate((group.labels, positions)).astype(np.int64)
+            sources.setdefault((column, template), []).append(key)
+        for key, group in list(book.groups.items()):
+            group.labels.sort()
+            try:
+                # Étiquettes = positions au chargement: index couvrant les lignes du groupe et celles référencées
+                referenced = [spec[1] for ref in group.refs for spec in (ref[2:3] if ref[0] == 'cell' else ref[2:4])
+                              if spec is not None and spec[0] == 'abs']
+                group.check(pd.DataFrame(index=pd.RangeIndex(max([group.labels.max(), *referenced]) + 1)))
+            except FormulaError:
+                del book.groups[key]
+                unsupported += len(group.labels)
+                for source in sources[key]:
+                    book.raw.setdefault(group.column, {}).update(_texts(source[0], *found[source]))
+        logger.info(f"{len(book)} formules lues en {time.perf_counter() - started:.2f}s "
+                    f"({len(book.groups)} groupes, {unsupported} sans recalcul)")
+        return book
+
+    # --- Définition et retrait de formules
+
+    @staticmethod
+    def compile(text, base, position):
+        """Compile une formule saisie dans la cellule à la position donnée de la base courante"""
+        columns = list(base.columns)
+
+        def label_at(row):
+            if not 0 <= row < len(base):
+                raise FormulaError("Référence hors des données")
+            return base.index[row]
+        return compile_formula(text, position, columns, label_at)
+
+    def take(self, column, labels=None):
+        """Retire les formules des cellules (toute la colonne si labels est None); renvoie les entrées retirées"""
+        removed = []
+        for key, group in list(self.groups.items()):
+            if group.column != column:
+                continue
+            mask = np.ones(len(group.labels), dtype=bool) if labels is None else np.isin(group.labels, labels)
+            if not mask.any():
+                continue
+            removed.append(('group', column, group.template, group.labels[mask]))
+            if mask.all():
+                del self.groups[key]
+            else:
+                group.labels = group.labels[~mask]
+        raw = self.raw.get(column, {})
+        taken = {label: raw.pop(label) for label in (list(raw) if labels is None else labels) if label in raw}
+        if taken:
+            removed.append(('raw', column, taken))
+        if removed:
+            self._order = None
+        return removed
+
+    def put(self, entries, base=None):
+        """Réinstalle des entrées (retirées par take ou nouvelles)
+
+        Si base est fourni, lève FormulaError en cas de référence circulaire
+        (l'appelant annule alors l'installation avec swap).
+        """
+        for entry in entries:
+            if entry[0] == 'raw':
+                self.raw.setdefault(entry[1], {}).update(entry[2])
+                continue
+            _, column, template, labels = entry
+            group = self.groups.get((column, template))
+            merged = FormulaGroup(column, template, labels if group is None else
+                                  np.union1d(group.labels, labels))
+            if base is not None:
+                merged.check(base)
+            self.groups[(column, template)] = merged
+        self._order = None
+        if base is not None and entries:
+            self._ordered()
+            if self._cyclic:
+                raise FormulaError("Dépendance circulaire entre colonnes de formules")
+
+    def swap(self, removed, added):
+        """Retire les cellules des entrées removed puis installe les entrées added (annulation)"""
+        for entry in removed:
+            self.take(entry[1], list(entry[2]) if entry[0] == 'raw' else entry[3])
+        self.put(added)
+
+    # --- Recalcul
+
+    def _ordered(self):
+        """Groupes triés selon leurs dépendances (colonnes produites avant les colonnes lues)"""
+        if self._order is not None:
+            return self._order
+        producers = {}
+        for group in self.groups.values():
+            producers.setdefault(group.column, []).append(group)
+        # Deux groupes d'une même colonne qui la lisent tous deux (cumul et sa première ligne) ne sont
+        # pas ordonnés entre eux: les lignes du haut passent d'abord
+        pending = {group.key: {other.key for column in group.columns() for other in producers.get(column, [])
+                               if other is not group and not (other.column == group.column
+                                                              and group.column in other.columns())}
+                   for group in self.groups.values()}
+        order = []
+        self._cyclic = False
+        while pending:
+            ready = sorted((key for key, needs in pending.items() if not needs & pending.keys()),
+                           key=lambda key: self.groups[key].labels.min(initial=0))
+            if not ready:
+                # Dépendances croisées lues dans le classeur: ordre arbitraire pour ces groupes
+                self._cyclic = True
+                ready = list(pending)
+            for key in ready:
+                order.append(self.groups[key])
+                del pending[key]
+        self._order = order
+        return order
+
+    def _affected(self, group, positions, changed, context):
+        """Lignes du groupe touchées par les cellules modifiées (changed: {colonne: positions})"""
+        dirty = np.zeros(len(positions), dtype=bool)
+        for ref in group.refs:
+            if ref[0] == 'cell':
+                _, column, spec = ref
+                if column not in changed:
+                    continue
+                if spec[0] == 'rel':
+                    dirty |= np.isin(positions, changed[column] - spec[1])
+                elif np.isin(context.label_position(spec[1]), changed[column]):
+                    return np.ones(len(positions), dtype=bool)
+                continue
+            _, names, start, end = ref
+            touched = [changed[column] for column in names if column in changed]
+            if not touched:
+                continue
+            touched = np.concatenate(touched)
+            if start is not None and start == end and start[0] == 'rel':
+                dirty |= np.isin(positions, touched - start[1])
+            elif start is None or (start[0] == 'abs' and end[0] == 'abs'):
+                first, last = context.span(start, end)
+                if ((touched >= first) & (touched <= last)).any():
+                    return np.ones(len(positions), dtype=bool)
+            else:
+                return np.ones(len(positions), dtype=bool)
+        return dirty
+
+    def recalculate(self, base, changed, write, forced=None):
+        """Réévalue les formules en aval des cellules modifiées
+
+        changed: {colonne: étiquettes modifiées}; forced: {(colonne, gabarit):
+        étiquettes} à évaluer quoi qu'il arrive (nouvelles formules).
+        write(colonne, étiquettes, valeurs) écrit les résultats qui diffèrent
+        de la base avant l'évaluation des groupes suivants. Renvoie le nombre
+        de cellules dont la valeur a changé.
+        """
+        changed = {column: base.index.get_indexer(labels) for column, labels in changed.items()}
+        if self._order is None and self._ordered() and self._cyclic:
+            logger.warning("Dépendances circulaires entre colonnes de formules: ordre de recalcul arbitraire")
+        forced = forced or {}
+        recalculated = 0
+        for group in self._ordered():
+            context = _Context(base, np.array([], dtype=np.int64))
+            positions = base.index.get_indexer(group.labels)
+            dirty = self._affected(group, positions, changed, context)
+            if group.key in forced:
+                dirty |= np.isin(group.labels, forced[group.key])
+            dirty &= positions >= 0
+            if not dirty.any():
+                continue
+            if group.sequential:
+                dirty |= (positions >= positions[dirty].min())
+            order = np.argsort(positions[dirty], kind='stable')
+            labels, targets = group.labels[dirty][order], positions[dirty][order]
+            try:
+                values = self.evaluate(group, base, targets)
+            except FormulaError as e:
+                logger.warning(f"Formules de la colonne {group.column} non recalculées: {str(e)}")
+                continue
+            # Seules les valeurs qui changent sont écrites et propagées aux formules suivantes
+            differs = ~_same(_Context(base, targets).column(group.column)[targets], values)
+            if not differs.any():
+                continue
+            write(group.column, labels[differs], values[differs])
+            changed[group.column] = np.union1d(changed.get(group.column, np.array([], dtype=np.int64)),
+                                               targets[differs])
+            recalculated += int(differs.sum())
+        return recalculated
+
+    def evaluate(self, group, base, positions):
+        """Valeurs du groupe aux positions données (d'un bloc, ou ligne à ligne pour un cumul)"""
+        if not group.sequential:
+            return _result_array(_evaluate(group.template, _Context(base, positions)), len(positions))
+        increment = _running_increment(group.template, group.column)
+        if increment is not None:
+            return self._running_sum(group, base, positions, increment)
+        own = _Context(base, positions).column(group.column)
+        own = own.astype(float) if own.dtype.kind in 'iub' else own.copy()
+        context = _Context(base, positions[:1], override={group.column: own})
+        values = []
+        for position in positions:
+            context.positions = np.array([position])  # Colonnes lues une fois pour toutes les lignes
+            value = _evaluate(group.template, context)
+            value = value[0] if _is_array(value) else value
+            values.append(value)
+            if own.dtype.kind == 'f':
+                own[position] = _scalar_number(value, np.nan)
+            else:
+                own[position] = value
+        return np.array(values, dtype=float if all(isinstance(v, (float, int, np.number)) and not
+                                                   isinstance(v, (bool, np.bool_)) for v in values) else object)
+
+    @staticmethod
+    def _running_sum(group, base, positions, increment):
+        """Cumul (=D2+C3 recopiée): sommes cumulées par suite de lignes consécutives"""
+        context = _Context(base, positions)
+        steps = _numbers(_result_array(_evaluate(increment, context), len(positions)))
+        own = _numbers(context.column(group.column))
+        values = np.empty(len(positions))
+        runs = np.split(np.arange(len(positions)), np.flatnonzero(np.diff(positions) != 1) + 1)
+        for run in runs:
+            previous = positions[run[0]] - 1
+            seed = own[previous] if 0 <= previous < len(own) else 0.0
+            with np.errstate(all='ignore'):
+                values[run] = _finite(seed + np.cumsum(steps[run]))
+        return values
+    
+    def missing(self, base):
+        """Cellules à formule sans valeur en cache (classeur jamais recalculé): {(colonne, gabarit): étiquettes}"""
+        forced = {}
+        for group in self.groups.values():
+            if group.column not in base.columns:
+                continue
+            positions = base.index.get_indexer(group.labels)
+            values = base[group.column].to_numpy()[positions[positions >= 0]]
+            empty = pd.isna(values)
+            if empty.any():
+                forced[group.key] = group.labels[positions >= 0][empty]
+        return forced
+
+    # --- Export
+
+    def render(self, base):
+        """Texte des formules pour la disposition courante: {colonne: (positions triées, textes)}"""
+        index = {column: position for position, column in enumerate(base.columns)}
+        rendered = {}
+        for group in self.groups.values():
+            if group.column not in index or not group.columns() <= index.keys():
+                continue
+            positions = base.index.get_indexer(group.labels)
+            positions = positions[positions >= 0]
+            try:
+                parts = ['='] + _render_parts(group.template, lambda column: column_letter(index[column]),
+                                              lambda label: base.index.get_loc(label) + HEADER_ROWS + 1)
+            except KeyError:
+                continue  # Ligne référencée supprimée
+            offsets = [part for part in parts if not isinstance(part, str)]
+            if offsets and (positions + min(offsets)).min(initial=0) < -HEADER_ROWS:
+                positions = positions[positions + min(offsets) >= -HEADER_ROWS]
+            texts = [''.join(part if isinstance(part, str) else str(position + part + HEADER_ROWS + 1)
+                             for part in parts) for position in positions]
+            rendered.setdefault(group.column, []).append((positions, texts))
+        for column, cells in self.raw.items():
+            if column in index and cells:
+                positions = base.index.get_indexer(list(cells))
+                kept = positions >= 0
+                rendered.setdefault(column, []).append(
+                    (positions[kept], [text for text, keep in zip(cells.values(), kept) if keep]))
+
+        result = {}
+        for column, blocks in rendered.items():
+            positions = np.concatenate([block[0] for block in blocks])
+            texts = [text for block in blocks for text in block[1]]
+            order = np.argsort(positions, kind='stable')
+            result[column] = (positions[order], [texts[i] for i in order])
+        return result
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Tri et filtrage vectorisés pour le modèle de lignes côté serveur d'AG-Grid
+Traduit les sortModel / filterModel d'AG-Grid en opérations pandas/NumPy
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _as_numeric(series):
+    """Vue numérique d'une colonne (les valeurs non numériques deviennent NaN)"""
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series
+    return pd.to_numeric(series, errors='coerce')
+
+
+def _as_text(series):
+    """Vue texte en minuscules d'une colonne, les valeurs vides deviennent ''"""
+    return series.astype(object).where(series.notna(), '').astype(str).str.lower()
+
+
+def _blank_mask(series):
+    """Cellules vides: NaN/None ou chaîne vide"""
+    mask = series.isna()
+    if not pd.api.types.is_numeric_dtype(series):
+        mask |= series.astype(object).eq('')
+    return mask.to_numpy()
+
+
+def _number_mask(series, condition):
+    values = _as_numeric(series)
+    kind = condition.get('type', 'equals')
+    target = condition.get('filter')
+    if kind == 'inRange':
+        low, high = float(target), float(condition.get('filterTo'))
+        return values.between(low, high).to_numpy()
+    target = float(target)
+    operations = {
+        'equals': values.eq,
+        'notEqual': values.ne,
+        'lessThan': values.lt,
+        'lessThanOrEqual': values.le,
+        'greaterThan': values.gt,
+        'greaterThanOrEqual': values.ge,
+    }
+    if kind not in operations:
+        raise ValueError(f"Type de filtre numérique non supporté: {kind}")
+    return operations[kind](target).to_numpy()
+
+
+def _date_mask(series, condition):
+    values = pd.to_datetime(series, errors='coerce')
+    kind = condition.get('type', 'equals')
+    target = pd.to_datetime(condition.get('dateFrom') or condition.get('filter'))
+    if kind == 'inRange':
+        high = pd.to_datetime(condition.get('dateTo') or condition.get('filterTo'))
+        return values.between(target, high).to_numpy()
+    operations = {
+        'equals': values.eq,
+        'notEqual': values.ne,
+        'lessThan': values.lt,
+        'greaterThan': values.gt,
+    }
+    if kind not in operations:
+        raise ValueError(f"Type de filtre date non supporté: {kind}")
+    return operations[kind](target).to_numpy()
+
+
+def _text_mask(series, condition):
+    values = _as_text(series)
+    kind = condition.get('type', 'contains')
+    target = str(condition.get('filter', '')).lower()
+    if kind == 'contains':
+        return values.str.contains(target, regex=False).to_numpy()
+    if kind == 'notContains':
+        return ~values.str.contains(target, regex=False).to_numpy()
+    if kind == 'equals':
+        return values.eq(target).to_numpy()
+    if kind == 'notEqual':
+        return values.ne(target).to_numpy()
+    if kind == 'startsWith':
+        return values.str.startswith(target).to_numpy()
+    if kind == 'endsWith':
+        return values.str.endswith(target).to_numpy()
+    raise ValueError(f"Type de filtre texte non supporté: {kind}")
+
+
+def condition_mask(series, condition):
+    """Masque booléen NumPy d'une condition de filtre AG-Grid sur une colonne"""
+    if 'conditions' in condition or 'condition1' in condition:
+        # Conditions combinées (AND / OR)
+        conditions = condition.get('conditions') or [condition['condition1'], condition['condition2']]
+        masks = [condition_mask(series, cond) for cond in conditions]
+        if condition.get('operator', 'AND').upper() == 'OR':
+            return np.logical_or.reduce(masks)
+        return np.logical_and.reduce(masks)
+
+    kind = condition.get('type')
+    if kind == 'blank':
+        return _blank_mask(series)
+    if kind == 'notBlank':
+        return ~_blank_mask(series)
+
+    filter_type = condition.get('filterType', 'text')
+    if filter_type == 'set':
+        allowed = [str(value) for value in condition.get('values', [])]
+        return _as_text(series).isin([value.lower() for value in allowed]).to_numpy()
+    if filter_type == 'number':
+        return _number_mask(series, condition)
+    if filter_type == 'date':
+        return _date_mask(series, condition)
+    return _text_mask(series, condition)
+
+
+def filter_mask(df, filter_model):
+    """Masque booléen combinant (ET) les filtres de toutes les colonnes, ou None"""
+    if not filter_model:
+        return None
+    mask = np.ones(len(df), dtype=bool)
+    for column, condition in filter_model.items():
+        if column not in df.columns:
+            raise KeyError(f"Colonne de filtre inconnue: {column}")
+        mask &= condition_mask(df[column], condition)
+    return mask
+
+
+def sort_key(sort_model):
+    """Clé hashable identifiant un sortModel (pour le cache des tris)"""
+    return tuple((item['colId'], item.get('sort', 'asc')) for item in sort_model or [])
+
+
+def sort_order(df, sort_model):
+    """Positions des lignes triées selon sortModel (tri stable, vides en dernier)"""
+    key = sort_key(sort_model)
+    columns = [column for column, _ in key]
+    for column in columns:
+        if column not in df.columns:
+            raise KeyError(f"Colonne de tri inconnue: {column}")
+    ascending = [direction != 'desc' for _, direction in key]
+
+    frame = df[columns].reset_index(drop=True)
+    try:
+        ordered = frame.sort_values(columns, ascending=ascending, kind='stable', na_position='last')
+    except TypeError:
+        # Colonnes mixtes (nombres et texte): trier sur la représentation texte
+        ordered = frame.astype(str).sort_values(columns, ascending=ascending, kind='stable')
+    return ordered.index.to_numpy()
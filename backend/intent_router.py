@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+Routage local des commandes en langage naturel
+Classe la commande (somme, moyenne, min/max/médiane, comptage, filtre, tri,
+N plus grandes/petites valeurs, ajout de colonne, jointure avec un fichier
+de référence) et extrait ses paramètres sans appel réseau. Les colonnes sont retrouvées
+de façon approchée parmi celles du fichier et chaque décision reçoit un
+score de confiance: au-dessus du seuil, la commande est exécutée localement,
+sinon elle est transmise au modèle. L'action produite suit le même format
+JSON que les réponses du modèle ({"action", "column", "operation", ...}).
+"""
+
+import logging
+import re
+import threading
+import time
+from difflib import SequenceMatcher
+
+from ai_cache import normalize_command
+
+logger = logging.getLogger(__name__)
+
+# Mots-clés (normalisés, sans accents) de chaque intention
+INTENT_KEYWORDS = {
+    'sum': ('somme', 'sum', 'total', 'additionne'),
+    'mean': ('moyenne', 'mean', 'average', 'moyen'),
+    'min': ('minimum', 'min'),
+    'max': ('maximum', 'max'),
+    'median': ('mediane', 'median'),
+    'count': ('combien', 'compte', 'count', 'nombre de lignes'),
+    'filter': ('filtre', 'filter', 'uniquement', 'seulement', 'garde'),
+    'sort': ('trie', 'tri', 'sort', 'ordonne', 'classe'),
+    'top': ('top', 'premiers', 'premieres', 'plus grands', 'plus grandes', 'plus eleves', 'plus elevees',
+            'plus petits', 'plus petites', 'plus faibles'),
+    'add_column': ('ajoute', 'add', 'cree', 'nouvelle colonne'),
+    'join': ('depuis le fichier', 'depuis la reference', 'du fichier', 'recherchev', 'vlookup', 'jointure',
+             'joins', 'joindre', 'fusionne', 'merge', 'enrichis'),
+}
+
+DESCENDING_WORDS = ('decroissant', 'desc', 'descending', 'plus grand au plus petit', 'inverse')
+SMALLEST_WORDS = ('plus petit', 'plus faible', 'moins eleve', 'bottom')
+
+# Opérateurs de comparaison (symboles puis formulations), vers les types de filtre AG-Grid
+OPERATORS = [
+    (r'>=|≥|superieure? ou egale? a|au moins', 'greaterThanOrEqual'),
+    (r'<=|≤|inferieure? ou egale? a|au plus', 'lessThanOrEqual'),
+    (r'!=|<>|different de', 'notEqual'),
+    (r'>|superieure? a|plus grande? que|depasse', 'greaterThan'),
+    (r'<|inferieure? a|plus petite? que|moins de', 'lessThan'),
+    (r'==|=|egale? a|vaut', 'equals'),
+]
+NUMBER = r'(-?\d+(?:[.,]\d+)?)'
+COMPARISON = rf"(?:{'|'.join(pattern for pattern, _ in OPERATORS)})\s*{NUMBER}"
+# Conditions combinées et restrictions ("... et la quantité < 3", "sauf pour le nord"): laissées au modèle
+CONNECTIVES = r'(?<!\w)(?:et|ou|and|or)(?!\w)'
+GROUP_WORDS = r'(?<!\w)(?:par|by|pour chaque)(?!\w)'
+QUALIFIERS = r'(?<!\w)(?:sauf|hors|excepte|exceptes|exceptee|exceptees|except|excluding|sans)(?!\w)'
+
+STOPWORDS = {
+    'la', 'le', 'les', 'de', 'des', 'du', 'une', 'un', 'colonne', 'column', 'the', 'of', 'par',
+    'sur', 'ou', 'dont', 'avec', 'en', 'et', 'a', 'lignes', 'ligne', 'valeurs', 'calcule', 'calculer',
+    'donne', 'moi', 'quelle', 'est', 'by', 'where', 'rows', 'ordre', 'croissant',
+}
+
+PRICE_WORDS = ('prix', 'price', 'montant', 'amount', 'total')
+
+# Mots introduisant la colonne clé d'une jointure ("... par référence", "... selon le code")
+JOIN_KEY_WORDS = r'(?<!\w)(?:par|by|selon|via|sur la colonne|avec la cle)(?!\w)'
+
+
+def _column_score(text, column):
+    """Similarité entre un fragment de commande et un nom de colonne (0 à 1)"""
+    name = normalize_command(str(column))
+    if not name:
+        return 0.0
+    if re.search(rf'(?<!\w){re.escape(name)}(?!\w)', text):
+        return 1.0
+    words = [word for word in text.split() if word not in STOPWORDS]
+    size = max(len(name.split()), 1)
+    best = 0.0
+    for start in range(len(words)):
+        for width in (size - 1, size, size + 1):
+            if width < 1 or start + width > len(words):
+                continue
+            fragment = ' '.join(words[start:start + width])
+            best = max(best, SequenceMatcher(None, fragment, name).ratio())
+    return best
+
+
+def resolve_column(text, columns, exclude=()):
+    """Colonne la plus proche d'un fragment normalisé: (colonne, score) ou (None, 0)"""
+    best_column, best_score = None, 0.0
+    for column in columns:
+        if column in exclude:
+            continue
+        score = _column_score(text, column)
+        # À score égal, le nom le plus long (le plus spécifique) l'emporte
+        if score > best_score or (score == best_score and best_column is not None
+                                  and len(str(column)) > len(str(best_column))):
+            best_column, best_score = column, score
+    return best_column, best_score
+
+
+def _find_condition(text):
+    """Première comparaison 'opérateur nombre' de la commande: (type, valeur, début) ou None"""
+    for pattern, kind in OPERATORS:
+        match = re.search(rf'(?:{pattern})\s*{NUMBER}', text)
+        if match:
+            return kind, float(match.group(1).replace(',', '.')), match.start()
+    return None
+
+
+def _without_columns(text, columns):
+    """Commande sans les noms de colonnes cités ("Total", "Prix et taxes"...)"""
+    # Noms les plus longs d'abord: "Prix et taxes" avant "Prix"
+    for name in sorted((normalize_command(str(column)) for column in columns), key=len, reverse=True):
+        if name:
+            text = re.sub(rf'(?<!\w){re.escape(name)}(?!\w)', ' ', text)
+    return text
+
+
+def _is_compound(command, columns, grouped=False):
+    """Vrai si la commande a plusieurs comparaisons, une restriction (sauf, hors...)
+    ou des termes reliés par et/ou: une seule condition ne la décrirait pas entièrement
+
+    grouped: les et/ou après "par" listent des colonnes de regroupement et sont admis.
+    """
+    # "où" n'est pas le connecteur "ou", que la normalisation sans accents confondrait
+    text = normalize_command(re.sub(r'(?<!\w)où(?!\w)', ' ', command, flags=re.IGNORECASE))
+    text = _without_columns(text, columns)
+    if len(re.findall(COMPARISON, text)) > 1 or re.search(QUALIFIERS, text):
+        return True
+    if grouped:
+        text = re.split(GROUP_WORDS, text, maxsplit=1)[0]
+    # "supérieur ou égal à" est un seul opérateur
+    text = re.sub('|'.join(pattern for pattern, _ in OPERATORS), ' ', text)
+    return re.search(CONNECTIVES, text) is not None
+
+
+def _detect_intents(text, columns, joinable=False):
+    # Les noms de colonnes cités ("Total", "Classe"...) ne sont pas des mots-clés
+    text = _without_columns(text, columns)
+    found = []
+    for intent, keywords in INTENT_KEYWORDS.items():
+        if any(re.search(rf'(?<!\w){re.escape(keyword)}', text) for keyword in keywords):
+            found.append(intent)
+    # Jointure ("ajoute le prix depuis le fichier tarifs"): seulement si un fichier de référence est chargé
+    if 'join' in found:
+        if joinable:
+            return ['join']
+        found.remove('join')
+    # "ajoute une colonne": la colonne ajoutée n'est pas une demande de total/tri
+    if 'add_column' in found and ('colonne' in text or 'column' in text or 'tva' in text):
+        return ['add_column']
+    if 'add_column' in found:
+        found.remove('add_column')
+    return found
+
+
+class IntentRouter:
+    """Classifieur d'intentions local avec statistiques de contournement du modèle"""
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.counters = {'local': 0, 'escalated': 0}
+        self.by_intent = {}
+
+    def route(self, command, columns, references=None):
+        """Renvoie {'intent', 'action', 'confidence', 'local'} ou None si la commande est inconnue
+
+        references ({nom: [colonnes]}) décrit les fichiers de référence de la session.
+        """
+        started = time.perf_counter()
+        text = normalize_command(command)
+        intents = _detect_intents(text, columns, joinable=bool(references))
+
+        decision = None
+        if intents == ['join']:
+            decision = self._slots_join(text, list(columns), command, references)
+        elif len(intents) == 1:
+            decision = getattr(self, f'_slots_{intents[0]}')(text, list(columns), command)
+        elif len(intents) > 1:
+            # Commande composée (ex. "somme ... triée ..."): laissée au modèle
+            decision = {'intent': '+'.join(intents), 'action': None, 'confidence': 0.0}
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if decision is None:
+            self._count(None, False)
+            logger.info(f"Routage: aucune intention reconnue -> modèle ({elapsed_ms:.2f} ms)")
+            return None
+
+        decision['local'] = decision['action'] is not None and decision['confidence'] >= self.threshold
+        self._count(decision['intent'], decision['local'])
+        logger.info(f"Routage: {decision['intent']} (confiance {decision['confidence']:.2f}) -> "
+                    f"{'local' if decision['local'] else 'modèle'} ({elapsed_ms:.2f} ms)")
+        return decision
+
+    def _count(self, intent, local):
+        with self._lock:
+            self.counters['local' if local else 'escalated'] += 1
+            if intent is not None:
+                entry = self.by_intent.setdefault(intent, {'local': 0, 'escalated': 0})
+                entry['local' if local else 'escalated'] += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.counters['local'] + self.counters['escalated']
+            return {
+                'local': self.counters['local'],
+                'escalated': self.counters['escalated'],
+                'bypass_rate': round(self.counters['local'] / total, 3) if total else None,
+                'by_intent': {intent: dict(entry) for intent, entry in self.by_intent.items()},
+                'threshold': self.threshold
+            }
+
+    # Extraction des paramètres de chaque intention
+
+    def _aggregate(self, intent, text, columns, command):
+        """Agrégat d'une colonne, éventuellement "par" une ou plusieurs colonnes de regroupement"""
+        if _find_condition(text) is not None or _is_compound(command, columns, grouped=True):
+            # Agrégat sous condition, avec exclusion ou sur plusieurs colonnes: plan en plusieurs étapes, laissé au modèle
+            return {'intent': intent, 'action': None, 'confidence': 0.0}
+
+        parts = re.split(GROUP_WORDS, text, maxsplit=1)
+        column, score = resolve_column(parts[0], columns)
+        action = {'action': 'calculate', 'operation': intent, 'column': column}
+        if len(parts) == 2:
+            group_by = []
+            for fragment in re.split(r'(?<!\w)(?:et|and)(?!\w)|,', parts[1]):
+                key, key_score = resolve_column(fragment, columns, exclude=(column,))
+                if key is None:
+                    return {'intent': intent, 'action': None, 'confidence': 0.0}
+                group_by.append(key)
+                score = min(score, key_score)
+            action['groupBy'] = group_by
+
+        # Deux colonnes citées pour un seul agrégat: interprétation ambiguë
+        # (un nom inclus dans celui de la colonne retenue, comme Prix dans Prix HT, ne compte pas)
+        chosen = normalize_command(str(column))
+        exact = [other for other in columns if other != column and other not in action.get('groupBy', [])
+                 and normalize_command(str(other)) not in chosen and _column_score(parts[0], other) == 1.0]
+        if exact:
+            score = min(score, 0.5)
+        return {'intent': intent, 'action': action if column is not None else None, 'confidence': score}
+
+    def _slots_sum(self, text, columns, command):
+        return self._aggregate('sum', text, columns, command)
+
+    def _slots_mean(self, text, columns, command):
+        return self._aggregate('mean', text, columns, command)
+
+    def _slots_min(self, text, columns, command):
+        return self._aggregate('min', text, columns, command)
+
+    def _slots_max(self, text, columns, command):
+        return self._aggregate('max', text, columns, command)
+
+    def _slots_median(self, text, columns, command):
+        return self._aggregate('median', text, columns, command)
+
+    def _slots_count(self, text, columns, command):
+        action = {'action': 'calculate', 'operation': 'count', 'column': None}
+        if _is_compound(command, columns):
+            return {'intent': 'count', 'action': None, 'confidence': 0.0}
+        condition = _find_condition(text)
+        if condition is None:
+            return {'intent': 'count', 'action': action, 'confidence': 1.0}
+        kind, value, position = condition
+        column, score = resolve_column(text[:position], columns)
+        action.update(column=column, condition={'filterType': 'number', 'type': kind, 'filter': value})
+        return {'intent': 'count', 'action': action if column is not None else None, 'confidence': score}
+
+    def _slots_filter(self, text, columns, command):
+        condition = _find_condition(text)
+        if condition is None or _is_compound(command, columns):
+            return {'intent': 'filter', 'action': None, 'confidence': 0.0}
+        kind, value, position = condition
+        column, score = resolve_column(text[:position], columns)
+        action = {
+            'action': 'filter',
+            'column': column,
+            'condition': {'filterType': 'number', 'type': kind, 'filter': value}
+        }
+        return {'intent': 'filter', 'action': action if column is not None else None, 'confidence': score}
+
+    def _slots_sort(self, text, columns, command):
+        if _is_compound(command, columns):
+            # Tri sur plusieurs colonnes ("par région et prix"): laissé au modèle
+            return {'intent': 'sort', 'action': None, 'confidence': 0.0}
+        column, score = resolve_column(text, columns)
+        ascending = not any(word in text for word in DESCENDING_WORDS)
+        action = {'action': 'sort', 'column': column, 'ascending': ascending}
+        return {'intent': 'sort', 'action': action if column is not None else None, 'confidence': score}
+
+    def _slots_top(self, text, columns, command):
+        """N plus grandes (ou plus petites) valeurs: "top 5 des prix", "les 3 plus petits montants" """
+        if _find_condition(text) is not None or _is_compound(command, columns):
+            return {'intent': 'top', 'action': None, 'confidence': 0.0}
+        count = re.search(r'(?<![\w.,])(\d+)(?![\w.,])', text)
+        column, score = resolve_column(re.sub(NUMBER, ' ', text), columns)
+        action = {
+            'action': 'top',
+            'column': column,
+            'n': int(count.group(1)) if count else 10,
+            'largest': not any(word in text for word in SMALLEST_WORDS)
+        }
+        return {'intent': 'top', 'action': action if column is not None else None, 'confidence': score}
+
+    def _slots_add_column(self, text, columns, command):
+        """Colonne calculée en pourcentage: "ajoute une colonne TVA à 18% du Prix" """
+        percentage = re.search(rf'{NUMBER}\s*(?:%|pour ?cent)', text)
+        name_match = re.search(r'colonne\s+(\w+)', text) or re.search(r'(?<!\w)(tva)(?!\w)', text)
+        if percentage is None or name_match is None:
+            return {'intent': 'add_column', 'action': None, 'confidence': 0.0}
+
+        # Nom de la nouvelle colonne avec la casse saisie par l'utilisateur
+        original = re.search(r'colonne\s+(\w+)', command, re.IGNORECASE)
+        name = original.group(1) if original else name_match.group(1)
+        name = 'TVA' if name.lower() == 'tva' else name
+        rest = text[:name_match.start()] + text[name_match.end():]
+        source, score = resolve_column(re.sub(NUMBER, ' ', rest), columns, exclude=(name,))
+        if score < self.threshold:
+            # Pas de colonne source explicite: première colonne de prix/montant
+            source = next((column for column in columns
+                           if any(word in str(column).lower() for word in PRICE_WORDS)), None)
+            score = 0.85 if source is not None else 0.0
+        action = {
+            'action': 'add_column',
+            'operation': 'percentage',
+            'column': name,
+            'value': float(percentage.group(1).replace(',', '.')),
+            'source': source
+        }
+        return {'intent': 'add_column', 'action': action if source is not None else None, 'confidence': score}
+
+    def _slots_join(self, text, columns, command, references):
+        """Colonne d'un fichier de référence ajoutée par clé: "ajoute le prix depuis le fichier tarifs par référence" """
+        reference, score = resolve_column(text, list(references))
+        if score < self.threshold:
+            if len(references) > 1:
+                return {'intent': 'join', 'action': None, 'confidence': 0.0}
+            reference, score = next(iter(references)), 0.85  # Seul fichier de référence de la session
+        # Le nom du fichier n'est ni la clé ni la colonne demandée
+        text = re.sub(rf'(?<!\w){re.escape(normalize_command(reference))}(?!\w)', ' ', text)
+        parts = re.split(JOIN_KEY_WORDS, text, maxsplit=1)
+        if len(parts) != 2:
+            # Sans clé explicite: colonne commune aux deux fichiers (choisie à l'exécution)
+            key, key_score = None, 0.85
+        else:
+            key, key_score = resolve_column(parts[1], columns)
+        target, target_score = resolve_column(parts[0], references[reference], exclude=(key,))
+        action = {'action': 'join', 'reference': reference, 'on': key, 'columns': [target]}
+        confidence = min(score, key_score, target_score)
+        return {'intent': 'join', 'action': action if target is not None else None, 'confidence': confidence}
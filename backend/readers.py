@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Lecture des classeurs: moteurs interchangeables et accès feuille par feuille
+- liste des feuilles sans parser les données (xl/workbook.xml seulement)
+- moteur calamine (Rust) si python-calamine est installé, sinon openpyxl,
+  que pandas ouvre déjà en mode read_only (lecture en flux)
+- aperçus rapides avec usecols / nrows
+- avancement de la lecture mesuré en octets consommés du fichier source
+"""
+
+import io
+import logging
+import os
+import zipfile
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+try:
+    import python_calamine  # noqa: F401 - moteur 'calamine' de pandas >= 2.2
+    HAS_CALAMINE = tuple(int(part) for part in pd.__version__.split('.')[:2]) >= (2, 2)
+except ImportError:
+    HAS_CALAMINE = False
+
+logger = logging.getLogger(__name__)
+
+SPREADSHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+def available_engines():
+    """Moteurs de lecture Excel utilisables dans cet environnement"""
+    engines = ['openpyxl', 'xlrd']
+    if HAS_CALAMINE:
+        engines.insert(0, 'calamine')
+    return engines
+
+
+def resolve_engine(file_type, engine='auto'):
+    """Choisit le moteur pandas.read_excel pour un type de fichier"""
+    if engine and engine != 'auto':
+        if engine not in available_engines():
+            raise ValueError(f"Moteur de lecture non disponible: {engine}")
+        return engine
+    if HAS_CALAMINE:
+        return 'calamine'
+    return 'xlrd' if file_type == 'xls' else 'openpyxl'
+
+
+def list_sheets(file_path, file_type):
+    """Noms des feuilles du classeur, sans lire les cellules ([] pour un CSV)"""
+    if file_type == 'csv':
+        return []
+    if file_type == 'xls':
+        import xlrd
+        workbook = xlrd.open_workbook(file_path, on_demand=True)
+        try:
+            return workbook.sheet_names()
+        finally:
+            workbook.release_resources()
+
+    # xlsx: seule la déclaration des feuilles est lue, pas les données
+    with zipfile.ZipFile(file_path) as archive:
+        root = ET.fromstring(archive.read('xl/workbook.xml'))
+    return [sheet.get('name') for sheet in root.iter(f'{SPREADSHEET_NS}sheet')]
+
+
+class ProgressFile(io.FileIO):
+    """Fichier binaire qui signale progress(octets lus, taille) à chaque lecture
+
+    pandas et openpyxl lisent la source en flux (le xml d'une feuille est
+    décompressé au fil du parsing): les octets consommés suivent l'avancement
+    sans modifier le résultat de la lecture. calamine et xlrd lisent tout
+    d'un bloc, l'avancement passe alors directement à la fin.
+    """
+
+    def __init__(self, file_path, progress):
+        super().__init__(file_path, 'rb')
+        self.size = os.path.getsize(file_path)
+        self.consumed = 0
+        self._progress = progress
+
+    def _advance(self, count):
+        self.consumed += count or 0
+        self._progress(min(self.consumed, self.size), self.size)
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self._advance(len(data))
+        return data
+
+    def readinto(self, buffer):
+        count = super().readinto(buffer)
+        self._advance(count)
+        return count
+
+
+def read_sheet(file_path, file_type, sheet=None, usecols=None, nrows=None, engine='auto', progress=None):
+    """Parse une feuille (ou le CSV) en DataFrame, éventuellement partiellement
+
+    progress(octets lus, taille du fichier) est appelé pendant la lecture.
+    """
+    if progress is not None:
+        with ProgressFile(file_path, progress) as source:
+            return read_sheet(source, file_type, sheet, usecols, nrows, engine)
+
+    if file_type == 'csv':
+        return pd.read_csv(file_path, usecols=usecols, nrows=nrows)
+
+    engine = resolve_engine(file_type, engine)
+    logger.info(f"Lecture de la feuille {sheet or '(première)'} avec le moteur {engine}")
+    return pd.read_excel(
+        file_path,
+        sheet_name=sheet if sheet is not None else 0,
+        usecols=usecols,
+        nrows=nrows,
+        engine=engine
+    )
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Encodage des réponses HTTP: sérialisation JSON rapide et compression
+- FastJSONProvider remplace le fournisseur JSON de Flask (jsonify): orjson
+  sérialise en C les listes de lignes, les scalaires et tableaux NumPy et
+  les dates (ISO 8601), NaN devient null; repli sur le module json standard
+  (mêmes types NumPy/pandas, mais un float NaN y reste NaN) si orjson est absent
+- ndjson_lines produit un flux NDJSON (un enregistrement par ligne)
+- compress_response compresse en brotli ou gzip, selon l'en-tête
+  Accept-Encoding, les réponses texte/JSON au-delà d'une taille minimale
+"""
+
+import gzip
+import json
+import logging
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+logger = logging.getLogger(__name__)
+
+if HAS_ORJSON:
+    ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+else:
+    ORJSON_OPTIONS = 0
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Types de contenu compressés (les fichiers exportés et les flux SSE ne le sont pas)
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/html', 'text/csv',
+                          'application/vnd.apache.arrow.stream')
+
+
+def encode_default(value):
+    """Types que ni orjson ni json ne connaissent: scalaires NumPy/pandas, dates pandas, manquants"""
+    if value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, (datetime, date, pd.Timedelta)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+        if isinstance(value, float) and value != value:
+            return None
+        return value
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Objet de type {type(value).__name__} non sérialisable en JSON")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Fournisseur JSON de Flask, moteur choisi par Config.JSON_ENGINE (auto, orjson, json)"""
+
+    def __init__(self, app, engine='auto'):
+        super().__init__(app)
+        if engine == 'orjson' and not HAS_ORJSON:
+            raise ValueError("JSON_ENGINE=orjson mais orjson n'est pas installé")
+        self.engine = 'orjson' if engine in ('auto', 'orjson') and HAS_ORJSON else 'json'
+        logger.info(f"Sérialisation JSON: {self.engine}")
+
+    def dumps(self, obj, **kwargs):
+        if self.engine == 'orjson' and not kwargs:
+            return orjson.dumps(obj, default=encode_default, option=ORJSON_OPTIONS).decode('utf-8')
+        kwargs.setdefault('default', encode_default)
+        kwargs.setdefault('ensure_ascii', False)
+        return json.dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if self.engine == 'orjson':
+            # Octets produits directement, sans chaîne Python intermédiaire
+            body = orjson.dumps(obj, default=encode_default, option=ORJSON_OPTIONS)
+        else:
+            body = json.dumps(obj, default=encode_default, ensure_ascii=False, separators=(',', ':'))
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def ndjson_lines(records, dumps):
+    """Flux NDJSON: un enregistrement JSON par ligne, produit à la demande"""
+    for record in records:
+        yield dumps(record) + '\n'
+
+
+def _choose_encoding(accept_encodings):
+    candidates = ['br', 'gzip'] if HAS_BROTLI else ['gzip']
+    best = accept_encodings.best_match(candidates)
+    return best if best and accept_encodings[best] > 0 else None
+
+
+def compress_response(response, accept_encodings, min_bytes=1024, gzip_level=5, brotli_quality=4):
+    """Compresse le corps de la réponse si le client l'accepte et s'il est assez gros
+
+    Renvoie la réponse (modifiée sur place). Les réponses en flux (SSE,
+    fichiers envoyés par send_file) ne sont jamais touchées.
+    """
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < min_bytes:
+        return response
+    encoding = _choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=brotli_quality)
+    else:
+        compressed = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
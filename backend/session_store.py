@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Stockage des classeurs par session utilisateur
+Chaque session a son propre ExcelProcessor; un budget mémoire global est
+respecté en déchargeant sur disque les sessions les moins récemment utilisées
+(LRU), rechargées de manière transparente au prochain accès.
+Chaque session a un verrou lecteurs/rédacteur: les requêtes de lecture
+s'exécutent en parallèle (workers à threads), les écritures une à une.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Marqueur de déchargement: le DataFrame sera relu depuis le cache des uploads
+SOURCE_CACHE = ':source-cache:'
+
+
+class ReadWriteLock:
+    """Verrou lecteurs/rédacteur: lectures simultanées, écritures exclusives
+
+    Priorité aux écritures: dès qu'une écriture attend, les nouvelles lectures
+    patientent, un flux continu de lectures ne peut pas bloquer les écritures.
+    Non réentrant.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            if self._readers == 0:
+                self._condition.notify_all()
+
+    def acquire_write(self, blocking=True):
+        """Prend le verrou exclusif; sans attente (blocking=False), renvoie False s'il est occupé"""
+        with self._condition:
+            if not blocking and (self._writer or self._readers):
+                return False
+            self._waiting_writers += 1
+            try:
+                while self._writer or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+            return True
+
+    def release_write(self):
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class WorkbookSession:
+    """État d'une session: processeur Excel, processeur IA et fichier courant"""
+
+    def __init__(self, session_id, processor, ai_processor):
+        self.session_id = session_id
+        self.processor = processor
+        self.ai_processor = ai_processor
+        self.filename = None
+        self.spill_path = None
+        self.last_access = time.time()
+        self.shared_generation = None  # Génération publiée correspondant à l'état local (voir shared_sessions)
+        self.lock = ReadWriteLock()
+
+    @property
+    def is_spilled(self):
+        return self.spill_path is not None
+
+    def memory_usage(self):
+        """Mémoire occupée par le DataFrame de la session (octets)"""
+        if self.is_spilled:
+            return 0
+        return self.processor.memory_usage()
+
+    def spill(self, folder):
+        """Décharge le DataFrame sur disque (pickle, conserve les dtypes)
+
+        Un DataFrame non modifié depuis son chargement n'est pas réécrit: il
+        sera relu depuis le cache colonnes des uploads.
+        """
+        if self.is_spilled or self.processor.df is None:
+            return 0
+        freed = self.memory_usage()
+        if self.processor.is_pristine():
+            path = SOURCE_CACHE
+        else:
+            digest = hashlib.sha1(self.session_id.encode('utf-8')).hexdigest()
+            path = os.path.join(folder, f'{digest}.pkl')
+            pd.to_pickle(self.processor.snapshot(), path)
+        self.processor.release()
+        self.spill_path = path
+        logger.info(f"Session {self.session_id[:8]} déchargée sur disque ({freed / 1e6:.1f} Mo libérés)")
+        return freed
+
+    def reload(self):
+        """Recharge le DataFrame déchargé sur disque"""
+        if not self.is_spilled:
+            return
+        if self.spill_path == SOURCE_CACHE:
+            self.processor.reload_source()
+        else:
+            self.processor.restore(pd.read_pickle(self.spill_path))
+        self.discard_spill()
+        logger.info(f"Session {self.session_id[:8]} rechargée depuis le disque")
+
+    def discard_spill(self):
+        if self.spill_path not in (None, SOURCE_CACHE) and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self.spill_path = None
+
+
+class SessionStore:
+    """Sessions indexées par identifiant, avec éviction LRU sous budget mémoire"""
+
+    def __init__(self, session_factory, memory_budget, spill_folder,
+                 idle_seconds=None, expiry_seconds=None):
+        self.session_factory = session_factory
+        self.memory_budget = memory_budget
+        self.spill_folder = spill_folder
+        self.idle_seconds = idle_seconds
+        self.expiry_seconds = expiry_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+        os.makedirs(spill_folder, exist_ok=True)
+
+    def get(self, session_id):
+        """Renvoie la session (créée ou rechargée si besoin), marquée comme récente"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self.session_factory(session_id)
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_access = time.time()
+            if session.is_spilled:
+                session.reload()
+            return session
+
+    def ensure_loaded(self, session):
+        """Recharge une session déchargée entre get() et son verrouillage par la requête"""
+        with self._lock:
+            if session.is_spilled:
+                session.reload()
+
+    def _spill_unused(self, session):
+        """Décharge la session si aucune requête ne l'utilise (verrou d'écriture pris sans attendre)"""
+        if not session.lock.acquire_write(blocking=False):
+            return 0
+        try:
+            return session.spill(self.spill_folder)
+        finally:
+            session.lock.release_write()
+
+    def drop(self, session_id):
+        """Supprime une session et son éventuel fichier déchargé"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                session.discard_spill()
+
+    def used_memory(self):
+        with self._lock:
+            return sum(session.memory_usage() for session in self._sessions.values())
+
+    def enforce_budget(self, keep=None):
+        """Expire/décharge les sessions inactives puis les LRU jusqu'à respecter le budget"""
+        with self._lock:
+            now = time.time()
+            for session_id, session in list(self._sessions.items()):
+                if session_id == keep:
+                    continue
+                idle = now - session.last_access
+                if self.expiry_seconds and idle > self.expiry_seconds:
+                    if session.lock.acquire_write(blocking=False):
+                        self.drop(session_id)
+                        session.lock.release_write()
+                elif self.idle_seconds and idle > self.idle_seconds:
+                    self._spill_unused(session)
+
+            used = self.used_memory()
+            for session_id, session in list(self._sessions.items()):
+                if used <= self.memory_budget:
+                    break
+                if session_id == keep:
+                    continue
+                used -= self._spill_unused(session)
+
+            if used > self.memory_budget:
+                logger.warning(f"Budget mémoire dépassé par la session active: {used / 1e6:.1f} Mo "
+                               f"pour {self.memory_budget / 1e6:.1f} Mo autorisés")
+
+    def stats(self):
+        """Résumé de l'occupation mémoire du magasin de sessions"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            return {
+                'budget_bytes': self.memory_budget,
+                'used_bytes': sum(session.memory_usage() for session in sessions),
+                'sessions_in_memory': sum(1 for session in sessions if not session.is_spilled),
+                'sessions_spilled': sum(1 for session in sessions if session.is_spilled)
+            }
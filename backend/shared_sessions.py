@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Sessions partagées entre les workers gunicorn
+Avec plusieurs workers, chaque processus a ses propres sessions: un upload
+traité par un worker serait invisible des autres. Quand Config.SHARED_SESSIONS
+est actif, l'état de chaque session est publié dans un dossier commun:
+- le DataFrame de base dans un fichier Arrow IPC projeté en mémoire (mmap):
+  les colonnes numériques sont lues sans copie et leurs pages sont partagées
+  entre workers par le cache du système; il n'est réécrit que si la base a
+  changé (pas pour un filtre)
+- chaque opération de l'historique (annuler/rétablir) dans son propre
+  pickle, écrit une seule fois: une écriture ne publie que ses nouvelles
+  opérations, le coût ne croît pas avec la longueur de l'historique
+- le reste de l'état (filtres, source, version, identifiants des
+  opérations de l'historique) dans un pickle
+- meta.json: numéro de génération et fichiers courants
+Un verrou fichier (flock) par session coordonne les accès, partagé pour les
+lectures et exclusif pour les écritures. Un worker dont la génération locale
+est dépassée recharge l'état publié avant de servir la requête; après une
+écriture, il publie une nouvelle génération.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import fcntl
+    HAS_FLOCK = True
+except ImportError:
+    HAS_FLOCK = False  # Windows: serveur de développement mono-processus uniquement
+
+try:
+    import pyarrow as pa
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'meta.json'
+LOCK_FILE = 'lock'
+
+
+def write_frame(frame, path):
+    """Écrit un DataFrame en Arrow IPC (types pandas conservés); False si non représentable"""
+    if not HAS_ARROW or not all(isinstance(column, str) for column in frame.columns):
+        return False
+    try:
+        table = pa.Table.from_pandas(frame)
+    except (pa.ArrowException, ValueError, TypeError):
+        return False  # Colonnes objet aux types mélangés, noms dupliqués...
+    temp_path = f'{path}.part'
+    with pa.OSFile(temp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(temp_path, path)
+    return True
+
+
+def read_frame(path):
+    """Relit un DataFrame écrit par write_frame, projeté en mémoire
+
+    Les colonnes numériques sont des vues en lecture seule sur le fichier:
+    le processeur en fait une copie privée avant d'y écrire en place.
+    """
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def _operation_file(operation_id):
+    return f'op-{operation_id}.pkl'
+
+
+def _write_json(path, value):
+    temp_path = f'{path}.part'
+    with open(temp_path, 'w', encoding='utf-8') as handle:
+        json.dump(value, handle)
+    os.replace(temp_path, path)
+
+
+class SharedSessions:
+    """État des sessions publié sur disque et synchronisé entre processus"""
+
+    def __init__(self, folder, expiry_seconds=None):
+        if not HAS_FLOCK:
+            raise RuntimeError("Les sessions partagées nécessitent fcntl (Linux/macOS)")
+        self.folder = folder
+        self.expiry_seconds = expiry_seconds
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, session_id, name=''):
+        digest = hashlib.sha1(session_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.folder, digest, name)
+
+    def _read_meta(self, session_id):
+        try:
+            with open(self._path(session_id, META_FILE), encoding='utf-8') as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def access(self, session, exclusive=False):
+        """Verrouille la session, la synchronise, puis publie ses modifications en sortie
+
+        Verrou partagé pour une lecture, exclusif pour une écriture; les
+        modifications ne sont publiées que sous verrou exclusif.
+        """
+        os.makedirs(self._path(session.session_id), exist_ok=True)
+        lock_path = self._path(session.session_id, LOCK_FILE)
+        with open(lock_path, 'a') as lock_file:
+            os.utime(lock_path)  # Dernier accès, pour l'expiration
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                self.sync(session)
+                before = self._fingerprint(session)
+                yield session
+                if exclusive and self._fingerprint(session) != before:
+                    self.publish(session)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _fingerprint(session):
+        processor = session.processor
+        return (processor.version, processor.active_sheet, session.filename, processor.reference_names)
+
+    def sync(self, session):
+        """Recharge l'état publié s'il est plus récent que la copie locale; True si rechargé"""
+        meta = self._read_meta(session.session_id)
+        if meta is None or meta['generation'] == session.shared_generation:
+            return False
+        started = time.perf_counter()
+        state = pd.read_pickle(self._path(session.session_id, meta['state']))
+        # Opérations de l'historique: celles déjà connues localement ne sont pas relues
+        known = {}
+        if session.processor.history_token == state['history_token']:
+            known = {operation.get('shared_id'): operation for operation in session.processor.history_operations()}
+        for stack in ('undo', 'redo'):
+            state[stack] = [known.get(operation_id)
+                            or pd.read_pickle(self._path(session.session_id, _operation_file(operation_id)))
+                            for operation_id in state[stack]]
+        if meta['dataset']:
+            state['df'] = read_frame(self._path(session.session_id, meta['dataset']))
+        session.processor.restore_shared(state)
+        session.filename = state['filename']
+        session.shared_generation = meta['generation']
+        logger.info(f"Session {session.session_id[:8]} synchronisée (génération {meta['generation']}, "
+                    f"version {session.processor.version}) en {(time.perf_counter() - started) * 1000:.0f} ms")
+        return True
+
+    def publish(self, session):
+        """Publie l'état local comme nouvelle génération (appelé sous verrou exclusif)"""
+        session_id = session.session_id
+        processor = session.processor
+        meta = self._read_meta(session_id) or {'generation': 0, 'dataset': None, 'base_version': None}
+        generation = meta['generation'] + 1
+        state = processor.shared_state()
+        state['filename'] = session.filename
+
+        # Historique en journal: seules les opérations absentes du dossier sont écrites
+        # (toutes si des opérations ont été modifiées en place depuis la dernière publication)
+        published = set(meta.get('operations', [])) if meta.get('history_token') == processor.history_token else set()
+        for stack in ('undo', 'redo'):
+            operation_ids = []
+            for operation in state[stack]:
+                operation_id = operation.setdefault('shared_id', uuid.uuid4().hex)
+                if operation_id not in published:
+                    pd.to_pickle(operation, self._path(session_id, _operation_file(operation_id)))
+                    published.add(operation_id)
+                operation_ids.append(operation_id)
+            state[stack] = operation_ids
+        operations = state['undo'] + state['redo']
+
+        # La base n'est réécrite que si elle a changé (un filtre ne la modifie pas)
+        dataset = None
+        if isinstance(state['df'], pd.DataFrame):
+            if meta['dataset'] and meta['base_version'] == processor.base_version:
+                dataset = meta['dataset']
+            elif write_frame(state['df'], self._path(session_id, f'base-{generation}.arrow')):
+                dataset = f'base-{generation}.arrow'
+            if dataset:
+                state['df'] = None
+        state_file = f'state-{generation}.pkl'
+        pd.to_pickle(state, self._path(session_id, state_file))
+        _write_json(self._path(session_id, META_FILE), {
+            'generation': generation,
+            'dataset': dataset,
+            'base_version': processor.base_version,
+            'state': state_file,
+            'operations': operations,
+            'history_token': processor.history_token
+        })
+        session.shared_generation = generation
+
+        # Anciennes générations: les workers qui les projettent encore gardent leur copie (inode)
+        keep = {META_FILE, LOCK_FILE, state_file, dataset, *map(_operation_file, operations)}
+        for name in os.listdir(self._path(session_id)):
+            if name not in keep and not name.endswith('.part'):
+                os.remove(self._path(session_id, name))
+
+    def cleanup(self):
+        """Supprime les sessions partagées inutilisées depuis expiry_seconds"""
+        if not self.expiry_seconds:
+            return 0
+        removed = 0
+        limit = time.time() - self.expiry_seconds
+        for name in os.listdir(self.folder):
+            lock_path = os.path.join(self.folder, name, LOCK_FILE)
+            if os.path.exists(lock_path) and os.path.getmtime(lock_path) < limit:
+                shutil.rmtree(os.path.join(self.folder, name), ignore_errors=True)
+                removed += 1
+        return removed
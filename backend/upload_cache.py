@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Cache des uploads indexé par empreinte du contenu (SHA-256)
+Le fichier brut est stocké une seule fois sous uploads/<empreinte>.<ext>
+(dédupliqué) et le DataFrame déjà parsé et typé est conservé à côté au
+format colonnes Arrow (Feather), relu par memory-map sans repasser par
+openpyxl. Repli en pickle si pyarrow est absent ou si le DataFrame n'est
+pas représentable en Arrow (colonnes aux types mélangés, noms non texte).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import uuid
+
+import pandas as pd
+
+try:
+    import pyarrow.feather as feather
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadCache:
+    """Stockage dédupliqué des uploads et de leur version parsée"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def store(self, file_storage, extension):
+        """Enregistre le flux uploadé en le hachant au passage
+
+        Renvoie (empreinte, chemin du fichier brut). Un contenu déjà connu
+        n'est pas réécrit: le fichier temporaire est simplement supprimé.
+        """
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=self.folder, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                while True:
+                    chunk = file_storage.stream.read(HASH_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    output.write(chunk)
+
+            file_id = digest.hexdigest()
+            raw_path = os.path.join(self.folder, f'{file_id}{extension}')
+            if os.path.exists(raw_path):
+                os.remove(temp_path)
+                logger.info(f"Upload déjà connu ({file_id[:12]}), fichier dédupliqué")
+            else:
+                os.replace(temp_path, raw_path)
+            return file_id, raw_path
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _base_path(self, file_id, variant=''):
+        suffix = f'__{hashlib.sha1(variant.encode("utf-8")).hexdigest()[:12]}' if variant else ''
+        return os.path.join(self.folder, f'{file_id}{suffix}')
+
+    def out_of_core_path(self, file_id):
+        """Chemin du Parquet par blocs d'un gros CSV (mode hors mémoire)"""
+        return f"{self._base_path(file_id, 'out_of_core')}.parquet"
+
+    def has_parsed(self, file_id, variant=''):
+        """Vrai si la version parsée de l'upload est déjà en cache"""
+        return os.path.exists(f'{self._base_path(file_id, variant)}.json')
+
+    def load_parsed(self, file_id, variant=''):
+        """Renvoie (DataFrame, rapport de chargement) depuis le cache, ou None"""
+        base = self._base_path(file_id, variant)
+        report_path = f'{base}.json'
+        if not os.path.exists(report_path):
+            return None
+        try:
+            with open(report_path, 'r', encoding='utf-8') as handle:
+                meta = json.load(handle)
+            if meta['format'] == 'feather':
+                df = feather.read_table(f'{base}.feather', memory_map=True).to_pandas()
+            else:
+                df = pd.read_pickle(f'{base}.pkl')
+            return df, meta['report']
+        except Exception as e:
+            logger.warning(f"Cache parsé illisible pour {file_id[:12]}: {str(e)}")
+            return None
+
+    def save_parsed(self, file_id, df, report, variant=''):
+        """Enregistre le DataFrame parsé (Arrow si possible, sinon pickle)"""
+        base = self._base_path(file_id, variant)
+        # Suffixe unique: deux sessions peuvent enregistrer le même upload en même temps
+        part = f'.{uuid.uuid4().hex[:8]}.part'
+        data_format = 'pickle'
+        if HAS_ARROW and isinstance(df.index, pd.RangeIndex) and df.index.start == 0:
+            try:
+                df.to_feather(f'{base}.feather{part}', compression='uncompressed')
+                os.replace(f'{base}.feather{part}', f'{base}.feather')
+                data_format = 'feather'
+            except Exception as e:
+                if os.path.exists(f'{base}.feather{part}'):
+                    os.remove(f'{base}.feather{part}')
+                logger.info(f"DataFrame non représentable en Arrow, repli pickle: {str(e)}")
+        if data_format == 'pickle':
+            df.to_pickle(f'{base}.pkl{part}', compression=None)
+            os.replace(f'{base}.pkl{part}', f'{base}.pkl')
+
+        # Le fichier de métadonnées est écrit en dernier: sa présence valide le cache
+        with open(f'{base}.json{part}', 'w', encoding='utf-8') as handle:
+            json.dump({'format': data_format, 'report': report}, handle)
+        os.replace(f'{base}.json{part}', f'{base}.json')
+
+    def load_formulas(self, file_id, variant=''):
+        """Renvoie les formules lues d'une feuille (FormulaBook), ou None si elles ne sont pas en cache"""
+        path = f'{self._base_path(file_id, variant)}.formulas.pkl'
+        if not os.path.exists(path):
+            return None
+        try:
+            return pd.read_pickle(path)
+        except Exception as e:
+            logger.warning(f"Formules en cache illisibles pour {file_id[:12]}: {str(e)}")
+            return None
+
+    def save_formulas(self, file_id, book, variant=''):
+        """Enregistre les formules d'une feuille (même vide: la feuille n'est pas relue)"""
+        path = f'{self._base_path(file_id, variant)}.formulas.pkl'
+        part = f'.{uuid.uuid4().hex[:8]}.part'
+        pd.to_pickle(book, f'{path}{part}')
+        os.replace(f'{path}{part}', path)
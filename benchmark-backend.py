@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script de benchmark des chemins critiques du backend SMART-EXCEL
+Usage: python benchmark-backend.py [nombre_de_lignes]
+"""
+
+import sys
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def build_sample_dataframe(n_rows):
+    """Construit un DataFrame représentatif (texte, entiers, décimaux, dates)"""
+    rng = np.random.default_rng(42)
+    return pd.DataFrame({
+        'Reference': [f'REF-{i:06d}' for i in range(n_rows)],
+        'Produit': rng.choice(['Riz', 'Mil', 'Maïs', 'Sorgho', 'Igname'], n_rows),
+        'Quantite': rng.integers(1, 500, n_rows),
+        'Prix': rng.uniform(100, 50000, n_rows).round(2),
+        'Rendement': rng.normal(2.5, 0.8, n_rows).round(3),
+        'Date': pd.date_range('2024-01-01', periods=n_rows, freq='min'),
+    })
+
+
+def legacy_payload(df):
+    """Ancienne implémentation de get_data_for_frontend (iterrows), pour comparaison"""
+    data = []
+    for index, row in df.iterrows():
+        row_data = {'id': index}
+        for col in df.columns:
+            row_data[col] = row[col]
+        data.append(row_data)
+    return data
+
+
+def measure(label, func, n_rows, repeat=3):
+    """Exécute func plusieurs fois et affiche le meilleur débit en lignes/seconde"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    print(f"   {label:<40} {best * 1000:10.1f} ms  {n_rows / best:14,.0f} lignes/s")
+    return best
+
+
+def bench_frontend_payload(n_rows):
+    """Compare la construction du payload AG-Grid avant/après vectorisation"""
+    from app import ExcelProcessor
+
+    processor = ExcelProcessor()
+    processor.df = build_sample_dataframe(n_rows)
+
+    print(f"\n📊 Payload AG-Grid ({n_rows:,} lignes, {processor.df.shape[1]} colonnes)")
+    legacy = measure("Avant: iterrows", lambda: legacy_payload(processor.df), n_rows, repeat=1)
+    rows = measure("Après: lignes vectorisées", lambda: processor.get_data_for_frontend(), n_rows)
+    cols = measure("Après: format colonnes", lambda: processor.get_data_for_frontend(layout='columns'), n_rows)
+    print(f"   Gain lignes: x{legacy / rows:.1f} | gain colonnes: x{legacy / cols:.1f}")
+
+
+def bench_response_encoding(n_rows):
+    """Compare json/orjson, Arrow IPC et la compression sur les réponses /api/upload et /api/data"""
+    import io
+    from app import app
+    from response_encoding import FastJSONProvider, HAS_ORJSON, HAS_BROTLI
+    from arrow_transport import ARROW_STREAM_MIMETYPE, HAS_ARROW
+
+    client = app.test_client()
+    csv = build_sample_dataframe(n_rows).to_csv(index=False).encode('utf-8')
+
+    print(f"\n📦 Réponses JSON ({n_rows:,} lignes)")
+    for label, engine in (("json standard", 'json'), ("orjson", 'orjson')):
+        if engine == 'orjson' and not HAS_ORJSON:
+            print("   orjson non installé: comparaison ignorée")
+            continue
+        app.json = FastJSONProvider(app, engine=engine)
+        for endpoint in ('/api/upload', '/api/data'):
+            def call():
+                if endpoint == '/api/upload':
+                    return client.post(endpoint, data={'file': (io.BytesIO(csv), 'bench.csv')},
+                                       content_type='multipart/form-data')
+                return client.get(endpoint)
+            measure(f"{endpoint} ({label})", call, n_rows)
+
+    encodings = ['identity', 'gzip'] + (['br'] if HAS_BROTLI else [])
+    for label, accept in (("JSON", 'application/json'), ("Arrow", ARROW_STREAM_MIMETYPE)):
+        if accept == ARROW_STREAM_MIMETYPE and not HAS_ARROW:
+            print("   pyarrow non installé: format Arrow ignoré")
+            continue
+        for encoding in encodings:
+            start = time.perf_counter()
+            response = client.get('/api/data', headers={'Accept': accept, 'Accept-Encoding': encoding})
+            elapsed = time.perf_counter() - start
+            print(f"   /api/data {label:<5} {encoding:<9} {len(response.data) / 1e6:8.2f} Mo  "
+                  f"{elapsed * 1000:10.1f} ms")
+
+
+def bench_ndjson_stream(n_rows):
+    """Délai avant les premières lignes et pic mémoire (sous tracemalloc): JSON complet vs flux NDJSON"""
+    import io
+    import tracemalloc
+    from app import app
+
+    client = app.test_client()
+    csv = build_sample_dataframe(n_rows).to_csv(index=False).encode('utf-8')
+    client.post('/api/upload', data={'file': (io.BytesIO(csv), 'bench.csv')}, content_type='multipart/form-data')
+
+    print(f"\n🚿 Flux NDJSON ({n_rows:,} lignes)")
+    for label, accept in (("JSON complet", 'application/json'), ("NDJSON", 'application/x-ndjson')):
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.get('/api/data', headers={'Accept': accept}, buffered=False)
+        chunks = iter(response.response)
+        size = len(next(chunks))
+        first = time.perf_counter() - start
+        size += sum(len(chunk) for chunk in chunks)
+        total = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        response.close()
+        print(f"   {label:<14} premières lignes {first * 1000:8.1f} ms | total {total * 1000:8.1f} ms | "
+              f"{size / 1e6:6.2f} Mo | pic mémoire {peak / 1e6:7.1f} Mo")
+
+
+def main():
+    """Fonction principale du benchmark"""
+    print("=" * 50)
+    print("⏱️  SMART-EXCEL - Benchmark du Backend")
+    print("=" * 50)
+
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    # Importer le backend depuis son dossier (les chemins relatifs en dépendent)
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(os.path.join(script_dir, 'backend'))
+    sys.path.insert(0, '.')
+
+    bench_frontend_payload(n_rows)
+    bench_response_encoding(n_rows)
+    bench_ndjson_stream(n_rows)
+
+    print("\n" + "=" * 50)
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
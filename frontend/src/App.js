@@ -17,7 +17,7 @@ import AICommandPanel from './components/AICommandPanel';
 import LoadingSpinner from './components/LoadingSpinner';
 
 // Services
-import { apiService } from './services/apiService';
+import { apiService, applyDataPatch } from './services/apiService';
 import mobileApiService from './services/mobileApiService';
 
 // Détecter si on est sur mobile et utiliser le bon service
@@ -99,7 +99,13 @@ function App() {
   const handleFileUpload = useCallback(async (file) => {
     setLoading(true);
     try {
-      const response = await currentApiService.uploadFile(file);
+      // Service web: premières lignes affichées dès leur réception (flux NDJSON)
+      const response = currentApiService.uploadFileStreaming
+        ? await currentApiService.uploadFileStreaming(file, (data) => {
+            setExcelData(data);
+            setLoading(false);
+          })
+        : await currentApiService.uploadFile(file);
       
       if (response.success) {
         setExcelData(response.data);
@@ -124,29 +130,51 @@ function App() {
     }
   }, []);
 
+  /**
+   * Fenêtre de lignes lue sur le serveur (gros fichiers en mode hors mémoire)
+   */
+  const fetchRows = useCallback((params) => currentApiService.getRows(params), []);
+
   /**
    * Gère la mise à jour d'une cellule dans le tableau
    */
   const handleCellUpdate = useCallback(async (rowId, column, newValue) => {
     try {
-      const response = await currentApiService.updateCell(rowId, column, newValue);
+      // Les modifications en rafale (collage, recopie) sont envoyées en un seul lot
+      const response = await currentApiService.queueCellUpdate(rowId, column, newValue);
       
       if (response.success) {
         setHasUnsavedChanges(true);
+
+        if (response.patch === null) {
+          // Formules recalculées sur trop de lignes pour un patch: rechargement complet
+          // (un seul pour toutes les cellules du lot, qui partagent la même réponse)
+          response.refreshed = response.refreshed || currentApiService.getData();
+          const refreshed = await response.refreshed;
+          setExcelData(refreshed.data);
+        } else {
+          // Mettre à jour les données localement pour un feedback immédiat
+          setExcelData(prevData => {
+            if (response.patch) {
+              // Valeurs calculées par le serveur (formules et cellules dépendantes)
+              if (prevData.version === response.version) return prevData;
+              const patched = applyDataPatch(prevData, response.patch);
+              if (patched) return patched;
+            }
+            const newData = { ...prevData };
+            const rowIndex = newData.data.findIndex(row => row.id === rowId);
+            if (rowIndex !== -1) {
+              newData.data[rowIndex][column] = newValue;
+            }
+            newData.version = response.version;
+            return newData;
+          });
+        }
         
-        // Mettre à jour les données localement pour un feedback immédiat
-        setExcelData(prevData => {
-          const newData = { ...prevData };
-          const rowIndex = newData.data.findIndex(row => row.id === rowId);
-          if (rowIndex !== -1) {
-            newData.data[rowIndex][column] = newValue;
-          }
-          return newData;
-        });
-        
-        toast.success('Cellule mise à jour', {
+        toast.success(response.updated > 1 ? `${response.updated} cellules mises à jour` : 'Cellule mise à jour', {
           position: "bottom-right",
           autoClose: 1000,
+          toastId: `cell-update-${response.version}`,
         });
       } else {
         throw new Error(response.error || 'Erreur lors de la mise à jour');
@@ -156,6 +184,7 @@ function App() {
       toast.error(`Erreur: ${error.message}`, {
         position: "top-right",
         autoClose: 3000,
+        toastId: 'cell-update-error',
       });
     }
   }, []);
@@ -174,13 +203,23 @@ function App() {
 
     setLoading(true);
     try {
-      const response = await currentApiService.processAICommand(command);
+      const response = await currentApiService.processAICommandAsync(command, excelData?.version);
       
       if (response.success) {
         // Si des nouvelles données sont disponibles, les mettre à jour
         if (response.data) {
           setExcelData(response.data);
           setHasUnsavedChanges(true);
+        } else if (response.patch) {
+          // Patch: seules les colonnes/lignes modifiées ont été renvoyées
+          const patched = applyDataPatch(excelData, response.patch);
+          if (patched) {
+            setExcelData(patched);
+          } else {
+            const refreshed = await currentApiService.getData();
+            setExcelData(refreshed.data);
+          }
+          setHasUnsavedChanges(true);
         }
         
         toast.success(response.message, {
@@ -202,7 +241,7 @@ function App() {
     } finally {
       setLoading(false);
     }
-  }, []);
+  }, [excelData]);
 
   /**
    * Gère l'export du fichier Excel modifié
@@ -306,6 +345,7 @@ function App() {
                   data={excelData}
                   onCellUpdate={handleCellUpdate}
                   loading={loading}
+                  getRows={fetchRows}
                 />
               </Box>
             )}
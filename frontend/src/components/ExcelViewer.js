@@ -22,10 +22,27 @@ import {
   Info as InfoIcon,
 } from '@mui/icons-material';
 
-const ExcelViewer = ({ data, onCellUpdate, loading }) => {
+const ExcelViewer = ({ data, onCellUpdate, loading, getRows }) => {
   const [isFullscreen, setIsFullscreen] = useState(false);
   const [gridApi, setGridApi] = useState(null);
 
+  // Gros CSV ouvert en mode hors mémoire: lecture seule, lignes lues par blocs sur le serveur
+  const outOfCore = Boolean(data && data.outOfCore);
+  const version = data ? data.version : undefined;
+
+  // Source du modèle infini d'AG-Grid (recréée à chaque version pour vider le cache de blocs)
+  const datasource = useMemo(() => {
+    if (!outOfCore || !getRows) return undefined;
+    return {
+      getRows: (params) => {
+        getRows({ startRow: params.startRow, endRow: params.endRow, filterModel: params.filterModel })
+          .then((response) => params.successCallback(response.data.data, response.data.lastRow))
+          .catch(() => params.failCallback());
+      },
+    };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [outOfCore, getRows, version]);
+
   // Configuration des colonnes pour AG-Grid
   const columnDefs = useMemo(() => {
     if (!data || !data.columns) return [];
@@ -34,7 +51,7 @@ const ExcelViewer = ({ data, onCellUpdate, loading }) => {
       field: col.field,
       headerName: col.headerName,
       editable: col.editable && !loading,
-      sortable: true,
+      sortable: !outOfCore,
       filter: true,
       resizable: true,
       width: col.width || 150,
@@ -59,15 +76,15 @@ const ExcelViewer = ({ data, onCellUpdate, loading }) => {
         },
       }),
     }));
-  }, [data, loading]);
+  }, [data, loading, outOfCore]);
 
   // Configuration par défaut des colonnes
   const defaultColDef = useMemo(() => ({
-    sortable: true,
+    sortable: !outOfCore,
     filter: true,
     resizable: true,
-    editable: !loading,
-  }), [loading]);
+    editable: !loading && !outOfCore,
+  }), [loading, outOfCore]);
 
   // Gestionnaire de modification de cellule
   const onCellValueChanged = useCallback((event) => {
@@ -159,7 +176,12 @@ const ExcelViewer = ({ data, onCellUpdate, loading }) => {
         </Box>
 
         <Box sx={{ display: 'flex', alignItems: 'center', gap: 1 }}>
-          <Tooltip title="Les cellules sont éditables - double-cliquez pour modifier">
+          {outOfCore && (
+            <Chip size="small" label="Mode hors mémoire (lecture seule)" color="warning" variant="outlined" />
+          )}
+          <Tooltip title={outOfCore
+            ? "Fichier volumineux lu par blocs: filtres et calculs côté serveur, sans modification"
+            : "Les cellules sont éditables - double-cliquez pour modifier"}>
             <IconButton size="small">
               <InfoIcon />
             </IconButton>
@@ -197,7 +219,9 @@ const ExcelViewer = ({ data, onCellUpdate, loading }) => {
         className="ag-theme-alpine"
       >
         <AgGridReact
-          rowData={data.data}
+          {...(outOfCore && datasource
+            ? { rowModelType: 'infinite', datasource, cacheBlockSize: 100 }
+            : { rowData: data.data })}
           columnDefs={columnDefs}
           defaultColDef={defaultColDef}
           onGridReady={onGridReady}
@@ -213,8 +237,8 @@ const ExcelViewer = ({ data, onCellUpdate, loading }) => {
           singleClickEdit={false}
           stopEditingWhenCellsLoseFocus={true}
           
-          // Pagination
-          pagination={true}
+          // Pagination (le modèle infini défile par blocs)
+          pagination={!outOfCore}
           paginationPageSize={50}
           paginationAutoPageSize={false}
           
@@ -8,11 +8,27 @@ import axios from 'axios';
 // Configuration de base d'Axios
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000/api';
 
+// Identifiant de session: isole le classeur de cet utilisateur côté serveur
+const getSessionId = () => {
+  const key = 'smart-excel-session-id';
+  try {
+    let sessionId = window.localStorage.getItem(key);
+    if (!sessionId) {
+      sessionId = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+      window.localStorage.setItem(key, sessionId);
+    }
+    return sessionId;
+  } catch (error) {
+    return 'default';
+  }
+};
+
 const apiClient = axios.create({
   baseURL: API_BASE_URL,
   timeout: 30000, // 30 secondes de timeout
   headers: {
     'Content-Type': 'application/json',
+    'X-Session-Id': getSessionId(),
   },
 });
 
@@ -40,6 +56,32 @@ apiClient.interceptors.response.use(
   }
 );
 
+/**
+ * Lit un flux NDJSON (réponse fetch) et appelle onRecord à chaque ligne reçue
+ * @param {Response} response - Réponse fetch en cours de réception
+ * @param {Function} onRecord - Appelée avec chaque enregistrement décodé
+ */
+const readNdjson = async (response, onRecord) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    lines.filter((line) => line.trim()).forEach((line) => onRecord(JSON.parse(line)));
+    if (done) break;
+  }
+};
+
+// File d'attente des modifications de cellules: un collage ou une recopie vers
+// le bas déclenche une rafale de modifications, envoyées en un seul appel
+const CELL_BATCH_DELAY_MS = 30;
+let pendingEdits = [];
+let pendingResolvers = [];
+let flushTimer = null;
+
 export const apiService = {
   /**
    * Upload un fichier Excel ou CSV vers le serveur
@@ -55,6 +97,8 @@ export const apiService = {
         headers: {
           'Content-Type': 'multipart/form-data',
         },
+        // Pas de délai maximal: un gros CSV est converti pour le mode hors mémoire pendant l'upload
+        timeout: 0,
         // Callback pour suivre le progrès d'upload (optionnel)
         onUploadProgress: (progressEvent) => {
           const percentCompleted = Math.round(
@@ -71,13 +115,79 @@ export const apiService = {
     }
   },
 
+  /**
+   * Upload en flux NDJSON: les colonnes et les premières lignes sont affichables
+   * avant la réception du reste des données
+   * @param {File} file - Le fichier à uploader
+   * @param {Function} onData - Appelée avec les données reçues jusqu'ici, à chaque bloc
+   * @returns {Promise<Object>} Réponse complète (même forme que uploadFile)
+   */
+  async uploadFileStreaming(file, onData) {
+    const formData = new FormData();
+    formData.append('file', file);
+    return this.streamData('/upload', { method: 'POST', body: formData }, onData);
+  },
+
+  /**
+   * Récupère les données en flux NDJSON (colonnes, blocs de lignes, résumé)
+   * Le serveur répond en JSON habituel pour les erreurs et le mode hors mémoire
+   * @param {string} path - '/data' ou '/upload'
+   * @param {Object} options - Options fetch (méthode, corps)
+   * @param {Function} onData - Appelée avec les données reçues jusqu'ici, à chaque bloc
+   * @returns {Promise<Object>} Réponse complète ({ success, data, ... })
+   */
+  async streamData(path = '/data', options = {}, onData = () => {}) {
+    let response;
+    try {
+      response = await fetch(`${API_BASE_URL}${path}`, {
+        ...options,
+        headers: { Accept: 'application/x-ndjson', 'X-Session-Id': getSessionId() },
+      });
+    } catch (error) {
+      throw new Error('Impossible de contacter le serveur. Vérifiez que le backend est démarré.');
+    }
+
+    if (!(response.headers.get('Content-Type') || '').includes('application/x-ndjson')) {
+      const body = await response.json();
+      if (!response.ok) {
+        throw new Error(body.error || 'Erreur serveur');
+      }
+      if (body.data) onData(body.data);
+      return body;
+    }
+
+    let info = null;
+    let data = null;
+    let complete = false;
+    await readNdjson(response, (record) => {
+      const { type, ...fields } = record;
+      if (type === 'columns') {
+        const { columns, rowCount, colCount, version, layout, ...rest } = fields;
+        info = rest;
+        data = { data: [], columns, rowCount, colCount, version };
+      } else if (type === 'rows') {
+        // Nouveau tableau à chaque bloc: AG-Grid ne voit que les changements de référence
+        data = { ...data, data: data.data.concat(fields.data) };
+        onData(data);
+      } else if (type === 'end') {
+        data = { ...data, rowCount: fields.rowCount };
+        complete = true;
+      }
+    });
+    if (!complete) {
+      throw new Error('Flux de données interrompu');
+    }
+    return { ...info, data };
+  },
+
   /**
    * Récupère les données actuelles du fichier Excel
+   * @param {string} layout - 'rows' (lignes AG-Grid) ou 'columns' (tableaux par colonne)
    * @returns {Promise<Object>} Données du tableau
    */
-  async getData() {
+  async getData(layout = 'rows') {
     try {
-      const response = await apiClient.get('/data');
+      const response = await apiClient.get('/data', { params: { layout } });
       return response.data;
     } catch (error) {
       console.error('Erreur récupération données:', error);
@@ -85,6 +195,73 @@ export const apiService = {
     }
   },
 
+  /**
+   * Récupère une fenêtre de lignes pour le modèle serveur d'AG-Grid
+   * Le tri et le filtrage sont appliqués côté serveur
+   * @param {Object} params - { startRow, endRow, sortModel, filterModel }
+   * @returns {Promise<Object>} Lignes de la fenêtre et lastRow
+   */
+  async getRows({ startRow, endRow, sortModel = [], filterModel = {} }) {
+    try {
+      const response = await apiClient.post('/data', {
+        startRow,
+        endRow,
+        sortModel,
+        filterModel,
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur récupération lignes:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Liste les feuilles du classeur chargé
+   * @returns {Promise<Object>} { sheets, activeSheet }
+   */
+  async getSheets() {
+    try {
+      const response = await apiClient.get('/sheets');
+      return response.data;
+    } catch (error) {
+      console.error('Erreur liste des feuilles:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Active une feuille du classeur (parsée côté serveur à la première demande)
+   * @param {string} sheet - Nom de la feuille
+   * @returns {Promise<Object>} Données de la feuille
+   */
+  async selectSheet(sheet) {
+    try {
+      const response = await apiClient.post('/sheets/select', { sheet });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur sélection feuille:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Aperçu rapide d'une feuille sans la charger entièrement
+   * @param {Object} options - { sheet, nrows, usecols (noms de colonnes "Prix,Qte"), letters (Excel: "A:C,F") }
+   * @returns {Promise<Object>} Premières lignes de la feuille
+   */
+  async getPreview({ sheet, nrows = 100, usecols, letters } = {}) {
+    try {
+      const response = await apiClient.get('/preview', {
+        params: { sheet, nrows, usecols, letters },
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur aperçu:', error);
+      throw error;
+    }
+  },
+
   /**
    * Met à jour une cellule spécifique dans le tableau
    * @param {number} rowId - ID de la ligne
@@ -106,15 +283,67 @@ export const apiService = {
     }
   },
 
+  /**
+   * Met à jour un lot de cellules en un seul appel (une seule version)
+   * @param {Array<Object>} edits - Liste de { rowId, column, value }
+   * @returns {Promise<Object>} Nombre de cellules modifiées et version
+   */
+  async updateCells(edits) {
+    try {
+      const response = await apiClient.post('/update-cells', { edits });
+
+      return response.data;
+    } catch (error) {
+      console.error('Erreur mise à jour cellules:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Ajoute une modification à la file d'attente; les modifications reçues
+   * dans la même rafale (collage, recopie) partent ensemble via updateCells
+   * @returns {Promise<Object>} Résultat du lot contenant la modification
+   */
+  queueCellUpdate(rowId, column, value) {
+    return new Promise((resolve, reject) => {
+      pendingEdits.push({ rowId, column, value });
+      pendingResolvers.push({ resolve, reject });
+      if (!flushTimer) {
+        flushTimer = setTimeout(() => this.flushCellUpdates(), CELL_BATCH_DELAY_MS);
+      }
+    });
+  },
+
+  /**
+   * Envoie immédiatement les modifications en attente
+   */
+  async flushCellUpdates() {
+    const edits = pendingEdits;
+    const resolvers = pendingResolvers;
+    pendingEdits = [];
+    pendingResolvers = [];
+    flushTimer = null;
+    if (edits.length === 0) return;
+
+    try {
+      const result = await this.updateCells(edits);
+      resolvers.forEach(({ resolve }) => resolve(result));
+    } catch (error) {
+      resolvers.forEach(({ reject }) => reject(error));
+    }
+  },
+
   /**
    * Envoie une commande en langage naturel à l'IA
    * @param {string} command - Commande à traiter
+   * @param {number} version - Version des données détenue (pour recevoir un patch)
    * @returns {Promise<Object>} Résultat du traitement IA
    */
-  async processAICommand(command) {
+  async processAICommand(command, version = undefined) {
     try {
       const response = await apiClient.post('/ai-command', {
         command: command.trim(),
+        version,
       });
       return response.data;
     } catch (error) {
@@ -123,15 +352,199 @@ export const apiService = {
     }
   },
 
+  /**
+   * Soumet une commande IA en tâche de fond puis attend son résultat
+   * (le serveur répond immédiatement avec un jobId, suivi par longues attentes)
+   * @param {string} command - Commande en langage naturel
+   * @param {number} version - Version détenue par le client (pour recevoir un patch)
+   * @param {number} timeoutMs - Délai maximal d'attente côté client
+   * @returns {Promise<Object>} Résultat du traitement IA
+   */
+  async processAICommandAsync(command, version = undefined, timeoutMs = 60000) {
+    try {
+      const response = await apiClient.post('/ai-command', {
+        command: command.trim(),
+        version,
+        async: true,
+      });
+      const deadline = Date.now() + timeoutMs;
+      let job = response.data;
+      while (job.status === 'pending' || job.status === 'running') {
+        if (Date.now() > deadline) {
+          throw new Error('Délai dépassé pour la commande IA');
+        }
+        job = await this.getAIJob(response.data.jobId, version, 10);
+      }
+      if (job.status === 'error') {
+        throw new Error(job.error);
+      }
+      return job;
+    } catch (error) {
+      console.error('Erreur commande IA asynchrone:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * État d'une commande IA asynchrone
+   * @param {string} jobId - Identifiant renvoyé à la soumission
+   * @param {number} version - Version détenue par le client (pour recevoir un patch)
+   * @param {number} wait - Attente maximale côté serveur, en secondes
+   * @returns {Promise<Object>} { status, ...résultat une fois terminé }
+   */
+  async getAIJob(jobId, version = undefined, wait = 0) {
+    try {
+      const response = await apiClient.get(`/ai-jobs/${jobId}`, {
+        params: { version, wait },
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur suivi commande IA:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Annule la dernière opération (modification, colonne calculée, filtre)
+   * @param {number} version - Version détenue par le client (pour recevoir un patch)
+   * @returns {Promise<Object>} { operation, history, filters, patch | data, version }
+   */
+  async undo(version = undefined) {
+    try {
+      const response = await apiClient.post('/undo', { version });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur annulation:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Rétablit la dernière opération annulée
+   * @param {number} version - Version détenue par le client (pour recevoir un patch)
+   * @returns {Promise<Object>} { operation, history, filters, patch | data, version }
+   */
+  async redo(version = undefined) {
+    try {
+      const response = await apiClient.post('/redo', { version });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur rétablissement:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Statistiques des colonnes visibles (effectif, vides, somme, min, max, moyenne, distinctes)
+   * @param {string[]} columns - Colonnes à décrire (toutes par défaut)
+   * @returns {Promise<Object>} { profile: { colonne: {...} }, filtered, version }
+   */
+  async getProfile(columns = undefined) {
+    try {
+      const response = await apiClient.get('/profile', {
+        params: columns ? { columns: columns.join(',') } : {},
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur profil des colonnes:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Liste les filtres actifs et l'état de l'historique
+   * @returns {Promise<Object>} { filters: [{ description, rows }], history: { undo, redo } }
+   */
+  async getFilters() {
+    try {
+      const response = await apiClient.get('/filters');
+      return response.data;
+    } catch (error) {
+      console.error('Erreur récupération filtres:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Retire tous les filtres (les données d'origine n'ont jamais été supprimées)
+   * @param {number} version - Version détenue par le client (pour recevoir un patch)
+   * @returns {Promise<Object>} { patch | data, version }
+   */
+  async clearFilters(version = undefined) {
+    try {
+      const response = await apiClient.post('/filters/clear', { version });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur retrait filtres:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Upload un fichier de référence (tarifs, référentiel...) à joindre ensuite à la feuille active
+   * @param {File} file - Le fichier de référence
+   * @param {string} name - Nom de la référence (tiré du nom de fichier par défaut)
+   * @returns {Promise<Object>} { reference, references }
+   */
+  async uploadReference(file, name = undefined) {
+    try {
+      const formData = new FormData();
+      formData.append('file', file);
+      if (name) formData.append('name', name);
+
+      const response = await apiClient.post('/references', formData, {
+        headers: {
+          'Content-Type': 'multipart/form-data',
+        },
+        timeout: 0,
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur upload référence:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Liste les fichiers de référence de la session
+   * @returns {Promise<Object>} { references: [{ name, filename, rows, columns, outOfCore }] }
+   */
+  async getReferences() {
+    try {
+      const response = await apiClient.get('/references');
+      return response.data;
+    } catch (error) {
+      console.error('Erreur récupération références:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Ajoute des colonnes d'un fichier de référence par colonne clé (RECHERCHEV sur toute la colonne)
+   * @param {Object} join - { reference, on, rightOn, columns }
+   * @param {number} version - Version détenue par le client (pour recevoir un patch)
+   * @returns {Promise<Object>} { result, patch | data, version }
+   */
+  async joinReference({ reference, on, rightOn, columns } = {}, version = undefined) {
+    try {
+      const response = await apiClient.post('/join', { reference, on, rightOn, columns, version });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur jointure:', error);
+      throw error;
+    }
+  },
+
   /**
    * Exporte le fichier Excel modifié
    * @param {string} filename - Nom du fichier à exporter
+   * @param {string} format - 'xlsx', 'csv' ou 'parquet' (déduit de l'extension par défaut)
    * @returns {Promise<void>} Déclenche le téléchargement
    */
-  async exportFile(filename = 'export.xlsx') {
+  async exportFile(filename = 'export.xlsx', format = undefined) {
     try {
       const response = await apiClient.post('/export', 
-        { filename },
+        { filename, format },
         {
           responseType: 'blob', // Important pour les fichiers binaires
         }
@@ -156,6 +569,97 @@ export const apiService = {
     }
   },
 
+  /**
+   * Upload parsé en tâche de fond côté serveur, avec suivi de l'avancement
+   * @param {File} file - Le fichier à uploader
+   * @param {Function} onProgress - Appelée avec l'état de la tâche ({ status, progress: { percent, stage } })
+   * @returns {Promise<Object>} Réponse complète (même forme que uploadFile)
+   */
+  async uploadFileInBackground(file, onProgress = () => {}) {
+    try {
+      const formData = new FormData();
+      formData.append('file', file);
+      formData.append('async', '1');
+      const response = await apiClient.post('/upload', formData, {
+        headers: {
+          'Content-Type': 'multipart/form-data',
+        },
+        timeout: 0,
+      });
+      await this.waitFileJob(response.data.jobId, onProgress);
+      const result = await apiClient.get(`/jobs/${response.data.jobId}/result`, { timeout: 0 });
+      return result.data;
+    } catch (error) {
+      console.error('Erreur upload en tâche de fond:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Export écrit en tâche de fond côté serveur, puis téléchargé
+   * @param {string} filename - Nom du fichier à exporter
+   * @param {string} format - 'xlsx', 'csv' ou 'parquet' (déduit de l'extension par défaut)
+   * @param {Function} onProgress - Appelée avec l'état de la tâche ({ status, progress: { percent, stage } })
+   * @returns {Promise<Object>} { success, jobId }
+   */
+  async exportFileInBackground(filename = 'export.xlsx', format = undefined, onProgress = () => {}) {
+    try {
+      const response = await apiClient.post('/export', { filename, format, async: true });
+      const { jobId } = response.data;
+      await this.waitFileJob(jobId, onProgress);
+
+      // Téléchargement direct par le navigateur (en-tête de session en paramètre)
+      const link = document.createElement('a');
+      link.href = `${API_BASE_URL}/jobs/${jobId}/result?session_id=${encodeURIComponent(getSessionId())}`;
+      link.setAttribute('download', filename);
+      document.body.appendChild(link);
+      link.click();
+      link.remove();
+
+      return { success: true, jobId };
+    } catch (error) {
+      console.error('Erreur export en tâche de fond:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Attend la fin d'une tâche de fichier (longues attentes successives)
+   * @param {string} jobId - Identifiant renvoyé à la soumission
+   * @param {Function} onProgress - Appelée avec l'état de la tâche à chaque réponse
+   * @returns {Promise<Object>} État final de la tâche (erreur levée si échec ou annulation)
+   */
+  async waitFileJob(jobId, onProgress = () => {}) {
+    let job = { status: 'pending' };
+    while (job.status === 'pending' || job.status === 'running') {
+      const response = await apiClient.get(`/jobs/${jobId}`, { params: { wait: 2 } });
+      job = response.data;
+      onProgress(job);
+    }
+    if (job.status === 'cancelled') {
+      throw new Error('Tâche annulée');
+    }
+    if (job.status === 'error') {
+      throw new Error(job.error);
+    }
+    return job;
+  },
+
+  /**
+   * Demande l'annulation d'un upload ou d'un export en tâche de fond
+   * @param {string} jobId - Identifiant de la tâche
+   * @returns {Promise<Object>} État de la tâche
+   */
+  async cancelFileJob(jobId) {
+    try {
+      const response = await apiClient.post(`/jobs/${jobId}/cancel`);
+      return response.data;
+    } catch (error) {
+      console.error('Erreur annulation tâche:', error);
+      throw error;
+    }
+  },
+
   /**
    * Vérifie le statut du serveur
    * @returns {Promise<Object>} Informations sur le statut
@@ -184,6 +688,40 @@ export const apiService = {
   },
 };
 
+/**
+ * Applique un patch de données (réponse delta du serveur) au tableau détenu
+ * @param {Object} data - Données actuelles ({ data, columns, version, ... })
+ * @param {Object} patch - Patch { setColumns, removedColumns, rows, columns, version }
+ * @returns {Object|null} Nouvelles données, ou null si un rechargement complet est nécessaire
+ */
+export const applyDataPatch = (data, patch) => {
+  if (!data || !data.data || data.version !== patch.fromVersion
+      || data.data.length !== patch.rowCount) {
+    return null;
+  }
+
+  const changedRows = new Map((patch.rows || []).map((row) => [row.id, row]));
+  const setColumns = Object.entries(patch.setColumns || {});
+  const removedColumns = patch.removedColumns || [];
+
+  const rows = data.data.map((row, index) => {
+    const next = { ...(changedRows.get(row.id) || row) };
+    removedColumns.forEach((column) => delete next[column]);
+    // Les colonnes complètes sont alignées sur l'ordre des lignes
+    setColumns.forEach(([column, values]) => { next[column] = values[index]; });
+    return next;
+  });
+
+  return {
+    ...data,
+    data: rows,
+    columns: patch.columns,
+    rowCount: patch.rowCount,
+    colCount: patch.colCount,
+    version: patch.version,
+  };
+};
+
 // Fonctions utilitaires pour la gestion des erreurs
 export const errorHandler = {
   /**
@@ -97,11 +97,27 @@ const getApiUrl = () => {
 };
 
 // Configuration d'Axios pour mobile
+// Identifiant de session: isole le classeur de cet utilisateur côté serveur
+const getSessionId = () => {
+  const key = 'smart-excel-session-id';
+  try {
+    let sessionId = window.localStorage.getItem(key);
+    if (!sessionId) {
+      sessionId = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+      window.localStorage.setItem(key, sessionId);
+    }
+    return sessionId;
+  } catch (error) {
+    return 'default';
+  }
+};
+
 const apiClient = axios.create({
   baseURL: getApiUrl(),
   timeout: 30000,
   headers: {
     'Content-Type': 'application/json',
+    'X-Session-Id': getSessionId(),
   },
 });
 
@@ -138,6 +154,13 @@ apiClient.interceptors.response.use(
   }
 );
 
+// File d'attente des modifications de cellules: un collage ou une recopie vers
+// le bas déclenche une rafale de modifications, envoyées en un seul appel
+const CELL_BATCH_DELAY_MS = 30;
+let pendingEdits = [];
+let pendingResolvers = [];
+let flushTimer = null;
+
 export const mobileApiService = {
   /**
    * Vérifier la connectivité réseau
@@ -168,6 +191,8 @@ export const mobileApiService = {
         headers: {
           'Content-Type': 'multipart/form-data',
         },
+        // Pas de délai maximal: un gros CSV est converti pour le mode hors mémoire pendant l'upload
+        timeout: 0,
         onUploadProgress: (progressEvent) => {
           const percentCompleted = Math.round(
             (progressEvent.loaded * 100) / progressEvent.total
@@ -207,15 +232,16 @@ export const mobileApiService = {
 
   /**
    * Récupère les données actuelles du fichier Excel
+   * @param {string} layout - 'rows' (lignes AG-Grid) ou 'columns' (tableaux par colonne)
    */
-  async getData() {
+  async getData(layout = 'rows') {
     try {
       const isConnected = await this.checkConnectivity();
       if (!isConnected) {
         throw new Error('Pas de connexion internet');
       }
 
-      const response = await apiClient.get('/data');
+      const response = await apiClient.get('/data', { params: { layout } });
       return response.data;
     } catch (error) {
       console.error('Erreur récupération données mobile:', error);
@@ -223,6 +249,85 @@ export const mobileApiService = {
     }
   },
 
+  /**
+   * Récupère une fenêtre de lignes pour le modèle serveur d'AG-Grid
+   */
+  async getRows({ startRow, endRow, sortModel = [], filterModel = {} }) {
+    try {
+      const isConnected = await this.checkConnectivity();
+      if (!isConnected) {
+        throw new Error('Pas de connexion internet');
+      }
+
+      const response = await apiClient.post('/data', {
+        startRow,
+        endRow,
+        sortModel,
+        filterModel,
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur récupération lignes mobile:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Liste les feuilles du classeur chargé
+   */
+  async getSheets() {
+    try {
+      const isConnected = await this.checkConnectivity();
+      if (!isConnected) {
+        throw new Error('Pas de connexion internet');
+      }
+
+      const response = await apiClient.get('/sheets');
+      return response.data;
+    } catch (error) {
+      console.error('Erreur liste des feuilles mobile:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Active une feuille du classeur (parsée côté serveur à la première demande)
+   */
+  async selectSheet(sheet) {
+    try {
+      const isConnected = await this.checkConnectivity();
+      if (!isConnected) {
+        throw new Error('Pas de connexion internet');
+      }
+
+      const response = await apiClient.post('/sheets/select', { sheet });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur sélection feuille mobile:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Aperçu rapide d'une feuille sans la charger entièrement
+   */
+  async getPreview({ sheet, nrows = 100, usecols, letters } = {}) {
+    try {
+      const isConnected = await this.checkConnectivity();
+      if (!isConnected) {
+        throw new Error('Pas de connexion internet');
+      }
+
+      const response = await apiClient.get('/preview', {
+        params: { sheet, nrows, usecols, letters },
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur aperçu mobile:', error);
+      throw error;
+    }
+  },
+
   /**
    * Met à jour une cellule spécifique
    */
@@ -261,10 +366,274 @@ export const mobileApiService = {
     }
   },
 
+  /**
+   * Met à jour un lot de cellules en un seul appel (une seule version)
+   */
+  async updateCells(edits) {
+    try {
+      const isConnected = await this.checkConnectivity();
+      if (!isConnected) {
+        throw new Error('Pas de connexion internet');
+      }
+
+      const response = await apiClient.post('/update-cells', { edits });
+
+      if (isMobile()) {
+        await Toast.show({
+          text: `${response.data.updated} cellules mises à jour`,
+          duration: 'short'
+        });
+      }
+
+      return response.data;
+    } catch (error) {
+      console.error('Erreur mise à jour cellules mobile:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Ajoute une modification à la file d'attente (collage, recopie vers le bas)
+   */
+  queueCellUpdate(rowId, column, value) {
+    return new Promise((resolve, reject) => {
+      pendingEdits.push({ rowId, column, value });
+      pendingResolvers.push({ resolve, reject });
+      if (!flushTimer) {
+        flushTimer = setTimeout(() => this.flushCellUpdates(), CELL_BATCH_DELAY_MS);
+      }
+    });
+  },
+
+  /**
+   * Envoie immédiatement les modifications en attente
+   */
+  async flushCellUpdates() {
+    const edits = pendingEdits;
+    const resolvers = pendingResolvers;
+    pendingEdits = [];
+    pendingResolvers = [];
+    flushTimer = null;
+    if (edits.length === 0) return;
+
+    try {
+      const result = await this.updateCells(edits);
+      resolvers.forEach(({ resolve }) => resolve(result));
+    } catch (error) {
+      resolvers.forEach(({ reject }) => reject(error));
+    }
+  },
+
+  /**
+   * Soumet une commande IA en tâche de fond puis attend son résultat
+   * @param {string} command - Commande en langage naturel
+   * @param {number} version - Version détenue par le client (pour recevoir un patch)
+   * @param {number} timeoutMs - Délai maximal d'attente côté client
+   * @returns {Promise<Object>} Résultat du traitement IA
+   */
+  async processAICommandAsync(command, version = undefined, timeoutMs = 60000) {
+    try {
+      const isConnected = await this.checkConnectivity();
+      if (!isConnected) {
+        throw new Error('Pas de connexion internet');
+      }
+
+      if (isMobile()) {
+        await Toast.show({
+          text: 'Traitement de la commande IA...',
+          duration: 'short'
+        });
+      }
+
+      const response = await apiClient.post('/ai-command', {
+        command: command.trim(),
+        version,
+        async: true,
+      });
+      const deadline = Date.now() + timeoutMs;
+      let job = response.data;
+      while (job.status === 'pending' || job.status === 'running') {
+        if (Date.now() > deadline) {
+          throw new Error('Délai dépassé pour la commande IA');
+        }
+        job = await this.getAIJob(response.data.jobId, version, 10);
+      }
+      if (job.status === 'error') {
+        throw new Error(job.error);
+      }
+
+      if (isMobile() && job.success) {
+        await Toast.show({
+          text: 'Commande IA exécutée !',
+          duration: 'short'
+        });
+      }
+
+      return job;
+    } catch (error) {
+      console.error('Erreur commande IA asynchrone mobile:', error);
+
+      if (isMobile()) {
+        await Toast.show({
+          text: `Erreur IA: ${error.message}`,
+          duration: 'long'
+        });
+      }
+
+      throw error;
+    }
+  },
+
+  /**
+   * État d'une commande IA asynchrone
+   * @param {string} jobId - Identifiant renvoyé à la soumission
+   * @param {number} version - Version détenue par le client (pour recevoir un patch)
+   * @param {number} wait - Attente maximale côté serveur, en secondes
+   * @returns {Promise<Object>} { status, ...résultat une fois terminé }
+   */
+  async getAIJob(jobId, version = undefined, wait = 0) {
+    try {
+      const response = await apiClient.get(`/ai-jobs/${jobId}`, {
+        params: { version, wait },
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur suivi commande IA mobile:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Annule la dernière opération (modification, colonne calculée, filtre)
+   * @param {number} version - Version détenue par le client (pour recevoir un patch)
+   * @returns {Promise<Object>} { operation, history, filters, patch | data, version }
+   */
+  async undo(version = undefined) {
+    try {
+      const isConnected = await this.checkConnectivity();
+      if (!isConnected) {
+        throw new Error('Pas de connexion internet');
+      }
+
+      const response = await apiClient.post('/undo', { version });
+
+      if (isMobile() && response.data.success) {
+        await Toast.show({
+          text: 'Opération annulée',
+          duration: 'short'
+        });
+      }
+
+      return response.data;
+    } catch (error) {
+      console.error('Erreur annulation mobile:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Rétablit la dernière opération annulée
+   * @param {number} version - Version détenue par le client (pour recevoir un patch)
+   * @returns {Promise<Object>} { operation, history, filters, patch | data, version }
+   */
+  async redo(version = undefined) {
+    try {
+      const isConnected = await this.checkConnectivity();
+      if (!isConnected) {
+        throw new Error('Pas de connexion internet');
+      }
+
+      const response = await apiClient.post('/redo', { version });
+
+      if (isMobile() && response.data.success) {
+        await Toast.show({
+          text: 'Opération rétablie',
+          duration: 'short'
+        });
+      }
+
+      return response.data;
+    } catch (error) {
+      console.error('Erreur rétablissement mobile:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Statistiques des colonnes visibles (effectif, vides, somme, min, max, moyenne, distinctes)
+   * @param {string[]} columns - Colonnes à décrire (toutes par défaut)
+   * @returns {Promise<Object>} { profile: { colonne: {...} }, filtered, version }
+   */
+  async getProfile(columns = undefined) {
+    try {
+      const isConnected = await this.checkConnectivity();
+      if (!isConnected) {
+        throw new Error('Pas de connexion internet');
+      }
+
+      const response = await apiClient.get('/profile', {
+        params: columns ? { columns: columns.join(',') } : {},
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Erreur profil des colonnes mobile:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Liste les filtres actifs et l'état de l'historique
+   * @returns {Promise<Object>} { filters: [{ description, rows }], history: { undo, redo } }
+   */
+  async getFilters() {
+    try {
+      const isConnected = await this.checkConnectivity();
+      if (!isConnected) {
+        throw new Error('Pas de connexion internet');
+      }
+
+      const response = await apiClient.get('/filters');
+
+      return response.data;
+    } catch (error) {
+      console.error('Erreur récupération filtres mobile:', error);
+      throw error;
+    }
+  },
+
+  /**
+   * Retire tous les filtres (les données d'origine n'ont jamais été supprimées)
+   * @param {number} version - Version détenue par le client (pour recevoir un patch)
+   * @returns {Promise<Object>} { patch | data, version }
+   */
+  async clearFilters(version = undefined) {
+    try {
+      const isConnected = await this.checkConnectivity();
+      if (!isConnected) {
+        throw new Error('Pas de connexion internet');
+      }
+
+      const response = await apiClient.post('/filters/clear', { version });
+
+      if (isMobile() && response.data.success) {
+        await Toast.show({
+          text: 'Filtres retirés',
+          duration: 'short'
+        });
+      }
+
+      return response.data;
+    } catch (error) {
+      console.error('Erreur retrait filtres mobile:', error);
+      throw error;
+    }
+  },
+
   /**
    * Traite une commande IA
+   * @param {number} version - Version des données détenue (pour recevoir un patch)
    */
-  async processAICommand(command) {
+  async processAICommand(command, version = undefined) {
     try {
       const isConnected = await this.checkConnectivity();
       if (!isConnected) {
@@ -280,6 +649,7 @@ export const mobileApiService = {
 
       const response = await apiClient.post('/ai-command', {
         command: command.trim(),
+        version,
       });
 
       if (isMobile() && response.data.success) {
@@ -306,8 +676,9 @@ export const mobileApiService = {
 
   /**
    * Exporte le fichier Excel (adapté pour mobile)
+   * @param {string} format - 'xlsx', 'csv' ou 'parquet' (déduit de l'extension par défaut)
    */
-  async exportFile(filename = 'export.xlsx') {
+  async exportFile(filename = 'export.xlsx', format = undefined) {
     try {
       const isConnected = await this.checkConnectivity();
       if (!isConnected) {
@@ -322,7 +693,7 @@ export const mobileApiService = {
       }
 
       const response = await apiClient.post('/export', 
-        { filename },
+        { filename, format },
         {
           responseType: 'blob',
         }
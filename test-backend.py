@@ -6,6 +6,26 @@ Script de test pour vérifier que le backend SMART-EXCEL fonctionne correctement
 
 import sys
 import os
+import shutil
+import tempfile
+
+# Dossiers de travail de l'application (uploads, exports, sessions, caches, tâches)
+APP_FOLDERS = ('UPLOAD_FOLDER', 'EXPORT_FOLDER', 'SESSION_FOLDER', 'SHARED_SESSION_FOLDER',
+               'FILE_JOB_FOLDER', 'AI_CACHE_FOLDER', 'AI_JOB_FOLDER')
+
+def use_temporary_folders():
+    """Redirige les dossiers de travail de l'application vers un dossier temporaire
+
+    À appeler avant le premier import de app: les tests n'écrivent rien dans
+    backend/. Renvoie le dossier temporaire, à supprimer après les tests.
+    """
+    backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+    sys.path.insert(0, backend_dir)
+    from config import Config
+    work_dir = tempfile.mkdtemp(prefix='smart-excel-tests-')
+    for name in APP_FOLDERS:
+        setattr(Config, name, os.path.join(work_dir, getattr(Config, name)))
+    return work_dir
 
 def test_imports():
     """Test des imports nécessaires"""
@@ -71,7 +91,7 @@ def test_backend_startup():
         
         # Importer l'application
         sys.path.insert(0, '.')
-        from app import app, excel_processor, ai_processor
+        from app import app, session_store
         print("✅ Application Flask importée avec succès")
         
         # Test de configuration
@@ -79,8 +99,10 @@ def test_backend_startup():
             print("✅ Configuration Flask OK")
         
         # Test des processeurs
-        if excel_processor and ai_processor:
+        session = session_store.get('test-backend')
+        if session.processor and session.ai_processor:
             print("✅ Processeurs Excel et IA initialisés")
+        session_store.drop('test-backend')
         
         return True
         
@@ -88,6 +110,509 @@ def test_backend_startup():
         print(f"❌ Erreur lors du démarrage: {e}")
         return False
 
+def test_command_plans():
+    """Test du moteur de plans de commande (filtre, agrégat par groupe, colonne calculée)"""
+    print("\n🧮 Test des plans de commande...")
+    
+    try:
+        import pandas as pd
+        from app import ExcelProcessor
+        from command_plan import PlanExecutor, PlanError
+        
+        processor = ExcelProcessor()
+        processor.df = pd.DataFrame({
+            'Région': ['Nord', 'Sud', 'Nord', 'Sud'],
+            'Prix HT': [10.0, 20.0, 30.0, 40.0],
+            'Quantité': [1, 2, 3, 4]
+        })
+        executor = PlanExecutor(processor)
+        
+        result = executor.execute({'steps': [
+            {'op': 'filter', 'conditions': [{'column': 'Quantité', 'filterType': 'number',
+                                             'type': 'greaterThan', 'filter': 1}]},
+            {'op': 'aggregate', 'function': 'sum', 'column': 'Prix HT', 'groupBy': ['Région']}
+        ]})
+        if result['result'] != [{'Région': 'Nord', 'sum': 30.0}, {'Région': 'Sud', 'sum': 60.0}]:
+            print(f"❌ Agrégat par groupe inattendu: {result['result']}")
+            return False
+        print("✅ Filtre + agrégat par groupe")
+        
+        executor.execute({'steps': [{'op': 'compute', 'column': 'TTC', 'expression': '[Prix HT] * 1.2'}]})
+        if [round(value, 6) for value in processor.df['TTC']] != [24.0, 36.0, 48.0]:
+            print("❌ Colonne calculée incorrecte")
+            return False
+        print("✅ Colonne calculée")
+        
+        processor.undo()
+        processor.undo()
+        if 'TTC' in processor.df.columns or len(processor.df) != 4:
+            print("❌ Annulation incomplète")
+            return False
+        print("✅ Annulation du filtre et de la colonne")
+        
+        try:
+            executor.execute({'steps': [{'op': 'compute', 'column': 'X', 'expression': '__import__("os")'}]})
+            print("❌ Expression non autorisée acceptée")
+            return False
+        except PlanError:
+            print("✅ Expression non autorisée refusée")
+
+        from intent_router import IntentRouter
+        router = IntentRouter()
+        columns = ['Région', 'Prix', 'Quantité']
+        simple = router.route("filtre les lignes où le prix est supérieur à 100", columns)
+        if not simple['local'] or simple['action']['condition']['filter'] != 100:
+            print(f"❌ Filtre simple non traité localement: {simple}")
+            return False
+        for command in ("filtre les lignes où le prix est supérieur à 100 et la quantité < 3",
+                        "somme des prix sauf pour le nord"):
+            decision = router.route(command, columns)
+            if decision['local'] or decision['confidence'] != 0:
+                print(f"❌ Condition composée traitée localement: {command} -> {decision}")
+                return False
+        print("✅ Conditions composées laissées au modèle")
+
+        from app import AICommandProcessor
+        ai_processor = AICommandProcessor(router=router)
+        ai_processor.set_processor(processor)
+        history = processor.history()
+        for command in ("annule la commande 12 du client X", "filtre les commandes annulées"):
+            if ai_processor._handle_history_command(command) is not None or processor.history() != history:
+                print(f"❌ Commande prise pour une annulation: {command}")
+                return False
+        result = ai_processor._handle_history_command("Rétablir la dernière opération")
+        if not result or not result['success'] or processor.history() != {'undo': history['undo'] + 1,
+                                                                          'redo': history['redo'] - 1}:
+            print(f"❌ Commande d'historique non reconnue: {result}")
+            return False
+        print("✅ Annuler/rétablir reconnus seulement pour une commande d'historique entière")
+
+        return True
+
+    except Exception as e:
+        print(f"❌ Erreur plans de commande: {e}")
+        return False
+
+def test_exports():
+    """Test des exports Parquet et CSV (relecture, colonne aux types mêlés, colonne vide en début)"""
+    print("\n📤 Test des exports...")
+    
+    try:
+        import io
+        import numpy as np
+        import pandas as pd
+        from app import app, session_store
+        from exporters import EXPORT_CHUNK_ROWS, write_parquet
+        
+        headers = {'X-Session-Id': 'test-exports'}
+        client = app.test_client()
+        frame = pd.DataFrame({'Produit': ['a', 'b', 'c'], 'Qte': [1, 2, 3], 'Prix': [1.5, 2.5, 3.5]})
+        client.post('/api/upload', headers=headers, content_type='multipart/form-data',
+                    data={'file': (io.BytesIO(frame.to_csv(index=False).encode('utf-8')), 'exports.csv')})
+        # Texte saisi dans une colonne numérique: colonne object aux types mêlés
+        client.post('/api/update-cell', headers=headers, json={'rowId': 1, 'column': 'Qte', 'value': 'abc'})
+        
+        response = client.post('/api/export', headers=headers, json={'format': 'parquet'})
+        if response.status_code != 200:
+            print(f"❌ Export Parquet refusé: {response.get_json()}")
+            return False
+        exported = pd.read_parquet(io.BytesIO(response.data))
+        if [str(value) for value in exported['Qte']] != ['1', 'abc', '3'] or list(exported['Prix']) != [1.5, 2.5, 3.5]:
+            print(f"❌ Relecture Parquet incorrecte: {exported.to_dict('list')}")
+            return False
+        print("✅ Export Parquet d'une colonne aux types mêlés")
+        
+        response = client.post('/api/export', headers=headers, json={'format': 'csv'})
+        exported = pd.read_csv(io.BytesIO(response.data), dtype=str)
+        if response.status_code != 200 or list(exported['Qte']) != ['1', 'abc', '3'] \
+                or list(exported['Produit']) != ['a', 'b', 'c']:
+            print(f"❌ Relecture CSV incorrecte: {response.status_code}")
+            return False
+        print("✅ Export CSV relu à l'identique")
+
+        response = client.post('/api/export', headers=headers, json={'format': 'xlsx'})
+        exported = pd.read_excel(io.BytesIO(response.data)) if response.status_code == 200 else None
+        if exported is None or [str(value) for value in exported['Qte']] != ['1', 'abc', '3'] \
+                or list(exported['Prix']) != [1.5, 2.5, 3.5]:
+            print(f"❌ Relecture xlsx incorrecte: {response.status_code}")
+            return False
+        print("✅ Export xlsx relu à l'identique")
+
+        # Export asynchrone: écrit dans un fil du worker, téléchargé ensuite même après une modification
+        job_id = client.post('/api/export', headers=headers, json={'format': 'parquet', 'async': True}).get_json()['jobId']
+        status = client.get(f'/api/jobs/{job_id}?wait=20', headers=headers).get_json()
+        client.post('/api/update-cell', headers=headers, json={'rowId': 0, 'column': 'Prix', 'value': 9})
+        client.post('/api/export', headers=headers, json={'format': 'parquet'})
+        response = client.get(f'/api/jobs/{job_id}/result', headers=headers)
+        if status['status'] != 'done' or response.status_code != 200 \
+                or list(pd.read_parquet(io.BytesIO(response.data))['Prix']) != [1.5, 2.5, 3.5]:
+            print(f"❌ Export asynchrone incorrect: {status} / {response.status_code}")
+            return False
+        print("✅ Export asynchrone téléchargé après une nouvelle version")
+
+        # Instantanés par copie superficielle (flux NDJSON, export asynchrone): figés malgré update_cell
+        processor = session_store.get('test-exports').processor
+        records = processor.stream_records()
+        snapshot = processor.df.copy(deep=False)
+        before = list(snapshot['Prix'])
+        client.post('/api/update-cell', headers=headers, json={'rowId': 2, 'column': 'Prix', 'value': 99})
+        streamed = [row['Prix'] for record in records if record['type'] == 'rows' for row in record['data']]
+        if list(snapshot['Prix']) != before or streamed != before or list(processor.df['Prix'])[2] != 99:
+            print(f"❌ Instantané modifié par update_cell: {list(snapshot['Prix'])} / {streamed}")
+            return False
+        print("✅ Instantanés inchangés après update_cell")
+        session_store.drop('test-exports')
+        
+        # Colonne vide sur tout le premier bloc écrit, remplie ensuite
+        rows = EXPORT_CHUNK_ROWS + 10
+        late = pd.Series([None] * rows, dtype=object)
+        late.iloc[-10:] = 'tardif'
+        numbers = pd.Series([None] * rows, dtype=object)
+        numbers.iloc[-10:] = 2.5
+        frame = pd.DataFrame({'Ligne': np.arange(rows), 'Texte': late, 'Nombre': numbers})
+        buffer = io.BytesIO()
+        write_parquet(frame, buffer)
+        exported = pd.read_parquet(io.BytesIO(buffer.getvalue()))
+        if exported['Texte'].iloc[-1] != 'tardif' or exported['Nombre'].iloc[-1] != 2.5 \
+                or exported['Texte'].iloc[0] is not None and not pd.isna(exported['Texte'].iloc[0]):
+            print(f"❌ Colonne vide en début mal exportée: {exported.tail(2).to_dict('list')}")
+            return False
+        print("✅ Export Parquet d'une colonne vide dans le premier bloc")
+
+        # Ancienne version encore à télécharger et export en cours d'écriture: conservés
+        import tempfile
+        import time
+        from exporters import OUTDATED_GRACE_SECONDS, ExportCache
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ExportCache(folder)
+            previous = cache.export(frame.head(3), 'jeu', 1, 'csv')
+            writing = os.path.join(folder, 'jeu_2.csv.1234abcd.part')
+            open(writing, 'w').close()
+            cache.export(frame.head(4), 'jeu', 3, 'csv')
+            if not (os.path.exists(previous) and os.path.exists(writing)):
+                print("❌ Export précédent ou en cours supprimé par une nouvelle version")
+                return False
+            old = time.time() - OUTDATED_GRACE_SECONDS - 60
+            os.utime(previous, (old, old))
+            cache.export(frame.head(5), 'jeu', 4, 'csv')
+            if os.path.exists(previous) or not os.path.exists(writing):
+                print("❌ Ancienne version non purgée après le délai de grâce")
+                return False
+        print("✅ Anciennes versions purgées après le délai de grâce, fichiers .part intacts")
+
+        return True
+        
+    except Exception as e:
+        print(f"❌ Erreur exports: {e}")
+        return False
+
+def test_preview():
+    """Test de l'aperçu rapide (colonnes choisies par nom ou par lettres, xlsx et CSV)"""
+    print("\n👀 Test de l'aperçu...")
+    
+    try:
+        import io
+        import pandas as pd
+        from app import app, session_store
+        
+        headers = {'X-Session-Id': 'test-apercu'}
+        client = app.test_client()
+        frame = pd.DataFrame({'Produit': ['a', 'b', 'c'], 'Qte': [1, 2, 3], 'Prix': [1.5, 2.5, 3.5]})
+        workbook = io.BytesIO()
+        frame.to_excel(workbook, index=False)
+        
+        def preview_columns(query):
+            response = client.get(f'/api/preview?{query}', headers=headers)
+            if response.status_code != 200:
+                return response.get_json()
+            return [column['field'] for column in response.get_json()['data']['columns'] if column['field'] != 'id']
+        
+        for name, content in (('apercu.xlsx', workbook.getvalue()), ('apercu.csv', frame.to_csv(index=False).encode('utf-8'))):
+            client.post('/api/upload', headers=headers, content_type='multipart/form-data',
+                        data={'file': (io.BytesIO(content), name)})
+            for query, expected in (('usecols=Prix', ['Prix']), ('usecols=Produit,Prix', ['Produit', 'Prix'])):
+                columns = preview_columns(query)
+                if columns != expected:
+                    print(f"❌ Aperçu {name} avec {query}: {columns}")
+                    return False
+        if preview_columns('letters=B:C') == ['Qte', 'Prix']:
+            print("❌ letters accepté sur un CSV")
+            return False
+        client.post('/api/upload', headers=headers, content_type='multipart/form-data',
+                    data={'file': (io.BytesIO(workbook.getvalue()), 'apercu.xlsx')})
+        if preview_columns('letters=B:C') != ['Qte', 'Prix']:
+            print(f"❌ Aperçu par lettres de colonnes: {preview_columns('letters=B:C')}")
+            return False
+        session_store.drop('test-apercu')
+        print("✅ Aperçu par noms de colonnes (xlsx et CSV) et par lettres (xlsx)")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Erreur aperçu: {e}")
+        return False
+
+def test_formulas():
+    """Test du recalcul incrémental des formules (recopie, dépendances, annulation, export)"""
+    print("\n🧾 Test des formules...")
+    
+    try:
+        import io
+        import tempfile
+        import openpyxl
+        from app import ExcelProcessor
+        
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(['Prix', 'Quantité', 'Total', 'Cumul'])
+        for row in range(2, 6):
+            sheet.append([row * 10, 1, f'=A{row}*B{row}', f'=C{row}' if row == 2 else f'=D{row - 1}+C{row}'])
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'formules.xlsx')
+            workbook.save(path)
+            processor = ExcelProcessor()
+            if not processor.load_file(path, 'xlsx'):
+                print("❌ Chargement du classeur impossible")
+                return False
+        if list(processor.df['Cumul']) != [20, 50, 90, 140]:
+            print(f"❌ Formules non calculées au chargement: {list(processor.df['Cumul'])}")
+            return False
+        print("✅ Formules calculées au chargement")
+        
+        processor.update_cells([{'rowId': 1, 'column': 'Quantité', 'value': 3}])
+        if list(processor.df['Total']) != [20, 90, 40, 50] or list(processor.df['Cumul']) != [20, 110, 150, 200]:
+            print(f"❌ Recalcul incorrect: {processor.df.to_dict('list')}")
+            return False
+        print("✅ Cellules dépendantes recalculées")
+        
+        processor.undo()
+        if list(processor.df['Cumul']) != [20, 50, 90, 140]:
+            print("❌ Annulation incomplète")
+            return False
+        print("✅ Annulation du recalcul")
+        
+        workbook = openpyxl.load_workbook(processor.export('xlsx'))
+        if workbook.active['D3'].value != '=D2+C3':
+            print(f"❌ Formule absente de l'export: {workbook.active['D3'].value}")
+            return False
+        print("✅ Formules conservées à l'export")
+        
+        # Ligne de total dans la colonne des formules (plage relative hors des lignes hôtes)
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(['Prix', 'Quantité', 'Total', 'Libellé'])
+        for row in range(2, 6):
+            sheet.append([row * 10, 1, f'=A{row}*B{row}', None])
+        sheet.append([None, None, '=SUM(C2:C5)', 'Total'])
+        sheet.append([None, None, '=IF(C6>100,AVERAGE(C2:C5),0)', 'Moyenne'])
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'totaux.xlsx')
+            workbook.save(path)
+            processor = ExcelProcessor()
+            if not processor.load_file(path, 'xlsx'):
+                print("❌ Chargement du classeur de totaux impossible")
+                return False
+        if list(processor.df['Total'])[4:] != [140, 35]:
+            print(f"❌ Totaux non calculés au chargement: {list(processor.df['Total'])}")
+            return False
+        processor.update_cells([{'rowId': 1, 'column': 'Quantité', 'value': 3}])
+        if list(processor.df['Total'])[4:] != [200, 50]:
+            print(f"❌ Totaux non recalculés: {list(processor.df['Total'])}")
+            return False
+        print("✅ Ligne de total de la même colonne recalculée")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Erreur formules: {e}")
+        return False
+
+def test_joins():
+    """Test des jointures avec un fichier de référence (en mémoire et bloc par bloc, annulation)"""
+    print("\n🔗 Test des jointures...")
+    
+    try:
+        import tempfile
+        import pandas as pd
+        from app import ExcelProcessor
+        from chunked_dataset import ChunkedDataset, convert_csv
+        from dataset_join import ReferenceDataset
+        from command_plan import PlanExecutor
+        
+        processor = ExcelProcessor()
+        processor.df = pd.DataFrame({'Référence': ['A1', ' b2', 'C3', 'a1'], 'Prix': [0, 0, 0, 0]})
+        tarifs = pd.DataFrame({'Réf': ['a1', 'B2', 'A1'], 'Prix': [10, 20, 99]})
+        processor._references['tarifs'] = ReferenceDataset('tarifs', tarifs, 'tarifs.xlsx')
+        result = PlanExecutor(processor).execute({'steps': [
+            {'op': 'join', 'reference': 'tarifs', 'on': 'Référence', 'rightOn': 'Réf', 'columns': ['Prix']}
+        ]})
+        values = processor.df['Prix (tarifs)'].tolist()
+        if values[:2] + values[3:] != [10, 20, 10] or not pd.isna(values[2]) or result['result']['duplicates'] != 1:
+            print(f"❌ Jointure en mémoire incorrecte: {values}")
+            return False
+        print("✅ Jointure en mémoire (clés sans casse, première correspondance)")
+        
+        with tempfile.TemporaryDirectory() as folder:
+            tarifs.to_csv(os.path.join(folder, 'tarifs.csv'), index=False)
+            convert_csv(os.path.join(folder, 'tarifs.csv'), os.path.join(folder, 'tarifs.parquet'), 1)
+            processor._references['gros'] = ReferenceDataset('gros', ChunkedDataset(os.path.join(folder, 'tarifs.parquet')))
+            processor.join_reference('gros', 'Référence', 'Réf', ['Prix'])
+        if processor.df['Prix (gros)'].tolist()[:2] != [10, 20]:
+            print(f"❌ Jointure bloc par bloc incorrecte: {processor.df['Prix (gros)'].tolist()}")
+            return False
+        print("✅ Jointure bloc par bloc")
+        
+        processor.undo()
+        processor.undo()
+        if list(processor.df.columns) != ['Référence', 'Prix']:
+            print("❌ Annulation des jointures incomplète")
+            return False
+        print("✅ Annulation des jointures")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Erreur jointures: {e}")
+        return False
+
+def test_concurrent_access():
+    """Test de charge: lectures parallèles pendant des écritures, sans lecture incohérente"""
+    print("\n🔀 Test des accès concurrents...")
+    
+    try:
+        import io
+        import threading
+        import numpy as np
+        import pandas as pd
+        from app import app, session_store
+        
+        # Invariant: b == -a sur chaque ligne, chaque écriture modifie a et b ensemble
+        headers = {'X-Session-Id': 'test-concurrence'}
+        n_rows, n_writers, n_batches = 2000, 4, 40
+        frame = pd.DataFrame({'a': np.arange(n_rows), 'b': -np.arange(n_rows)})
+        client = app.test_client()
+        response = client.post('/api/upload', headers=headers, content_type='multipart/form-data',
+                               data={'file': (io.BytesIO(frame.to_csv(index=False).encode('utf-8')), 'concurrence.csv')})
+        start_version = response.get_json()['data']['version']
+        
+        errors = []
+        writers_done = threading.Event()
+        
+        def writer(seed):
+            rng = np.random.default_rng(seed)
+            client = app.test_client()
+            for _ in range(n_batches):
+                value = int(rng.integers(1, 1_000_000))
+                edits = [{'rowId': int(row), 'column': column, 'value': cell}
+                         for row in rng.choice(n_rows, 50, replace=False)
+                         for column, cell in (('a', value), ('b', -value))]
+                response = client.post('/api/update-cells', json={'edits': edits}, headers=headers)
+                if response.status_code != 200:
+                    errors.append(f"écriture refusée: {response.get_json()}")
+        
+        def reader():
+            client = app.test_client()
+            while not writers_done.is_set():
+                columns = client.get('/api/data?layout=columns', headers=headers).get_json()['data']['columns']
+                if (np.asarray(columns['a']) != -np.asarray(columns['b'])).any():
+                    errors.append("lecture incohérente de /api/data (a != -b)")
+                profile = client.get('/api/profile?columns=a,b', headers=headers).get_json()['profile']
+                if profile['a']['sum'] != -profile['b']['sum']:
+                    errors.append("statistiques incohérentes (somme de a != -somme de b)")
+        
+        readers = [threading.Thread(target=reader) for _ in range(4)]
+        writers = [threading.Thread(target=writer, args=(seed,)) for seed in range(n_writers)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        writers_done.set()
+        for thread in readers:
+            thread.join()
+        
+        version = client.get('/api/data', headers=headers).get_json()['data']['version']
+        session_store.drop('test-concurrence')
+        if errors:
+            print(f"❌ {len(errors)} anomalies, dont: {errors[0]}")
+            return False
+        if version != start_version + n_writers * n_batches:
+            print(f"❌ Écritures perdues: version {version}, attendue {start_version + n_writers * n_batches}")
+            return False
+        print(f"✅ {n_writers * n_batches} écritures et lectures parallèles sans lecture incohérente")
+
+        # /api/status lit l'état du processeur: il attend la fin d'une écriture en cours
+        session = session_store.get('test-concurrence')
+        statuses = []
+        with session.lock.write():
+            status_thread = threading.Thread(
+                target=lambda: statuses.append(app.test_client().get('/api/status', headers=headers).status_code))
+            status_thread.start()
+            status_thread.join(0.3)
+            blocked = status_thread.is_alive()
+        status_thread.join()
+        session_store.drop('test-concurrence')
+        if not blocked or statuses != [200]:
+            print(f"❌ /api/status lu pendant une écriture (statut {statuses})")
+            return False
+        print("✅ /api/status lu sous le verrou de la session")
+
+        # Sessions partagées entre deux workers: l'historique est publié en journal (opérations écrites une fois)
+        import glob
+        from app import ExcelProcessor
+        from session_store import WorkbookSession
+        from shared_sessions import SharedSessions
+        shared = SharedSessions(tempfile.mkdtemp())
+        worker_a = WorkbookSession('partage', ExcelProcessor(), None)
+        worker_b = WorkbookSession('partage', ExcelProcessor(), None)
+        
+        def operation_files():
+            return {path: os.stat(path).st_mtime_ns for path in glob.glob(os.path.join(shared.folder, '*', 'op-*.pkl'))}
+        
+        with shared.access(worker_a, exclusive=True):
+            worker_a.processor.df = pd.DataFrame({'x': [3, 1, 2]})
+            for value in (10, 20, 30):
+                worker_a.processor.update_cells([{'rowId': 0, 'column': 'x', 'value': value}])
+        published = operation_files()
+        with shared.access(worker_a, exclusive=True):
+            worker_a.processor.update_cells([{'rowId': 1, 'column': 'x', 'value': 5}])
+        latest = operation_files()
+        if len(latest) != len(published) + 1 or any(latest[path] != mtime for path, mtime in published.items()):
+            print(f"❌ Historique republié en entier: {len(published)} puis {len(latest)} opérations")
+            return False
+        with shared.access(worker_b, exclusive=True):
+            worker_b.processor.undo()
+            worker_b.processor.sort_rows([{'colId': 'x', 'sort': 'asc'}])
+        with shared.access(worker_a):
+            if worker_a.processor.history() != {'undo': 4, 'redo': 0} or list(worker_a.processor.df['x']) != [1, 2, 30]:
+                print(f"❌ Session partagée mal synchronisée: {worker_a.processor.history()}")
+                return False
+        with shared.access(worker_a, exclusive=True):
+            worker_a.processor.undo()
+            worker_a.processor.undo()
+        with shared.access(worker_b):
+            if list(worker_b.processor.df['x']) != [20, 1, 2]:
+                print(f"❌ Annulation sur un autre worker incorrecte: {list(worker_b.processor.df['x'])}")
+                return False
+        print("✅ Historique des sessions partagées publié par opération")
+
+        # Tâche IA soumise à un worker, suivie depuis un autre (dossier d'état commun)
+        from ai_jobs import JobQueue
+        folder = tempfile.mkdtemp()
+        submitting, polling = JobQueue(folder=folder), JobQueue(folder=folder)
+        job_id = submitting.submit('worker-a', lambda: {'success': True, 'result': np.float64(2.5)})
+        job = polling.get(job_id, owner='worker-a')
+        if job is None or not polling.wait(job, 5) or job['result'] != {'success': True, 'result': 2.5}:
+            print(f"❌ Tâche IA introuvable ou incomplète depuis un autre worker: {job}")
+            return False
+        if polling.get(job_id, owner='worker-b') is not None:
+            print("❌ Tâche IA visible d'une autre session")
+            return False
+        print("✅ Tâche IA suivie depuis un autre worker")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Erreur accès concurrents: {e}")
+        return False
+
 def test_file_structure():
     """Test de la structure des fichiers"""
     print("\n📁 Test de la structure des fichiers...")
@@ -124,17 +649,27 @@ def main():
         ("Structure des fichiers", test_file_structure),
         ("Imports Python", test_imports),
         ("Démarrage backend", test_backend_startup),
+        ("Plans de commande", test_command_plans),
+        ("Exports", test_exports),
+        ("Aperçu", test_preview),
+        ("Formules", test_formulas),
+        ("Jointures", test_joins),
+        ("Accès concurrents", test_concurrent_access),
     ]
     
+    work_dir = use_temporary_folders()
     results = []
-    for test_name, test_func in tests:
-        print(f"\n{'=' * 20} {test_name} {'=' * 20}")
-        try:
-            result = test_func()
-            results.append((test_name, result))
-        except Exception as e:
-            print(f"❌ Erreur inattendue dans {test_name}: {e}")
-            results.append((test_name, False))
+    try:
+        for test_name, test_func in tests:
+            print(f"\n{'=' * 20} {test_name} {'=' * 20}")
+            try:
+                result = test_func()
+                results.append((test_name, result))
+            except Exception as e:
+                print(f"❌ Erreur inattendue dans {test_name}: {e}")
+                results.append((test_name, False))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
     
     # Résumé
     print("\n" + "=" * 50)